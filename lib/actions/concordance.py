@@ -18,9 +18,12 @@ import os
 import sys
 import re
 import json
+import datetime
 from collections import defaultdict
 import time
 from typing import Dict, Any, List, Union
+import werkzeug.http
+import werkzeug.wsgi
 
 from controller.kontext import LinesGroups, Kontext
 from controller import exposed
@@ -53,6 +56,7 @@ import mailing
 import attr
 from conclib.freq import one_level_crit, multi_level_crit
 from strings import re_escape
+import byteranges
 
 
 class ConcError(UserActionException):
@@ -68,6 +72,7 @@ class Actions(Querying):
     CONC_QUICK_SAVE_MAX_LINES = 10000
     FREQ_QUICK_SAVE_MAX_LINES = 10000
     COLLS_QUICK_SAVE_MAX_LINES = 10000
+    CONC_EXPORT_CHUNK_SIZE = 1000
 
     """
     This class specifies all the actions KonText offers to a user via HTTP
@@ -1054,13 +1059,23 @@ class Actions(Querying):
         args.q = self.args.q
         args.ctminfreq = int(request.args.get('ctminfreq', '1'))
         args.ctminfreq_type = request.args.get('ctminfreq_type')
+        args.ctsort = request.args.get('ctsort')
+        args.cttopk = int(request.args.get('cttopk', '0'))
+        args.cttopk_by = request.args.get('cttopk_by', 'row')
+        args.ctoffset = int(request.args.get('ctoffset', '0'))
+        args.ctmaxitems = int(request.args['ctmaxitems']) if request.args.get('ctmaxitems') else None
         args.fcrit = '{0} {1} {2} {3}'.format(self.args.ctattr1, self.args.ctfcrit1,
                                               self.args.ctattr2, self.args.ctfcrit2)
         try:
             freq_data = freq_calc.calculate_freqs_ct(args)
+            if freq_data['total'] > len(freq_data['data']) and args.ctmaxitems is None:
+                self.add_system_message('warning', translate(
+                    'The table is too large - only {0} most frequent of {1} cells are shown. '
+                    'Please consider increasing the minimum frequency.').format(
+                        len(freq_data['data']), freq_data['total']))
         except UserActionException as ex:
-            freq_data = dict(data=[], full_size=0)
-            self.add_system_message('error', str(e))
+            freq_data = dict(data=[], full_size=0, total=0, max_items=0)
+            self.add_system_message('error', str(ex))
 
         self._add_save_menu_item('XLSX', save_format='xlsx')
 
@@ -1309,10 +1324,9 @@ class Actions(Querying):
             kwic_args.rightctx = self.args.rightctx
             kwic_args.structs = self._get_struct_opts()
 
-            data = kwic.kwicpage(kwic_args)
-
             def mkfilename(suffix): return '%s-concordance.%s' % (self.args.corpname, suffix)
             if saveformat == 'text':
+                data = kwic.kwicpage(kwic_args)
                 self._headers['Content-Type'] = 'text/plain'
                 self._headers['Content-Disposition'] = 'attachment; filename="%s"' % (
                     mkfilename('txt'),)
@@ -1331,54 +1345,70 @@ class Actions(Querying):
                 self._headers['Content-Type'] = writer.content_type()
                 self._headers['Content-Disposition'] = 'attachment; filename="%s"' % (
                     mkfilename(saveformat),)
-
-                if len(data['Lines']) > 0:
-                    if 'Left' in data['Lines'][0]:
-                        left_key = 'Left'
-                        kwic_key = 'Kwic'
-                        right_key = 'Right'
-                    elif 'Sen_Left' in data['Lines'][0]:
-                        left_key = 'Sen_Left'
-                        kwic_key = 'Kwic'
-                        right_key = 'Sen_Right'
-                    else:
-                        raise ConcError(translate('Invalid data'))
-
-                    aligned_corpora = [self.corp] + \
-                                      [self.cm.get_Corpus(c) for c in self.args.align if c]
-                    writer.set_corpnames([c.get_conf('NAME') or c.get_conffile()
-                                          for c in aligned_corpora])
-
-                    if heading:
-                        writer.writeheading({
-                            'corpus': self._human_readable_corpname(),
-                            'subcorpus': self.args.usesubcorp,
-                            'concordance_size': data['concsize'],
-                            'arf': data['result_arf'],
-                            'query': ['%s: %s (%s)' % (x['op'], x['arg'], x['size'])
-                                      for x in self.concdesc_json().get('Desc', [])]
-                        })
-
-                        doc_struct = self.corp.get_conf('DOCSTRUCTURE')
-                        refs_args = [x.strip('=') for x in self.args.refs.split(',')]
-                        used_refs = ([('#', translate('Token number')), (doc_struct, translate('Document number'))] +
-                                     [(x, x) for x in self.corp.get_conf('STRUCTATTRLIST').split(',')])
-                        used_refs = [x[1] for x in used_refs if x[0] in refs_args]
-                        writer.write_ref_headings([''] + used_refs if numbering else used_refs)
-
-                    for i in range(len(data['Lines'])):
-                        line = data['Lines'][i]
-                        if numbering:
-                            row_num = str(i + from_line)
-                        else:
-                            row_num = None
-
-                        lang_rows = process_lang(line, left_key, kwic_key, right_key,
-                                                 add_linegroup=self._lines_groups.is_defined())
-                        if 'Align' in line:
-                            lang_rows += process_lang(line['Align'], left_key, kwic_key, right_key,
-                                                      add_linegroup=False)
-                        writer.writerow(row_num, *lang_rows)
+                add_linegroup = self._lines_groups.is_defined()
+                # the heading must be prepared here as the content may be generated
+                # after the action is finished (streaming)
+                heading_data = None
+                if heading:
+                    doc_struct = self.corp.get_conf('DOCSTRUCTURE')
+                    refs_args = [x.strip('=') for x in self.args.refs.split(',')]
+                    used_refs = ([('#', translate('Token number')), (doc_struct, translate('Document number'))] +
+                                 [(x, x) for x in self.corp.get_conf('STRUCTATTRLIST').split(',')])
+                    used_refs = [x[1] for x in used_refs if x[0] in refs_args]
+                    heading_data = ({
+                        'corpus': self._human_readable_corpname(),
+                        'subcorpus': self.args.usesubcorp,
+                        'concordance_size': conc.size(),
+                        'arf': kwic.get_result_arf(),
+                        'query': ['%s: %s (%s)' % (x['op'], x['arg'], x['size'])
+                                  for x in self.concdesc_json().get('Desc', [])]
+                    }, [''] + used_refs if numbering else used_refs)
+                aligned_corpora = [self.corp] + kwic_args.alignlist
+
+                def write_lines():
+                    """
+                    Write concordance lines (fetched in chunks) to the writer. After each
+                    chunk, the function yields to allow the caller fetching the content.
+                    """
+                    left_key = kwic_key = right_key = None
+                    line_idx = 0
+                    for lines in kwic.kwicpage_chunks(kwic_args, self.CONC_EXPORT_CHUNK_SIZE):
+                        if left_key is None and len(lines) > 0:
+                            if 'Left' in lines[0]:
+                                left_key, kwic_key, right_key = 'Left', 'Kwic', 'Right'
+                            elif 'Sen_Left' in lines[0]:
+                                left_key, kwic_key, right_key = 'Sen_Left', 'Kwic', 'Sen_Right'
+                            else:
+                                raise ConcError(translate('Invalid data'))
+                            writer.set_corpnames([c.get_conf('NAME') or c.get_conffile()
+                                                  for c in aligned_corpora])
+                            if heading_data:
+                                writer.writeheading(heading_data[0])
+                                writer.write_ref_headings(heading_data[1])
+                        for line in lines:
+                            row_num = str(line_idx + from_line) if numbering else None
+                            lang_rows = process_lang(line, left_key, kwic_key, right_key,
+                                                     add_linegroup=add_linegroup)
+                            if 'Align' in line:
+                                lang_rows += process_lang(line['Align'], left_key, kwic_key, right_key,
+                                                          add_linegroup=False)
+                            writer.writerow(row_num, *lang_rows)
+                            line_idx += 1
+                        yield
+
+                if writer.enable_streaming():
+                    def stream_content():
+                        try:
+                            for _ in write_lines():
+                                yield writer.pop_content()
+                            yield from writer.close_content()
+                        except Exception as ex:
+                            # the response has been already started so we can only log the error
+                            logging.getLogger(__name__).error(f'Failed to export concordance: {ex}')
+                            raise ex
+                    return stream_content
+                for _ in write_lines():
+                    pass
                 output = writer.raw_content()
             else:
                 raise UserActionException(translate('Unknown export data type'))
@@ -1400,21 +1430,57 @@ class Actions(Querying):
         rpath = os.path.realpath(os.path.join(settings.get(
             'corpora', 'speech_files_path'), self.args.corpname, chunk))
         basepath = os.path.realpath(settings.get('corpora', 'speech_files_path'))
-        if os.path.isfile(rpath) and rpath.startswith(basepath):
-            with open(rpath, 'r') as f:
-                file_size = os.path.getsize(rpath)
-                self._headers['Content-Type'] = 'audio/mpeg'
-                self._headers['Content-Length'] = '%s' % file_size
-                self._headers['Accept-Ranges'] = 'none'
-                if self.environ.get('HTTP_RANGE', None):
-                    self._headers['Content-Range'] = 'bytes 0-%s/%s' % (
-                        os.path.getsize(rpath) - 1, os.path.getsize(rpath))
-                ans = f.read()
-                return lambda: ans
-        else:
+        if not os.path.isfile(rpath) or not rpath.startswith(basepath):
             self.set_not_found()
             return lambda: None
 
+        content_type = 'audio/mpeg'
+        sendfile_header = settings.get('corpora', 'speech_files_sendfile_header', None)
+        if sendfile_header:
+            # a front proxy (e.g. Nginx via X-Accel-Redirect) serves the file including ranges
+            self._headers['Content-Type'] = content_type
+            self._headers[sendfile_header] = os.path.join(
+                settings.get('corpora', 'speech_files_sendfile_prefix', basepath), os.path.relpath(rpath, basepath))
+            return lambda: b''
+
+        stat = os.stat(rpath)
+        file_size = stat.st_size
+        etag = '{0:x}-{1:x}'.format(stat.st_mtime_ns, file_size)
+        last_modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc)
+        self._headers['Content-Type'] = content_type
+        self._headers['Accept-Ranges'] = 'bytes'
+        self._headers['ETag'] = werkzeug.http.quote_etag(etag)
+        self._headers['Last-Modified'] = werkzeug.http.http_date(last_modified)
+        if not werkzeug.http.is_resource_modified(self.environ, etag=etag, last_modified=last_modified):
+            self._status = 304
+            return lambda: b''
+
+        ranges = None
+        if_range = self.environ.get('HTTP_IF_RANGE', None)
+        if not if_range or if_range.strip() in (self._headers['ETag'], self._headers['Last-Modified']):
+            try:
+                ranges = byteranges.parse_byte_ranges(self.environ.get('HTTP_RANGE', None), file_size)
+            except byteranges.RangeNotSatisfiable:
+                self._status = 416
+                self._headers['Content-Range'] = 'bytes */{0}'.format(file_size)
+                return lambda: b''
+
+        if ranges is None:
+            self._headers['Content-Length'] = str(file_size)
+            # wsgi.file_wrapper allows the server to use sendfile()
+            return lambda: werkzeug.wsgi.wrap_file(self.environ, open(rpath, 'rb'))
+        self._status = 206
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            self._headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, stop - 1, file_size)
+            self._headers['Content-Length'] = str(stop - start)
+            return lambda: byteranges.iter_file_range(rpath, start, stop)
+        boundary = byteranges.mk_multipart_boundary()
+        self._headers['Content-Type'] = 'multipart/byteranges; boundary={0}'.format(boundary)
+        self._headers['Content-Length'] = str(byteranges.multipart_byteranges_size(
+            ranges, file_size, content_type, boundary))
+        return lambda: byteranges.iter_multipart_byteranges(rpath, ranges, file_size, content_type, boundary)
+
     def _collect_conc_next_url_params(self, query_id):
         params = {
             'corpname': self.args.corpname,
@@ -13,7 +13,6 @@
 import os
 import logging
 import json
-import time
 import hashlib
 from typing import List, Dict, Any, Union
 
@@ -179,12 +178,15 @@ class Subcorpus(Querying):
             if result and publish_path:
                 corplib.mk_publish_links(path, publish_path, self.session_get(
                     'user', 'fullname'), data.description)
+            elif result:
+                corplib.update_subc_catalogue(path)
         elif len(tt_query) > 1 or within_cql or data.has_aligned_corpora():
             app = bgcalc.calc_backend_client(settings)
             res = app.send_task('create_subcorpus',
                                 (self.session_get('user', 'id'), self.args.corpname, path, publish_path,
                                  tt_query, imp_cql, self.session_get('user', 'fullname'), data.description),
-                                time_limit=TASK_TIME_LIMIT)
+                                time_limit=TASK_TIME_LIMIT,
+                                queue=bgcalc.corpus_task_queue(settings, self.args.corpname))
             self._store_async_task(AsyncTaskStatus(status=res.status, ident=res.id,
                                                    category=AsyncTaskStatus.CATEGORY_SUBCORPUS,
                                                    label=f'{basecorpname}:{data.subcname}',
@@ -276,6 +278,10 @@ class Subcorpus(Querying):
                 os.unlink(spath)
             except IOError as e:
                 logging.getLogger(__name__).warning(e)
+        for path in (spath, orig_spath):
+            if path:
+                corplib.invalidate_subcorpus(path)
+                corplib.update_subc_catalogue(path)
         return {}
 
     @exposed(access_level=1, skip_corpus_init=True, page_model='subcorpList')
@@ -293,26 +299,21 @@ class Subcorpus(Querying):
         user_corpora = list(plugins.runtime.AUTH.instance.permitted_corpora(
             self.session_get('user')).keys())
         related_corpora = set()
-        for corp in user_corpora:
-            for item in self.user_subc_names(corp):
-                try:
-                    sc = self.cm.get_Corpus(corp, subcname=item['n'], decode_desc=False)
-                    data.append({
-                        'name': '%s / %s' % (corp, item['n']),
-                        'size': sc.search_size(),
-                        'created': time.mktime(sc.created.timetuple()),
-                        'corpname': corp,
-                        'human_corpname': sc.get_conf('NAME'),
-                        'usesubcorp': sc.subcname,
-                        'orig_subcname': sc.orig_subcname,
-                        'deleted': False,
-                        'description': sc.description,
-                        'published': corplib.subcorpus_is_published(sc.spath)
-                    })
-                    related_corpora.add(corp)
-                except RuntimeError as e:
-                    logging.getLogger(__name__).warn(
-                        'Failed to fetch information about subcorpus {0}:{1}: {2}'.format(corp, item['n'], e))
+        if not self.user_is_anonymous():
+            for item in corplib.get_subc_catalogue(self.subcpath[0]).list_subcorpora(user_corpora):
+                data.append({
+                    'name': '%s / %s' % (item['corpname'], item['subcname']),
+                    'size': item['size'],
+                    'created': item['created'],
+                    'corpname': item['corpname'],
+                    'human_corpname': item['human_corpname'],
+                    'usesubcorp': item['subcname'],
+                    'orig_subcname': item['orig_subcname'],
+                    'deleted': False,
+                    'description': item['description'],
+                    'published': item['published']
+                })
+                related_corpora.add(item['corpname'])
 
         if filter_args['corpname']:
             data = [item for item in data if not filter_args['corpname']
@@ -362,7 +363,7 @@ class Subcorpus(Querying):
             origSubCorpusName=sc.orig_subcname if sc.is_published else subcname,
             corpusSize=sc.size(),
             subCorpusSize=sc.search_size(),
-            created=time.mktime(sc.created.timetuple()),
+            created=sc.created.timestamp(),
             description=sc.description,
             extended_info={}
         )
@@ -21,10 +21,11 @@ import hashlib
 import corplib
 from actions.concordance import Actions as ConcActions
 from controller import exposed
+from controller.kontext import AsyncTaskStatus
 from main_menu import MainMenu
 from translation import ugettext as translate
 from controller.errors import UserActionException
-from bgcalc import freq_calc
+from bgcalc import freq_calc, wordlist_calc
 import plugins
 import settings
 
@@ -39,6 +40,9 @@ class Wordlist(ConcActions):
 
     WORDLIST_QUICK_SAVE_MAX_LINES = 10000
 
+    # if True then word list actions wait for a background calculation to finish
+    _wait_for_wordlist = False
+
     def get_mapping_url_prefix(self):
         return '/wordlist/'
 
@@ -48,10 +52,22 @@ class Wordlist(ConcActions):
             wlnums = self._wlnums2structattr(self.args.wlnums)
         else:
             wlnums = self.args.wlnums
-        return dict(size=corplib.get_wordlist_length(corp=self.corp, wlattr=self.args.wlattr, wlpat=self.args.wlpat,
-                                                     wlnums=wlnums, wlminfreq=self.args.wlminfreq,
-                                                     words=self.args.wlwords, blacklist=self.args.blacklist,
-                                                     include_nonwords=self.args.include_nonwords))
+        wl_args = self._mk_wordlist_calc_args(
+            wlnums=wlnums, whitelist=[w for w in re.split(r'\s+', self.args.wlwords.strip()) if w],
+            blacklist=[w for w in re.split(r'\s+', self.args.blacklist.strip()) if w])
+        try:
+            # the list is calculated by a worker; here we just wait for it
+            max_wait = None if self._wait_for_wordlist else wordlist_calc.TASK_TIME_LIMIT
+            return dict(size=wordlist_calc.get_wordlist_size(self.corp, wl_args, max_wait=max_wait))
+        except wordlist_calc.WordlistCalcInProgress:
+            raise WordlistError(translate('The word list is still being calculated. Please try again later.'))
+
+    def _mk_wordlist_calc_args(self, wlnums, whitelist, blacklist):
+        return wordlist_calc.WordlistCalcArgs(
+            corpname=self.corp.corpname, subcname=getattr(self.corp, 'subcname', None), subcpath=self.subcpath,
+            wlattr=self.args.wlattr, wlpat=self.args.wlpat, wlminfreq=self.args.wlminfreq, wlnums=wlnums,
+            wlsort=self.args.wlsort, include_nonwords=self.args.include_nonwords, whitelist=whitelist,
+            blacklist=blacklist)
 
     def _wlnums2structattr(self, wlnums):
         if wlnums == 'arf':
@@ -109,10 +125,6 @@ class Wordlist(ConcActions):
             orig_wlnums = self.args.wlnums
             self.args.wlnums = self._wlnums2structattr(self.args.wlnums)
 
-        if paginate:
-            wlmaxitems = self.args.wlpagesize * self.args.wlpage + 1
-        else:
-            wlmaxitems = sys.maxsize
         wlstart = (self.args.wlpage - 1) * self.args.wlpagesize
         result = {
             'reload_args': list({
@@ -156,19 +168,12 @@ class Wordlist(ConcActions):
                 'wlhash': wlhash, 'blhash': blhash
             }.items())
 
-            result_list = corplib.wordlist(corp=self.corp, words=whitelist, wlattr=self.args.wlattr,
-                                           wlpat=self.args.wlpat, wlminfreq=self.args.wlminfreq,
-                                           wlmaxitems=wlmaxitems, wlsort=self.args.wlsort, blacklist=blacklist,
-                                           wlnums=self.args.wlnums,
-                                           include_nonwords=self.args.include_nonwords)[wlstart:]
-            result['Items'] = result_list
-            if len(result_list) < self.args.wlpagesize + 1:
-                result['lastpage'] = 1
-            else:
-                result['lastpage'] = 0
-                if paginate:
-                    result_list = result_list[:-1]
+            wl_args = self._mk_wordlist_calc_args(wlnums=self.args.wlnums, whitelist=whitelist, blacklist=blacklist)
+            result_list, lastpage = wordlist_calc.get_wordlist_page(
+                self.corp, wl_args, offset=wlstart, limit=self.args.wlpagesize if paginate else None,
+                max_wait=None if self._wait_for_wordlist else wordlist_calc.SYNC_WAIT_TIME)
             result['Items'] = result_list
+            result['lastpage'] = 1 if lastpage else 0
 
             if '.' in self.args.wlattr:
                 self.args.wlnums = orig_wlnums
@@ -204,23 +209,33 @@ class Wordlist(ConcActions):
             return result
 
         except corplib.MissingSubCorpFreqFile as e:
-            result.update({'attrname': self.args.cattr, 'tasks': []})
             out = freq_calc.build_arf_db(e.corpus, self.args.wlattr)
             if type(out) is list:
-                processing = 0
-                result['tasks'].extend(out)
+                return self._mk_processing_result(result, processing=0, tasks=out)
             elif out:
-                processing = out
+                return self._mk_processing_result(result, processing=out, tasks=[])
             else:
-                processing = 0
-            result['quick_save_row_limit'] = self.WORDLIST_QUICK_SAVE_MAX_LINES
-            result['wlattr'] = self.args.wlattr
-            result['wlattr_label'] = ''
-            result['processing'] = processing
-            result['SubcorpList'] = []
-            result['freq_figure'] = ''
-            result['lastpage'] = None
-            return result
+                return self._mk_processing_result(result, processing=0, tasks=[])
+
+        except wordlist_calc.WordlistCalcInProgress as e:
+            if '.' in self.args.wlattr:
+                self.args.wlnums = orig_wlnums
+            self._store_async_task(AsyncTaskStatus(
+                status=e.task_status, ident=e.task_id, category=AsyncTaskStatus.CATEGORY_WORDLIST,
+                label=f'{self.args.corpname}: {self.args.wlattr} {self.args.wlpat}',
+                args=dict(corpname=self.args.corpname, progress_key=e.progress_key)))
+            return self._mk_processing_result(result, processing=0, tasks=[e.task_id])
+
+    def _mk_processing_result(self, result, processing, tasks):
+        result.update({'attrname': self.args.cattr, 'tasks': tasks})
+        result['quick_save_row_limit'] = self.WORDLIST_QUICK_SAVE_MAX_LINES
+        result['wlattr'] = self.args.wlattr
+        result['wlattr_label'] = ''
+        result['processing'] = processing
+        result['SubcorpList'] = []
+        result['freq_figure'] = ''
+        result['lastpage'] = None
+        return result
 
     @exposed(template='freqs.html', page_model='freq', http_method='POST', mutates_conc=True)
     def struct_result(self, _):
@@ -256,6 +271,7 @@ class Wordlist(ConcActions):
         from_line = int(from_line)
         to_line = int(to_line) if to_line else sys.maxsize
         self.args.wlpage = 1
+        self._wait_for_wordlist = True  # an export cannot be finished later
         ans = self.result(wlpat=self.args.wlpat, paginate=False)
         ans['Items'] = ans['Items'][:(to_line - from_line + 1)]
         saved_filename = self.args.corpname
@@ -307,4 +323,8 @@ class Wordlist(ConcActions):
                 tr = app.AsyncResult(t)
                 if tr.status == 'FAILURE':
                     raise bgcalc.ExternalTaskError('Task %s failed' % (t,))
+        wl_tasks = [t for t in self.get_async_tasks(category=AsyncTaskStatus.CATEGORY_WORDLIST)
+                    if t.ident in (worker_tasks or ())]
+        if len(wl_tasks) > 0:
+            return {'status': wordlist_calc.get_progress(wl_tasks[0].args['progress_key'])['progress']}
         return {'status': freq_calc.build_arf_db_status(self.corp, attrname)}
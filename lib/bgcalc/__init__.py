@@ -14,6 +14,7 @@
 
 
 from importlib.machinery import SourceFileLoader
+import zlib
 
 
 _backend_app = None
@@ -27,6 +28,14 @@ class ExternalTaskError(Exception):
     pass
 
 
+class TaskTimeoutError(Exception):
+    """
+    Raised by a calc. backend client in case a task result
+    is not available within a specified time.
+    """
+    pass
+
+
 class UnfinishedConcordanceError(Exception):
     """
     This error is used whenever a concordance
@@ -71,6 +80,10 @@ def _init_backend_app(conf, fn_prefix):
                 'calc_backend', 'konserver_http_connection_timeout')
             kconf.RESULT_WAIT_MAX_TIME = conf.get_int(
                 'calc_backend', 'konserver_result_wait_max_time')
+            kconf.RESULT_LONG_POLL_WAIT = conf.get_int(
+                'calc_backend', 'konserver_result_long_poll_wait', 0)
+            kconf.HTTP_POOL_SIZE = conf.get_int('calc_backend', 'konserver_http_pool_size', 10)
+            kconf.HTTP_POOL_MAX_IDLE_TIME = conf.get_int('calc_backend', 'konserver_http_pool_max_idle_time', 30)
         return KonserverApp(conf=kconf, fn_prefix=fn_prefix)
     elif app_type == 'rq':
         from bgcalc.rq import RqClient, RqConfig
@@ -98,3 +111,18 @@ def calc_backend_client(conf):
 
 def calc_backend_server(conf, fn_prefix):
     return _calc_backend_app(conf, fn_prefix)
+
+
+def corpus_task_queue(conf, corpname):
+    """
+    Return a name of a worker queue a task working with the corpus 'corpname'
+    should be sent to. In case the corpus affinity routing is enabled
+    (calc_backend.corpus_affinity_queues = N), tasks for the same corpus
+    always end up in the same queue (one of 'corpus_0', ..., 'corpus_[N-1]')
+    so workers consuming the queue keep the corpus open. Otherwise None
+    (= a default queue) is returned.
+    """
+    num_queues = conf.get_int('calc_backend', 'corpus_affinity_queues', 0)
+    if num_queues <= 0 or not corpname:
+        return None
+    return 'corpus_{0}'.format(zlib.crc32(corpname.encode('utf-8')) % num_queues)
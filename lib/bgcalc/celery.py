@@ -39,3 +39,12 @@ def is_celery_user_error(err):
 
     """
     return is_celery_error(err) and err.__class__.__name__ == 'UserActionException'
+
+
+def is_celery_timeout_error(err):
+    """
+    Tests whether a provided exception is Celery's timeout of a result waiting
+    (celery.exceptions.TimeoutError).
+    """
+    return (isinstance(err, Exception) and err.__class__.__module__ == 'celery.exceptions' and
+            err.__class__.__name__ == 'TimeoutError')
@@ -12,17 +12,12 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
 
-import pickle
-import hashlib
-import os
-import time
-
 import corplib
 from conclib.search import get_conc
 from bgcalc import freq_calc
 import settings
 from structures import FixedDict
-from bgcalc import UnfinishedConcordanceError
+from bgcalc import UnfinishedConcordanceError, result_cache
 from translation import ugettext as _
 import bgcalc
 
@@ -53,13 +48,18 @@ class CollCalcArgs(FixedDict):
     ctow = None
     cminbgr = None
     cminfreq = None
-    cache_path = None
+    cache_key = None
     num_fetch_items = None
 
 
 class CollCalcCache(object):
 
-    MANATEE_DEFAULT_NUM_FETCH_LINES = 50
+    # number of pages fetched in advance when calculating collocations for the first time
+    NUM_PREFETCH_PAGES = 10
+
+    # a cached incomplete ranking too short for a requested page is replaced by
+    # one at least FETCH_GROWTH_RATIO times longer
+    FETCH_GROWTH_RATIO = 2
 
     def __init__(self, corpname, subcname, subcpath, user_id, q, save=0, samplesize=0):
         self._corpname = corpname
@@ -70,26 +70,21 @@ class CollCalcCache(object):
         self._save = save
         self._samplesize = samplesize
 
-    def _cache_file_path(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
-        v = f'{self._corpname}{self._subcname}{self._user_id}{"".join(self._q)}{cattr}{csortfn}{cbgrfns}{cfromw}{ctow}{cminbgr}{cminbgr}{cminfreq}'
-        filename = f'{hashlib.sha1(v.encode("utf-8")).hexdigest()}.pkl'
-        return os.path.join(settings.get('corpora', 'colls_cache_dir'), filename)
+    def _cache_key(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
+        return result_cache.mk_cache_key(
+            self._corpname, self._subcname, self._user_id, ''.join(self._q), cattr, csortfn, cbgrfns, cfromw,
+            ctow, cminbgr, cminbgr, cminfreq)
 
     def get(self, cattr, csortfn, cbgrfns, cfromw, ctow, cminbgr, cminfreq):
         """
         Get value from cache.
 
         returns:
-        a 2-tuple (cached_data, cache_path)  where cached_data is None in case of cache miss
+        a 2-tuple (cached_data, cache_key) where cached_data is None in case of cache miss
         """
-        cache_path = self._cache_file_path(cattr=cattr, csortfn=csortfn, cbgrfns=cbgrfns, cfromw=cfromw, ctow=ctow,
-                                           cminbgr=cminbgr, cminfreq=cminfreq)
-        if os.path.isfile(cache_path):
-            with open(cache_path, 'rb') as f:
-                collocs = pickle.load(f)
-        else:
-            collocs = None
-        return collocs, cache_path
+        cache_key = self._cache_key(cattr=cattr, csortfn=csortfn, cbgrfns=cbgrfns, cfromw=cfromw, ctow=ctow,
+                                    cminbgr=cminbgr, cminfreq=cminfreq)
+        return result_cache.get_result_cache().get(result_cache.RES_TYPE_COLL, cache_key), cache_key
 
 
 def calculate_colls_bg(coll_args):
@@ -124,7 +119,7 @@ def calculate_colls_bg(coll_args):
         else:
             processing = 0
         ans['processing'] = processing
-        ans['data'] = dict(Items=[], Head=[])
+        ans['data'] = dict(Items=[], Head=[], Complete=True)
         return ans
 
 
@@ -149,54 +144,42 @@ def calculate_colls(coll_args):
     cache = CollCalcCache(corpname=coll_args.corpname, subcname=coll_args.subcname, subcpath=coll_args.subcpath,
                           user_id=coll_args.user_id, q=coll_args.q, save=coll_args.save,
                           samplesize=coll_args.samplesize)
-    collocs, cache_path = cache.get(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
+    collocs, cache_key = cache.get(cattr=coll_args.cattr, csortfn=coll_args.csortfn, cbgrfns=coll_args.cbgrfns,
                                     cfromw=coll_args.cfromw, ctow=coll_args.ctow, cminbgr=coll_args.cminbgr,
                                     cminfreq=coll_args.cminfreq)
+    # Cached data contain a prefix of the ranked list of collocations ('Complete' tells whether
+    # it is the whole list). Any page within the prefix is served from cache.
+    num_required = collend - 1
     if collocs is None:
-        num_fetch_items = CollCalcCache.MANATEE_DEFAULT_NUM_FETCH_LINES
-    else:
-        num_fetch_items = len(collocs['Items'])
-
-    if collocs is None or collend > num_fetch_items:
-        if os.path.isfile(cache_path):  # cache avail. but not enough items
-            os.unlink(cache_path)
-        if collend >= num_fetch_items:
-            num_fetch_items += (collend - num_fetch_items) + 10 * \
-                int(coll_args.citemsperpage)  # TODO heuristics :)
+        num_fetch_items = num_required + CollCalcCache.NUM_PREFETCH_PAGES * int(coll_args.citemsperpage)
+    elif not collocs.get('Complete', False) and len(collocs['Items']) < num_required:
+        # the new (longer) list replaces the current cache entry
+        num_fetch_items = max(num_required, CollCalcCache.FETCH_GROWTH_RATIO * len(collocs['Items']))
+        collocs = None
 
-        coll_args.cache_path = cache_path
+    if collocs is None:
+        coll_args.cache_key = cache_key
         coll_args.num_fetch_items = num_fetch_items
         app = bgcalc.calc_backend_client(settings)
         res = app.send_task('calculate_colls', args=(coll_args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        # worker task caches the value AFTER the result is returned (see worker.py)
+                            time_limit=TASK_TIME_LIMIT,
+                            queue=bgcalc.corpus_task_queue(settings, coll_args.corpname))
+        # the worker task stores the result to the result cache (see worker/general.py)
         ans = res.get()
     else:
         ans = dict(data=collocs, processing=0)
+    num_items = len(ans['data']['Items'])
     result = dict(
         Head=ans['data']['Head'],
         attrname=coll_args.cattr,
         processing=ans['processing'],
         collstart=collstart,
-        lastpage=0 if collstart + coll_args.citemsperpage < len(ans['data']['Items']) else 1,
+        lastpage=1 if ans['data'].get('Complete', False) and collstart + coll_args.citemsperpage >= num_items else 0,
         Items=ans['data']['Items'][collstart:collend - 1]
     )
     return result
 
 
 def clean_colls_cache():
-    root_dir = settings.get('corpora', 'colls_cache_dir')
     cache_ttl = settings.get_int('corpora', 'colls_cache_ttl', 3600)
-    test_time = time.time()
-    all_files = os.listdir(root_dir)
-    num_removed = 0
-    num_error = 0
-    for item in all_files:
-        file_path = os.path.join(root_dir, item)
-        if test_time - os.path.getmtime(file_path) >= cache_ttl:
-            try:
-                os.unlink(file_path)
-                num_removed += 1
-            except OSError:
-                num_error += 1
-    return dict(total_files=len(all_files), num_removed=num_removed, num_error=num_error)
+    return result_cache.get_result_cache().cleanup(result_cache.RES_TYPE_COLL, cache_ttl)
@@ -19,18 +19,18 @@ import re
 from datetime import datetime
 import time
 import math
-import hashlib
 import logging
-import pickle
+from typing import Optional
 from structures import FixedDict
 
 import manatee
 import corplib
 from conclib.search import get_conc
+from conclib.pyconc import FreqDistribution
 import settings
 import plugins
 import bgcalc
-from bgcalc import UnfinishedConcordanceError
+from bgcalc import UnfinishedConcordanceError, result_cache
 from bgcalc.celery import is_celery_user_error
 from translation import ugettext as _
 from controller.errors import UserActionException
@@ -39,6 +39,9 @@ MAX_LOG_FILE_AGE = 1800  # in seconds
 
 TASK_TIME_LIMIT = settings.get_int('calc_backend', 'task_time_limit', 300)
 
+# a max. number of contingency table cells returned in case no window is requested
+CT_DEFAULT_MAX_ITEMS = settings.get_int('corpora', 'ct_max_items', 10000)
+
 
 class FreqCalsArgs(FixedDict):
     """
@@ -65,8 +68,10 @@ class FreqCalsArgs(FixedDict):
     rel_mode = None
     fmaxitems = None  # default ??
     line_offset = None  # ??
-    cache_path = None
+    cache_keys = None  # a list of cache keys (one for each item in 'fcrit')
     force_cache = False
+    item_offset = 0  # the first returned item of each distribution
+    max_items = None  # a max. number of returned items of each distribution (None = all)
 
 
 def corp_freqs_cache_path(corp, attrname):
@@ -180,7 +185,8 @@ def build_arf_db(corp, attrname):
         write_log_header(corp, logfilename_m)
         res = app.send_task('compile_{0}'.format(m),
                             (corp.corpname, subc_path, attrname, logfilename_m),
-                            time_limit=TASK_TIME_LIMIT)
+                            time_limit=TASK_TIME_LIMIT,
+                            queue=bgcalc.corpus_task_queue(settings, corp.corpname))
         task_ids.append(res.id)
     return task_ids
 
@@ -206,22 +212,21 @@ class FreqCalcCache(object):
         self._samplesize = samplesize
         self._subcpath = subcpath
 
-    def _cache_file_path(self, fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale):
-        v = (str(self._corpname) + str(self._subcname) + str(self._user_id) +
-             ''.join(self._q) + str(fcrit) + str(flimit) + str(freq_sort) + str(ml) +
-             str(ftt_include_empty) + str(rel_mode) + str(collator_locale))
-        filename = '%s.pkl' % hashlib.sha1(v.encode('utf-8')).hexdigest()
-        return os.path.join(settings.get('corpora', 'freqs_cache_dir'), filename)
+    def _cache_key(self, fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale):
+        return result_cache.mk_cache_key(
+            self._corpname, self._subcname, self._user_id, ''.join(self._q), fcrit, flimit, freq_sort, ml,
+            ftt_include_empty, rel_mode, collator_locale)
 
     def get(self, fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale):
-        cache_path = self._cache_file_path(
+        """
+        Get value for a single criterion (fcrit) from cache.
+
+        returns:
+        a 2-tuple (cached_data, cache_key) where cached_data is None in case of cache miss
+        """
+        cache_key = self._cache_key(
             fcrit, flimit, freq_sort, ml, ftt_include_empty, rel_mode, collator_locale)
-        if os.path.isfile(cache_path):
-            with open(cache_path, 'rb') as f:
-                data = pickle.load(f)
-        else:
-            data = None
-        return data, cache_path
+        return result_cache.get_result_cache().get(result_cache.RES_TYPE_FREQ, cache_key), cache_key
 
 
 def calc_freqs_bg(args: FreqCalsArgs):
@@ -232,7 +237,8 @@ def calc_freqs_bg(args: FreqCalsArgs):
     args -- a FreqCalsArgs instance
 
     returns:
-    a dict(freqs=..., conc_size=...)
+    a dict(freqs=..., conc_size=...) where 'freqs' contains a column-wise distribution
+    (conclib.pyconc.FreqDistribution or None if empty) for each criterion
     """
 
     cm = corplib.CorpusManager(subcpath=args.subcpath)
@@ -242,39 +248,72 @@ def calc_freqs_bg(args: FreqCalsArgs):
     if not conc.finished():
         raise UnfinishedConcordanceError(
             _('Cannot calculate yet - source concordance not finished. Please try again later.'))
-    freqs = [conc.xfreq_dist(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty, args.rel_mode,
-                             args.collator_locale)
+    freqs = [conc.xfreq_dist_columns(cr, args.flimit, args.freq_sort, args.ml, args.ftt_include_empty,
+                                     args.rel_mode, args.collator_locale)
              for cr in args.fcrit]
     return dict(freqs=freqs, conc_size=conc.size())
 
 
+def freq_dist_page(dist: Optional[FreqDistribution], offset: int = 0, max_items: Optional[int] = None):
+    """
+    Create item data (see FreqDistribution.page) for a window of a calculated
+    distribution (an empty dict for an empty distribution)
+    """
+    return dist.page(offset, max_items) if dist is not None else {}
+
+
 def calculate_freqs(args: FreqCalsArgs):
     """
     Calculates a frequency distribution based on a defined concordance and frequency-related arguments.
     The class is able to cache the data in a background process/task. This prevents KonText to calculate
     (via Manatee) full frequency list again and again (e.g. if user moves from page to page).
+
+    Results are cached for each criterion individually (as whole column-wise distributions
+    so item data are created just for the requested page). All the criteria missing in the cache
+    are calculated by a single background task (i.e. with the concordance loaded just once).
     """
+    if len(args.fcrit) == 1:  # a single block => pagination
+        item_offset = (args.fpage - 1) * args.fmaxitems + args.line_offset
+        max_items = args.fmaxitems
+    else:
+        item_offset, max_items = 0, None
     cache = FreqCalcCache(corpname=args.corpname, subcname=args.subcname, user_id=args.user_id, subcpath=args.subcpath,
                           q=args.q, fromp=args.fromp, pagesize=args.pagesize, save=args.save,
                           samplesize=args.samplesize)
-    calc_result, cache_path = cache.get(fcrit=args.fcrit, flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
-                                        ftt_include_empty=args.ftt_include_empty, rel_mode=args.rel_mode,
-                                        collator_locale=args.collator_locale)
-    if calc_result is None:
-        args.cache_path = cache_path
+    blocks = {}
+    conc_size = None
+    missing = []
+    for fcrit in args.fcrit:
+        cached, cache_key = cache.get(fcrit=fcrit, flimit=args.flimit, freq_sort=args.freq_sort, ml=args.ml,
+                                      ftt_include_empty=args.ftt_include_empty, rel_mode=args.rel_mode,
+                                      collator_locale=args.collator_locale)
+        # (records of a previous format are considered missing)
+        if cached is None or not (cached['data'] is None or isinstance(cached['data'], FreqDistribution)):
+            missing.append((fcrit, cache_key))
+        else:
+            blocks[fcrit] = freq_dist_page(cached['data'], item_offset, max_items)
+            conc_size = cached['conc_size']
+    if len(missing) > 0:
+        task_args = FreqCalsArgs(**args.to_dict())
+        task_args.fcrit = [fcrit for fcrit, _ in missing]
+        task_args.cache_keys = [cache_key for _, cache_key in missing]
+        task_args.item_offset = item_offset
+        task_args.max_items = max_items
         app = bgcalc.calc_backend_client(settings)
-        res = app.send_task('calculate_freqs', args=(args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        # worker task caches the value AFTER the result is returned (see worker.py)
+        res = app.send_task('calculate_freqs', args=(task_args.to_dict(),),
+                            time_limit=TASK_TIME_LIMIT,
+                            queue=bgcalc.corpus_task_queue(settings, args.corpname))
+        # worker task caches the values (see worker.py)
         calc_result = res.get()
+        blocks.update(zip(task_args.fcrit, calc_result['freqs']))
+        conc_size = calc_result['conc_size']
 
-    data = calc_result['freqs']
-    conc_size = calc_result['conc_size']
+    data = [blocks[fcrit] for fcrit in args.fcrit]
     lastpage = None
     if len(data) == 1:  # a single block => pagination
-        total_length = len(data[0]['Items']) if 'Items' in data[0] else 0
+        total_length = data[0].get('Total', 0)
         items_per_page = args.fmaxitems
-        fstart = (args.fpage - 1) * args.fmaxitems + args.line_offset
+        fstart = item_offset
         fmaxitems = args.fmaxitems * args.fpage + 1 + args.line_offset
         if total_length < fmaxitems:
             lastpage = 1
@@ -282,7 +321,7 @@ def calculate_freqs(args: FreqCalsArgs):
             lastpage = 0
         ans = [dict(Total=total_length,
                     TotalPages=int(math.ceil(total_length / float(items_per_page))),
-                    Items=data[0]['Items'][fstart:fmaxitems - 1] if 'Items' in data[0] else [],
+                    Items=data[0].get('Items', []),
                     Head=data[0].get('Head', []))]
     else:
         for item in data:
@@ -296,21 +335,14 @@ def calculate_freqs(args: FreqCalsArgs):
 
 
 def clean_freqs_cache():
-    root_dir = settings.get('corpora', 'freqs_cache_dir')
     cache_ttl = settings.get_int('corpora', 'freqs_cache_ttl', 3600)
-    test_time = time.time()
-    all_files = os.listdir(root_dir)
-    num_removed = 0
-    num_error = 0
-    for item in all_files:
-        file_path = os.path.join(root_dir, item)
-        if test_time - os.path.getmtime(file_path) >= cache_ttl:
-            try:
-                os.unlink(file_path)
-                num_removed += 1
-            except OSError:
-                num_error += 1
-    return dict(total_files=len(all_files), num_removed=num_removed, num_error=num_error)
+    cache = result_cache.get_result_cache()
+    ans = cache.cleanup(result_cache.RES_TYPE_FREQ, cache_ttl)
+    for res_type in (result_cache.RES_TYPE_CT, result_cache.RES_TYPE_WORDLIST):
+        ans_t = cache.cleanup(res_type, cache_ttl)
+        for k in ans:
+            ans[k] += ans_t[k]
+    return ans
 
 
 # ------------------ Contingency table freq. distribution --------------
@@ -325,8 +357,13 @@ class CTFreqCalcArgs(FixedDict):
     subcpath = None
     ctminfreq = None
     ctminfreq_type = None
+    ctsort = None
+    cttopk = 0
+    cttopk_by = 'row'
+    ctoffset = 0
+    ctmaxitems = None
     fcrit = None
-    cache_path = None
+    cache_key = None
 
 
 class CTCalculationError(Exception):
@@ -347,9 +384,16 @@ class CTCalculation(object):
         norms2_dict = self._conc.get_attr_values_sizes(sattr)
         return [norms2_dict.get(x[sattr_idx], 0) for x in words]
 
-    def ct_dist(self, crit, limit_type, limit=1):
+    def ct_dist(self, crit):
         """
-        Calculate join distribution (contingency table).
+        Calculate join distribution (contingency table). All the cells are returned
+        (i.e. no frequency limit is applied) so any filtered/sorted view of the table
+        can be derived from the result without recalculation (see CTTable).
+
+        returns:
+        a sparse table encoded as a dict (values1=..., values2=..., rows=..., cols=...,
+        freqs=..., norms=...) where 'values1' and 'values2' contain unique attribute values
+        and the remaining lists describe the cells (rows/cols are indices of values1/values2)
         """
         words = manatee.StrVector()
         freqs = manatee.NumVector()
@@ -363,7 +407,7 @@ class CTCalculation(object):
         for i in range(0, len(crit_lx), 2):
             attrs.append(crit_lx[i])
 
-        if len(attrs) > 2:
+        if len(attrs) != 2:
             raise CTCalculationError(
                 'Exactly two attributes (either positional or structural) can be used')
 
@@ -377,24 +421,12 @@ class CTCalculation(object):
             norms = self._calc_1sattr_norms(words, sattr=attrs[sattr_idx], sattr_idx=sattr_idx)
         else:
             norms = [self._corp.size()] * len(words)
-        mans = list(zip(words, freqs, norms))
-        if limit_type == 'abs':
-            ans = [v for v in mans if v[1] >= limit]
-        elif limit_type == 'ipm':
-            ans = [v for v in mans if v[1] / float(v[2]) * 1e6 >= limit]
-        elif limit_type == 'pabs':
-            values = sorted(mans, key=lambda v: v[1])
-            plimit = int(math.floor(limit / 100. * len(values)))
-            ans = values[plimit:]
-        elif limit_type == 'pipm':
-            values = sorted(mans, key=lambda v: v[1] / float(v[2]) * 1e6)
-            # math.floor(x) == math.ceil(x) - 1 (indexing from 0)
-            plimit = math.floor(limit / 100. * len(values))
-            ans = values[plimit:]
-        if len(ans) > 1000:
-            raise UserActionException(
-                'The result size is too high. Please try to increase the minimum frequency.')
-        return ans, len(mans)
+        values1 = {}
+        values2 = {}
+        rows = [values1.setdefault(w[0], len(values1)) for w in words]
+        cols = [values2.setdefault(w[1], len(values2)) for w in words]
+        return dict(values1=list(values1), values2=list(values2), rows=rows, cols=cols, freqs=list(freqs),
+                    norms=norms)
 
     def run(self):
         """
@@ -404,23 +436,124 @@ class CTCalculation(object):
         self._corp = cm.get_Corpus(self._args.corpname, subcname=self._args.subcname)
         self._conc = get_conc(corp=self._corp, user_id=self._args.user_id, q=self._args.q,
                               fromp=0, pagesize=0, asnc=0, save=0, samplesize=0)
-        result, full_size = self.ct_dist(self._args.fcrit, limit=self._args.ctminfreq,
-                                         limit_type=self._args.ctminfreq_type)
-        return dict(data=[x[0] + x[1:] for x in result], full_size=full_size)
+        return self.ct_dist(self._args.fcrit)
+
+
+class CTTable(object):
+    """
+    A read-only view of a sparse contingency table as produced by CTCalculation.ct_dist().
+    It provides filtered and sorted windows of the table cells.
+    """
+
+    def __init__(self, data):
+        self._values1 = data['values1']
+        self._values2 = data['values2']
+        self._rows = data['rows']
+        self._cols = data['cols']
+        self._freqs = data['freqs']
+        self._norms = data['norms']
+
+    def __len__(self):
+        return len(self._freqs)
+
+    def _ipm(self, i):
+        return self._freqs[i] / float(self._norms[i]) * 1e6 if self._norms[i] else 0
+
+    def _filter(self, limit_type, limit):
+        cells = range(len(self))
+        if limit_type == 'abs':
+            return [i for i in cells if self._freqs[i] >= limit]
+        elif limit_type == 'ipm':
+            return [i for i in cells if self._ipm(i) >= limit]
+        elif limit_type == 'pabs':
+            values = sorted(cells, key=self._freqs.__getitem__)
+            return values[int(math.floor(limit / 100. * len(values))):]
+        elif limit_type == 'pipm':
+            values = sorted(cells, key=self._ipm)
+            # math.floor(x) == math.ceil(x) - 1 (indexing from 0)
+            return values[int(math.floor(limit / 100. * len(values))):]
+        raise CTCalculationError(f'Unknown frequency limit type: {limit_type}')
+
+    def _top_k(self, cells, k, by):
+        dim = self._rows if by == 'row' else self._cols
+        totals = {}
+        for i in cells:
+            totals[dim[i]] = totals.get(dim[i], 0) + self._freqs[i]
+        top = set(sorted(totals, key=totals.__getitem__, reverse=True)[:k])
+        return [i for i in cells if dim[i] in top]
+
+    def select(self, limit_type, limit, sort_by=None, top_k=0, top_k_by='row', offset=0, max_items=None,
+               sort_truncated_by=None):
+        """
+        Select table cells matching a frequency limit.
+
+        arguments:
+        limit_type -- one of 'abs', 'ipm', 'pabs' (percentile of abs. freq.), 'pipm' (percentile of i.p.m.)
+        limit -- a minimum frequency (or a percentile)
+        sort_by -- 'freq', 'ipm' (both descending) or None (Manatee order; ascending by the
+                   respective value in case of a percentile limit)
+        top_k -- if non-zero then only cells of k rows (or columns) with the highest total
+                 frequency (within matching cells) are selected
+        top_k_by -- 'row' or 'col'
+        offset -- an index of the first returned cell
+        max_items -- a max. number of returned cells (None = all the cells)
+        sort_truncated_by -- a sort key used in case 'sort_by' is None and the window does not
+                             contain all the matching cells (i.e. a truncated window then contains
+                             the top cells instead of an arbitrary part of the table)
+
+        returns:
+        a 2-tuple (list of cells [value1, value2, freq, norm], number of all the matching cells)
+        """
+        cells = self._filter(limit_type, limit)
+        if top_k:
+            cells = self._top_k(cells, top_k, top_k_by)
+        if sort_by is None and (offset > 0 or max_items is not None and len(cells) > max_items):
+            sort_by = sort_truncated_by
+        if sort_by == 'freq':
+            cells = sorted(cells, key=self._freqs.__getitem__, reverse=True)
+        elif sort_by == 'ipm':
+            cells = sorted(cells, key=self._ipm, reverse=True)
+        stop = len(cells) if max_items is None else offset + max_items
+        ans = [(self._values1[self._rows[i]], self._values2[self._cols[i]], self._freqs[i], self._norms[i])
+               for i in cells[offset:stop]]
+        return ans, len(cells)
 
 
 def calculate_freqs_ct(args):
     """
     note: this is called by webserver
+
+    The whole table is calculated (and cached) just once for a concordance and criteria.
+    Different frequency limits, sorting and windows are applied to the cached table.
+    In case no window is requested (ctmaxitems), at most CT_DEFAULT_MAX_ITEMS of the most
+    frequent cells are returned.
+
+    returns:
+    a dict(data=..., full_size=..., total=..., max_items=...) where 'total' is the number
+    of all the cells matching the filter (i.e. regardless of the returned window)
     """
+    args.cache_key = result_cache.mk_cache_key(
+        args.corpname, args.subcname, args.user_id, ''.join(args.q), args.fcrit)
+    table_data = result_cache.get_result_cache().get(result_cache.RES_TYPE_CT, args.cache_key)
+    if table_data is None:
+        try:
+            app = bgcalc.calc_backend_client(settings)
+            res = app.send_task('calculate_freqs_ct', args=(args.to_dict(),),
+                                time_limit=TASK_TIME_LIMIT,
+                                queue=bgcalc.corpus_task_queue(settings, args.corpname))
+            # the worker task stores the result to the result cache (see worker/general.py)
+            table_data = res.get()
+        except Exception as ex:
+            if is_celery_user_error(ex):
+                raise UserActionException(str(ex)) from ex
+            else:
+                raise ex
+    table = CTTable(table_data)
+    max_items = args.ctmaxitems if args.ctmaxitems is not None else CT_DEFAULT_MAX_ITEMS
     try:
-        app = bgcalc.calc_backend_client(settings)
-        res = app.send_task('calculate_freqs_ct', args=(args.to_dict(),),
-                            time_limit=TASK_TIME_LIMIT)
-        calc_result = res.get()
-    except Exception as ex:
-        if is_celery_user_error(ex):
-            raise UserActionException(str(ex)) from ex
-        else:
-            raise ex
-    return calc_result
+        data, total = table.select(limit_type=args.ctminfreq_type, limit=args.ctminfreq, sort_by=args.ctsort,
+                                   top_k=args.cttopk, top_k_by=args.cttopk_by, offset=args.ctoffset,
+                                   max_items=max_items, sort_truncated_by='freq')
+    except CTCalculationError as ex:
+        raise UserActionException(str(ex)) from ex
+    return dict(data=data, full_size=len(table), total=total, max_items=max_items)
@@ -27,6 +27,14 @@ PORT = 8083
 PATH = '/kontext/atn'
 HTTP_CONNECTION_TIMEOUT = 5
 RESULT_WAIT_MAX_TIME = 120
+RESULT_LONG_POLL_WAIT = 30
+HTTP_POOL_SIZE = 10
+HTTP_POOL_MAX_IDLE_TIME = 30
+
+In case RESULT_LONG_POLL_WAIT is set, the client asks KonServer
+to hold a result request (GET [PATH]/result/[task_id]?wait=[secs])
+until the task is finished or the time elapses. Otherwise (or in case
+KonServer responds immediately) the client polls task status.
 """
 
 from functools import wraps, partial
@@ -35,8 +43,14 @@ import sys
 import json
 import http.client
 import inspect
+import math
 import time
 import os
+import select
+import threading
+from collections import deque
+
+from bgcalc import TaskTimeoutError
 
 
 def setup_logger(log_path, is_debug, logger):
@@ -59,6 +73,9 @@ class Config(object):
     PATH = None
     HTTP_CONNECTION_TIMEOUT = None
     RESULT_WAIT_MAX_TIME = None
+    RESULT_LONG_POLL_WAIT = None
+    HTTP_POOL_SIZE = None
+    HTTP_POOL_MAX_IDLE_TIME = None
 
 
 class Request(object):
@@ -71,6 +88,174 @@ class Request(object):
         self.id = task_id
 
 
+class PoolTimeoutError(Exception):
+    """
+    Raised in case there is no free connection to KonServer within the connection timeout
+    """
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent (keep-alive) HTTP connections
+    to a single host. The number of connections (both idle and in use)
+    is limited by 'max_size'. Idle connections are health-checked before
+    they are reused and a request which fails on a stale reused connection
+    (e.g. closed by the server meanwhile) is retried once using a fresh one.
+    A request which may have reached the server is retried only in case
+    its method is idempotent (see IDEMPOTENT_METHODS).
+
+    Long polling requests (i.e. ones with 'extra_timeout') may occupy their connections
+    for a long time so they are limited by a separate counter and they never make
+    regular requests (task submission, status checks) wait.
+    """
+
+    # errors signaling that a reused connection has been closed by the other side
+    STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                               ConnectionResetError, BrokenPipeError)
+
+    IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, host, port, timeout=None, max_size=10, max_idle_time=30):
+        """
+        arguments:
+        host -- server host
+        port -- server port
+        timeout -- a socket timeout in seconds
+        max_size -- max. number of connections to the host (plus the same number
+                    of long polling connections)
+        max_idle_time -- idle connections older than this (in seconds) are closed instead of being reused
+        """
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._max_size = max_size
+        self._max_idle_time = max_idle_time
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._long_poll_slots = threading.BoundedSemaphore(max_size)
+        self._pid = os.getpid()
+
+    def _create_connection(self):
+        return http.client.HTTPConnection(self._host, port=self._port, timeout=self._timeout)
+
+    @staticmethod
+    def _is_healthy(connection):
+        """
+        An idle keep-alive connection should not be readable - if it is,
+        the server has either closed it or sent unexpected data.
+        """
+        if connection.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+            return len(readable) == 0
+        except (OSError, ValueError):
+            return False
+
+    def _get_idle(self):
+        with self._lock:
+            if self._pid != os.getpid():  # connections must not be shared with a parent process
+                self._idle.clear()
+                self._pid = os.getpid()
+            while len(self._idle) > 0:
+                connection, last_used = self._idle.pop()
+                if time.time() - last_used <= self._max_idle_time and self._is_healthy(connection):
+                    return connection
+                connection.close()
+        return None
+
+    def _put_idle(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.time()))
+
+    def num_idle(self):
+        with self._lock:
+            return len(self._idle)
+
+    def close(self):
+        """
+        Close all the idle connections
+        """
+        with self._lock:
+            while len(self._idle) > 0:
+                self._idle.pop()[0].close()
+
+    def request(self, method, path, body=None, headers=None, extra_timeout=0):
+        """
+        Send an HTTP request and read the whole response.
+
+        arguments:
+        method -- HTTP method
+        path -- request path (including query)
+        body -- request body
+        headers -- a dict of request headers
+        extra_timeout -- seconds added to the socket timeout (e.g. for long polling requests)
+
+        returns:
+        a 2-tuple (response status, response body)
+        """
+        slots = self._long_poll_slots if extra_timeout else self._slots
+        if not slots.acquire(timeout=self._timeout):
+            raise PoolTimeoutError('No free connection to {0}:{1}'.format(self._host, self._port))
+        try:
+            connection = self._get_idle()
+            reused = connection is not None
+            while True:
+                if connection is None:
+                    connection = self._create_connection()
+                timeout = self._timeout + extra_timeout if self._timeout else None
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                sent = False
+                try:
+                    connection.request(method, path, body, headers or {})
+                    sent = True
+                    response = connection.getresponse()
+                    data = response.read()
+                except self.STALE_CONNECTION_ERRORS:
+                    connection.close()
+                    # once sent, the request may have been processed (e.g. a task
+                    # submitted) even if there is no response
+                    if not reused or sent and method not in self.IDEMPOTENT_METHODS:
+                        raise
+                    connection = None
+                    reused = False
+                    continue
+                except Exception:
+                    connection.close()
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._put_idle(connection)
+                return response.status, data
+        finally:
+            slots.release()
+
+
+_pools = {}
+
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(conf):
+    """
+    Return a process-wide connection pool for the KonServer host
+    specified in the configuration.
+    """
+    key = (conf.SERVER, conf.PORT)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                conf.SERVER, conf.PORT, timeout=conf.HTTP_CONNECTION_TIMEOUT,
+                max_size=getattr(conf, 'HTTP_POOL_SIZE', None) or 10,
+                max_idle_time=getattr(conf, 'HTTP_POOL_MAX_IDLE_TIME', None) or 30)
+        return _pools[key]
+
+
 class APIConnection(object):
     """
     A base class for both KonServer client and server where
@@ -81,34 +266,42 @@ class APIConnection(object):
     def __init__(self, conf):
         self._conf = conf
 
-    def _create_connection(self):
-        return http.client.HTTPConnection(self._conf.SERVER,
-                                          port=self._conf.PORT,
-                                          timeout=self._conf.HTTP_CONNECTION_TIMEOUT)
+    def _request(self, method, path, body=None, extra_timeout=0):
+        headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
+        return get_connection_pool(self._conf).request(method, path, body, headers, extra_timeout=extra_timeout)
+
+    def _get_task(self, task_id, wait=0):
+        """
+        Fetch task status (and result if finished).
+
+        arguments:
+        task_id -- a task identifier
+        wait -- if non-zero then KonServer is asked to respond once the task
+                is finished or after 'wait' seconds (long polling)
 
-    def _get_task(self, task_id):
-        connection = self._create_connection()
-        logging.getLogger(__name__).debug('CONN : {0}'.format(connection))
+        raises:
+        PoolTimeoutError in case there is no free connection to KonServer
+        """
+        path = self._conf.PATH + '/result/' + task_id
+        if wait:
+            path += '?wait={0}'.format(int(math.ceil(wait)))
         logging.getLogger(__name__).debug(
-            'REQ: http://{0}:{1}{2}'.format(self._conf.SERVER, self._conf.PORT, self._conf.PATH + '/result/' + task_id))
+            'REQ: http://{0}:{1}{2}'.format(self._conf.SERVER, self._conf.PORT, path))
         try:
-            headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-            connection.request('GET', self._conf.PATH + '/result/' + task_id, None, headers)
-            response = connection.getresponse()
-            logging.getLogger(__name__).debug('RESP_RESULT: {0}'.format(response))
-            if response and response.status == 200:
-                args = json.loads(response.read().decode('utf-8'))
+            status, data = self._request('GET', path, extra_timeout=wait)
+            logging.getLogger(__name__).debug('RESP_RESULT: {0}'.format(status))
+            if status == 200:
+                args = json.loads(data.decode('utf-8'))
                 logging.getLogger(__name__).debug('RESP_RESULT_E: {0}'.format(args))
                 return args
-            elif response and response.status == 404:
+            elif status == 404:
                 return None
             else:
-                raise Exception('Failed sending API request: %s' % (
-                    'status %s' % response.status if response else 'unknown error'))
+                raise Exception('Failed sending API request: status %s' % status)
+        except PoolTimeoutError:
+            raise
         except Exception as ex:
             logging.getLogger(__name__).error(ex)
-        finally:
-            connection.close()
 
     @property
     def conf(self):
@@ -121,8 +314,9 @@ class ResultException(Exception):
 
 class Result(APIConnection):
 
-    INITIAL_WAIT_STEP = 0.5
-    WAIT_STEP_INCREASE_RATIO = 1.09
+    INITIAL_WAIT_STEP = 0.05
+    WAIT_STEP_INCREASE_RATIO = 1.5
+    MAX_WAIT_STEP = 2.0
 
     STATUS_PENDING = 'PENDING'
     STATUS_STARTED = 'STARTED'
@@ -188,32 +382,44 @@ class Result(APIConnection):
         return 'Result[task_id: {0}, status: {1}, error: {2}, result: {3}]'.format(
             self._task_id, self._status, self._error, self._result)
 
-    def get(self):
+    def get(self, timeout=None):
         """
         Wait for result calculated by KonServer and return it.
+
+        In case long polling is enabled (RESULT_LONG_POLL_WAIT), the client
+        blocks on the result request. Otherwise (or in case KonServer
+        answers a long polling request prematurely) it polls with gradually
+        increasing wait steps.
+
+        arguments:
+        timeout -- max. time in seconds to wait (if None then RESULT_WAIT_MAX_TIME is used)
         """
-        time_limit = self._conf.RESULT_WAIT_MAX_TIME
+        time_limit = timeout if timeout is not None else self._conf.RESULT_WAIT_MAX_TIME
+        long_poll_wait = getattr(self._conf, 'RESULT_LONG_POLL_WAIT', None) or 0
+        deadline = time.time() + time_limit
         wait = Result.INITIAL_WAIT_STEP
-        total_wait = 0
+        task_data = None
         while True:
-            task_data = self._get_task(self._task_id)
+            remaining = deadline - time.time()
+            req_wait = min(long_poll_wait, max(0, remaining))
+            t0 = time.time()
+            task_data = self._get_task(self._task_id, wait=req_wait)
             if task_data is None:
                 raise ResultException('Task not found')
             self._update(task_data)
-            if self._status == 2:
+            if self._status == 2 or time.time() >= deadline:
                 break
-            time.sleep(wait)
-            total_wait += wait
-            if total_wait > time_limit:
-                break
-            wait = wait * Result.WAIT_STEP_INCREASE_RATIO
+            if req_wait and time.time() - t0 >= req_wait:
+                continue  # KonServer held the request as expected - no need to sleep
+            time.sleep(min(wait, max(0, deadline - time.time())))
+            wait = min(wait * Result.WAIT_STEP_INCREASE_RATIO, Result.MAX_WAIT_STEP)
 
         if self._status == 2:
             if self._error:
                 raise Exception(self._error)
             else:
                 return self._result
-        raise Exception('Failed to fetch result from task {0}'.format(self._task_id))
+        raise TaskTimeoutError('Failed to fetch result from task {0}'.format(self._task_id))
 
 
 class Control(object):
@@ -310,28 +516,27 @@ class KonserverApp(APIConnection):
         else:
             return [a for a in args]
 
-    def send_task(self, name, args=None, time_limit=None, soft_time_limit=None):
+    def send_task(self, name, args=None, time_limit=None, soft_time_limit=None, queue=None):
         """
         TODO: support for lime_limit/soft_time_limit
+        Note: KonServer does not support multiple queues so 'queue' is ignored
+
+        raises:
+        PoolTimeoutError in case there is no free connection to KonServer
         """
-        connection = self._create_connection()
         logging.getLogger(__name__).debug(
             'REQ: http://{0}:{1}{2}'.format(self._conf.SERVER, self._conf.PORT, self._conf.PATH + '/task/' + name))
         try:
-            headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
-            enc_args = json.dumps(args)
-            connection.request('POST', self._conf.PATH + '/task/' + name, enc_args, headers)
-            response = connection.getresponse()
-            logging.getLogger(__name__).debug('RESP: {0}'.format(response))
-            if response and response.status == 200:
-                return Result(self._conf, json.loads(response.read().decode('utf-8')))
+            status, data = self._request('POST', self._conf.PATH + '/task/' + name, json.dumps(args))
+            logging.getLogger(__name__).debug('RESP: {0}'.format(status))
+            if status == 200:
+                return Result(self._conf, json.loads(data.decode('utf-8')))
             else:
-                raise Exception('Failed sending task: %s' % (
-                    'status %s' % response.status if response else 'unknown error'))
+                raise Exception('Failed sending task: status %s' % status)
+        except PoolTimeoutError:
+            raise
         except Exception as ex:
             logging.getLogger(__name__).error(ex)
-        finally:
-            connection.close()
 
     def _run_task(self, name, args, task_id):
         fn = self._registered_tasks[name]
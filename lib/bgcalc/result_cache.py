@@ -0,0 +1,432 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A size-bounded cache for results of background calculations (frequency
+distributions, collocations, contingency tables, word lists).
+
+Cached results are stored as pickle files (written atomically) within
+a directory tree sharded by the key prefix:
+
+[root_dir]/[result type]/[key[:2]]/[key].pkl
+
+All the entries are registered in an SQLite index ([root_dir]/index.sqlite)
+which keeps their sizes and access statistics so neither lookups nor
+clean-up/eviction need to scan the directories. Once the total size
+of cached data exceeds the configured budget, least recently
+(policy 'lru') or least frequently (policy 'lfu') used entries are removed.
+Access statistics are written to the index in batches (see ACCESS_FLUSH_INTERVAL)
+so reading from the cache does not require a write lock of the index.
+"""
+
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import settings
+
+RES_TYPE_FREQ = 'freq'
+RES_TYPE_COLL = 'coll'
+RES_TYPE_CT = 'ct'
+RES_TYPE_WORDLIST = 'wordlist'
+
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+# after eviction, the total size should get below max_size * EVICTION_TARGET
+EVICTION_TARGET = 0.9
+
+EVICTION_BATCH_SIZE = 100
+
+# a lock not released within LOCK_TTL seconds (e.g. by a killed process) is considered expired
+LOCK_TTL = 60
+
+LOCK_WAIT_STEP = 0.05
+
+# access statistics (hits, misses, last access times) are accumulated in memory
+# and written to the index at most once per ACCESS_FLUSH_INTERVAL seconds (per process)
+ACCESS_FLUSH_INTERVAL = 30
+
+_local = threading.local()
+
+
+class _AccessLog(object):
+    """
+    Access statistics of a cache not written to the index yet
+    """
+
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        self.entries: Dict[Tuple[str, str], List] = {}  # (res_type, key) => [hits, last access]
+        self.stats: Dict[str, List[int]] = {}  # res_type => [hits, misses]
+
+    def add(self, res_type: str, key: str, hit: bool) -> None:
+        if hit:
+            item = self.entries.setdefault((res_type, key), [0, 0])
+            item[0] += 1
+            item[1] = time.time()
+        self.stats.setdefault(res_type, [0, 0])[0 if hit else 1] += 1
+
+
+_access_logs: Dict[str, _AccessLog] = {}
+
+_access_logs_lock = threading.Lock()
+
+
+def mk_cache_key(*args) -> str:
+    """
+    Create a cache key out of the provided values (their string representations are used)
+    """
+    return hashlib.sha1(''.join(str(a) for a in args).encode('utf-8')).hexdigest()
+
+
+class ResultCacheLockError(Exception):
+    pass
+
+
+class ResultCache(object):
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS entries (res_type text, key text, size integer, created real, '
+        'last_access real, hits integer, PRIMARY KEY (res_type, key))',
+        'CREATE INDEX IF NOT EXISTS entries_last_access_idx ON entries (last_access)',
+        'CREATE INDEX IF NOT EXISTS entries_hits_idx ON entries (hits, last_access)',
+        'CREATE INDEX IF NOT EXISTS entries_created_idx ON entries (res_type, created)',
+        'CREATE TABLE IF NOT EXISTS stats (res_type text PRIMARY KEY, hits integer, misses integer, '
+        'num_items integer, total_size integer)',
+        'CREATE TABLE IF NOT EXISTS locks (key text PRIMARY KEY, expires real)'
+    )
+
+    def __init__(self, root_dir: str, max_size: int = DEFAULT_MAX_SIZE, policy: str = 'lru') -> None:
+        """
+        arguments:
+        root_dir -- a directory where cached data and the index are stored
+        max_size -- a maximum total size of cached data in bytes
+        policy -- an eviction policy ('lru' or 'lfu')
+        """
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f'Unknown result cache eviction policy: {policy}')
+        self._root_dir = root_dir
+        self._max_size = max_size
+        self._policy = policy
+
+    def _conn(self) -> sqlite3.Connection:
+        conns = getattr(_local, 'conns', None)
+        if conns is None or getattr(_local, 'pid', None) != os.getpid():  # we must not share conn. with a parent
+            conns = {}
+            _local.conns = conns
+            _local.pid = os.getpid()
+        if self._root_dir not in conns:
+            os.makedirs(self._root_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self._root_dir, 'index.sqlite'), timeout=30)
+            for sql in self.SCHEMA:
+                conn.execute(sql)
+            conn.commit()
+            conns[self._root_dir] = conn
+        return conns[self._root_dir]
+
+    def _data_path(self, res_type: str, key: str) -> str:
+        return os.path.join(self._root_dir, res_type, key[:2], f'{key}.pkl')
+
+    @staticmethod
+    def _ensure_stats(cursor: sqlite3.Cursor, res_type: str) -> None:
+        cursor.execute('INSERT OR IGNORE INTO stats (res_type, hits, misses, num_items, total_size) '
+                       'VALUES (?, 0, 0, 0, 0)', (res_type,))
+
+    def _unlink(self, res_type: str, key: str) -> bool:
+        try:
+            os.unlink(self._data_path(res_type, key))
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as ex:
+            logging.getLogger(__name__).warning(f'Failed to remove cached result {res_type}/{key}: {ex}')
+            return False
+
+    @staticmethod
+    def _del_entries(cursor: sqlite3.Cursor, entries) -> None:
+        for res_type, key, size in entries:
+            cursor.execute('DELETE FROM entries WHERE res_type = ? AND key = ?', (res_type, key))
+            cursor.execute('UPDATE stats SET num_items = num_items - 1, total_size = total_size - ? '
+                           'WHERE res_type = ?', (size, res_type))
+
+    def get(self, res_type: str, key: str) -> Optional[Any]:
+        """
+        Return cached data or None in case of a cache miss
+        """
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('SELECT size FROM entries WHERE res_type = ? AND key = ?', (res_type, key))
+        row = cursor.fetchone()
+        data = None
+        if row is not None:
+            try:
+                with open(self._data_path(res_type, key), 'rb') as fr:
+                    data = pickle.load(fr)
+            except (OSError, EOFError, pickle.UnpicklingError) as ex:
+                logging.getLogger(__name__).warning(f'Removing broken result cache entry {res_type}/{key}: {ex}')
+                self._del_entries(cursor, [(res_type, key, row[0])])
+                conn.commit()
+        self._log_access(res_type, key, data is not None)
+        return data
+
+    def _access_log(self) -> _AccessLog:
+        with _access_logs_lock:
+            log = _access_logs.get(self._root_dir)
+            if log is None or log.pid != os.getpid():  # we must not inherit a parent's statistics
+                log = _AccessLog()
+                _access_logs[self._root_dir] = log
+            return log
+
+    def _log_access(self, res_type: str, key: str, hit: bool) -> None:
+        """
+        Record a cache hit/miss. To keep reads from taking the index write lock,
+        the statistics are written to the index in batches (see ACCESS_FLUSH_INTERVAL).
+        """
+        log = self._access_log()
+        with log.lock:
+            log.add(res_type, key, hit)
+            flush = time.time() - log.last_flush >= ACCESS_FLUSH_INTERVAL
+        if flush:
+            self.flush_access_log()
+
+    def flush_access_log(self) -> None:
+        """
+        Write accumulated access statistics of the current process to the index
+        """
+        log = self._access_log()
+        with log.lock:
+            entries, stats = log.entries, log.stats
+            log.entries, log.stats = {}, {}
+            log.last_flush = time.time()
+        if len(entries) == 0 and len(stats) == 0:
+            return
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for res_type, (hits, misses) in stats.items():
+                self._ensure_stats(cursor, res_type)
+                cursor.execute('UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE res_type = ?',
+                               (hits, misses, res_type))
+            cursor.executemany(
+                'UPDATE entries SET last_access = MAX(last_access, ?), hits = hits + ? WHERE res_type = ? AND key = ?',
+                [(last_access, hits, res_type, key) for (res_type, key), (hits, last_access) in entries.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def put(self, res_type: str, key: str, data: Any) -> None:
+        """
+        Store data to the cache. The data file is written atomically (i.e. readers
+        never see partially written data). In case the cache budget is exceeded,
+        some entries are evicted.
+        """
+        path = self._data_path(res_type, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fw:
+                pickle.dump(data, fw)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self._ensure_stats(cursor, res_type)
+            cursor.execute('SELECT size FROM entries WHERE res_type = ? AND key = ?', (res_type, key))
+            row = cursor.fetchone()
+            if row is not None:
+                self._del_entries(cursor, [(res_type, key, row[0])])
+            now = time.time()
+            cursor.execute('INSERT INTO entries (res_type, key, size, created, last_access, hits) '
+                           'VALUES (?, ?, ?, ?, ?, 0)', (res_type, key, size, now, now))
+            cursor.execute('UPDATE stats SET num_items = num_items + 1, total_size = total_size + ? '
+                           'WHERE res_type = ?', (size, res_type))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if self.total_size() > self._max_size:
+            self.evict()
+
+    def remove(self, res_type: str, key: str) -> None:
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('SELECT size FROM entries WHERE res_type = ? AND key = ?', (res_type, key))
+            row = cursor.fetchone()
+            if row is not None:
+                self._del_entries(cursor, [(res_type, key, row[0])])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._unlink(res_type, key)
+
+    def _try_lock(self, key: str, ttl: float) -> bool:
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            cursor.execute('DELETE FROM locks WHERE key = ? AND expires <= ?', (key, now))
+            cursor.execute('INSERT OR IGNORE INTO locks (key, expires) VALUES (?, ?)', (key, now + ttl))
+            acquired = cursor.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return acquired
+
+    @contextmanager
+    def lock(self, key: str, max_wait: float = LOCK_TTL, ttl: float = LOCK_TTL):
+        """
+        Hold an inter-process lock identified by a key (shared by all the processes
+        using the same cache directory). This can be used e.g. to make sure a background
+        calculation of a result is submitted only once.
+
+        arguments:
+        key -- a lock identifier
+        max_wait -- max. time in seconds to wait for the lock
+        ttl -- time in seconds after which an unreleased lock expires
+
+        raises:
+        ResultCacheLockError in case the lock cannot be acquired within max_wait
+        """
+        deadline = time.time() + max_wait
+        while not self._try_lock(key, ttl):
+            if time.time() >= deadline:
+                raise ResultCacheLockError(f'Failed to acquire result cache lock {key}')
+            time.sleep(LOCK_WAIT_STEP)
+        try:
+            yield
+        finally:
+            conn = self._conn()
+            conn.execute('DELETE FROM locks WHERE key = ?', (key,))
+            conn.commit()
+
+    def total_size(self) -> int:
+        cursor = self._conn().cursor()
+        cursor.execute('SELECT SUM(total_size) FROM stats')
+        return cursor.fetchone()[0] or 0
+
+    def evict(self) -> int:
+        """
+        Remove least recently/frequently used entries until the total size
+        gets below the budget.
+
+        returns:
+        number of removed entries
+        """
+        self.flush_access_log()
+        order = 'last_access' if self._policy == 'lru' else 'hits, last_access'
+        target = self._max_size * EVICTION_TARGET
+        num_removed = 0
+        conn = self._conn()
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('SELECT SUM(total_size) FROM stats')
+                total = cursor.fetchone()[0] or 0
+                if total <= target:
+                    conn.commit()
+                    break
+                cursor.execute(f'SELECT res_type, key, size FROM entries ORDER BY {order} LIMIT ?',
+                               (EVICTION_BATCH_SIZE,))
+                to_del = []
+                for res_type, key, size in cursor.fetchall():
+                    if total <= target:
+                        break
+                    to_del.append((res_type, key, size))
+                    total -= size
+                self._del_entries(cursor, to_del)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            for res_type, key, _ in to_del:
+                self._unlink(res_type, key)
+            num_removed += len(to_del)
+            if len(to_del) == 0:
+                break
+        return num_removed
+
+    def cleanup(self, res_type: str, ttl: int) -> Dict[str, int]:
+        """
+        Remove entries of a specified type older than 'ttl' seconds
+        and make sure the cache budget is not exceeded.
+        """
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            self._ensure_stats(cursor, res_type)
+            cursor.execute('SELECT num_items FROM stats WHERE res_type = ?', (res_type,))
+            total_items = cursor.fetchone()[0]
+            cursor.execute('SELECT res_type, key, size FROM entries WHERE res_type = ? AND created <= ?',
+                           (res_type, time.time() - ttl))
+            to_del = cursor.fetchall()
+            self._del_entries(cursor, to_del)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        num_error = 0
+        for item in to_del:
+            if not self._unlink(item[0], item[1]):
+                num_error += 1
+        num_evicted = self.evict() if self.total_size() > self._max_size else 0
+        return dict(total_files=total_items, num_removed=len(to_del) - num_error, num_error=num_error,
+                    num_evicted=num_evicted)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Return hits/misses, number of items and total size for each result type
+        """
+        self.flush_access_log()
+        cursor = self._conn().cursor()
+        cursor.execute('SELECT res_type, hits, misses, num_items, total_size FROM stats')
+        return dict((row[0], dict(hits=row[1], misses=row[2], num_items=row[3], total_size=row[4]))
+                    for row in cursor.fetchall())
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Return a result cache instance configured via the 'corpora' section
+    of the configuration (result_cache_dir, result_cache_max_size, result_cache_policy).
+    If 'result_cache_dir' is not set, 'freqs_cache_dir' is used.
+    """
+    return ResultCache(
+        root_dir=settings.get('corpora', 'result_cache_dir', None) or settings.get('corpora', 'freqs_cache_dir'),
+        max_size=settings.get_int('corpora', 'result_cache_max_size', DEFAULT_MAX_SIZE),
+        policy=settings.get('corpora', 'result_cache_policy', 'lru'))
@@ -13,8 +13,9 @@
 # GNU General Public License for more details.
 
 import logging
+import math
 import time
-from rq import Queue
+from rq import Queue, Worker
 from rq.job import Job
 from rq.exceptions import NoSuchJobError
 from redis import Redis
@@ -22,6 +23,48 @@ from rq_scheduler import Scheduler
 import json
 
 
+# a prefix of Redis lists used to notify waiting clients about finished jobs
+RESULT_NOTIFICATION_KEY_PREFIX = 'kontext:rq:job_done:'
+
+# how long (in seconds) a job notification is kept for clients which start waiting late
+RESULT_NOTIFICATION_TTL = 600
+
+# max. time (in seconds) a client blocks before it re-checks job status (e.g. in case
+# a job has been processed by a worker which does not send notifications)
+MAX_BLOCKING_WAIT = 5
+
+
+def mk_result_notification_key(job_id):
+    return RESULT_NOTIFICATION_KEY_PREFIX + job_id
+
+
+class NotifyingWorker(Worker):
+    """
+    An RQ worker which, once a job result (or a failure) is stored,
+    pushes a notification to a job-specific Redis list so clients
+    waiting for the result can block on the list (BLPOP) instead
+    of polling job status.
+    """
+
+    def _notify_job_done(self, job):
+        try:
+            key = mk_result_notification_key(job.id)
+            pipe = self.connection.pipeline()
+            pipe.rpush(key, 1)
+            pipe.expire(key, RESULT_NOTIFICATION_TTL)
+            pipe.execute()
+        except Exception as ex:
+            logging.getLogger(__name__).warning(f'Failed to send job notification for {job.id}: {ex}')
+
+    def handle_job_success(self, job, *args, **kwargs):
+        super().handle_job_success(job, *args, **kwargs)
+        self._notify_job_done(job)
+
+    def handle_job_failure(self, job, *args, **kwargs):
+        super().handle_job_failure(job, *args, **kwargs)
+        self._notify_job_done(job)
+
+
 class ResultWrapper:
 
     status_map = dict(
@@ -36,21 +79,36 @@ class ResultWrapper:
         self.job = job
         self.result = None
 
+    def _wait_for_notification(self, max_wait):
+        """
+        Block until a job notification arrives or max_wait seconds elapse.
+        The notification is pushed back so other clients waiting for the
+        same job are woken up too.
+        """
+        key = mk_result_notification_key(self.job.id)
+        conn = self.job.connection
+        item = conn.blpop([key], timeout=max(1, math.ceil(max_wait)))
+        if item is not None:
+            pipe = conn.pipeline()
+            pipe.rpush(key, item[1])
+            pipe.expire(key, RESULT_NOTIFICATION_TTL)
+            pipe.execute()
+
     def get(self, timeout=None):
         try:
-            total_time = 0
+            deadline = time.time() + timeout if timeout else None
             while True:
-                time.sleep(0.5)
                 if self.job.is_finished:
                     self.result = self.job.result
                     return self.job.result
                 elif self.job.is_failed:
                     self.result = Exception(f'Task failed: {self.job}')
                     raise self.result
-                elif timeout and total_time > timeout:
+                elif deadline is not None and time.time() >= deadline:
                     self.result = Exception(f'Task result timeout: {self.job}')
                     raise self.result
-                total_time += 0.5
+                max_wait = MAX_BLOCKING_WAIT if deadline is None else min(MAX_BLOCKING_WAIT, deadline - time.time())
+                self._wait_for_notification(max_wait)
         except Exception as e:
             self.result = e
             logging.getLogger(__name__).error(e)
@@ -86,6 +144,7 @@ class RqClient:
     def __init__(self, conf: RqConfig, prefix: str = ''):
         self.redis_conn = Redis(host=conf.HOST, port=conf.PORT, db=conf.DB)
         self.queue = Queue(connection=self.redis_conn)
+        self._queues = {}
         self.prefix = prefix
         self.scheduler = Scheduler(connection=self.redis_conn, queue=self.queue)
         self.scheduler_conf_path = conf.SCHEDULER_CONF_PATH
@@ -106,9 +165,16 @@ class RqClient:
                         kwargs=entry['kwargs'] if 'kwargs' in entry else None
                     )
 
-    def send_task(self, name, args=None, time_limit=None, soft_time_limit=None):
+    def _get_queue(self, name):
+        if name is None:
+            return self.queue
+        if name not in self._queues:
+            self._queues[name] = Queue(name, connection=self.redis_conn)
+        return self._queues[name]
+
+    def send_task(self, name, args=None, time_limit=None, soft_time_limit=None, queue=None):
         try:
-            job = self.queue.enqueue(f'{self.prefix}.{name}', ttl=time_limit, args=args)
+            job = self._get_queue(queue).enqueue(f'{self.prefix}.{name}', ttl=time_limit, args=args)
             return ResultWrapper(job)
         except Exception as ex:
             logging.getLogger(__name__).error(ex)
@@ -51,4 +51,6 @@ class CreateSubcorpusTask(object):
         os.chmod(path, 0o664)
         if publish_path:
             corplib.mk_publish_links(path, publish_path, self._author, self._description)
+        else:
+            corplib.update_subc_catalogue(path)
         return ans
@@ -0,0 +1,303 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Cached word lists. A word list is calculated as a ranked list of (word, freq)
+pairs which is stored in the result cache. Any page (or an export) within
+the cached part of the list is served without recalculation.
+
+The calculation itself runs on calculation workers ('calculate_wordlist' task).
+While running, the task stores its progress along with partial results
+to the result cache (see get_progress()).
+"""
+
+import sys
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import corplib
+import settings
+import bgcalc
+from structures import FixedDict
+from bgcalc import result_cache
+from bgcalc.celery import is_celery_timeout_error, is_celery_user_error
+from controller.errors import UserActionException
+from translation import ugettext as translate
+
+TASK_TIME_LIMIT = settings.get_int('calc_backend', 'task_time_limit', 300)
+
+# max. time (in seconds) a web request waits for a word list calculated in background;
+# after that, the user is informed about a running background calculation
+SYNC_WAIT_TIME = 5
+
+# max. number of items of a partial result stored along with a calculation progress
+PARTIAL_RESULT_MAX_ITEMS = 1000
+
+# number of pages calculated in advance when calculating a word list for the first time
+NUM_PREFETCH_PAGES = 10
+
+# a cached incomplete list too short for a requested page is replaced by
+# one at least FETCH_GROWTH_RATIO times longer
+FETCH_GROWTH_RATIO = 2
+
+
+class WordlistCalcArgs(FixedDict):
+    """
+    Collects all the arguments determining a word list
+    """
+    corpname = None
+    subcname = None
+    subcpath = None
+    wlattr = None
+    wlpat = None
+    wlminfreq = None
+    wlnums = None
+    wlsort = None
+    include_nonwords = None
+    whitelist = None
+    blacklist = None
+    num_items = None
+    cache_key = None
+    progress_key = None
+
+
+class WordlistCalcInProgress(Exception):
+    """
+    Raised in case a word list is still being calculated in background
+    """
+
+    def __init__(self, task_id: str, task_status: str, progress_key: str) -> None:
+        super().__init__(f'Word list calculation {task_id} in progress')
+        self.task_id = task_id
+        self.task_status = task_status
+        self.progress_key = progress_key
+
+
+def mk_cache_key(args: WordlistCalcArgs) -> str:
+    return result_cache.mk_cache_key(
+        args.corpname, args.subcname, args.subcpath, args.wlattr, args.wlpat, args.wlminfreq, args.wlnums,
+        args.wlsort, args.include_nonwords, result_cache.mk_cache_key('\n'.join(sorted(args.whitelist or ()))),
+        result_cache.mk_cache_key('\n'.join(sorted(args.blacklist or ()))))
+
+
+def mk_progress_key(cache_key: str) -> str:
+    return result_cache.mk_cache_key(cache_key, 'progress')
+
+
+def mk_task_key(cache_key: str) -> str:
+    return result_cache.mk_cache_key(cache_key, 'task')
+
+
+def calc_wordlist(corp, args: WordlistCalcArgs, num_items: int, on_progress=None) -> Dict[str, Any]:
+    """
+    Calculate at most num_items top ranked items of a word list.
+
+    arguments:
+    on_progress -- see corplib.ranked_wordlist()
+
+    returns:
+    a dict(data=[(word, freq),...], complete=...) where 'complete' is True if
+    there are no more items beyond the returned ones
+    """
+    items = corplib.ranked_wordlist(
+        corp=corp, words=args.whitelist, wlattr=args.wlattr, wlpat=args.wlpat, wlminfreq=args.wlminfreq,
+        wlmaxitems=num_items + 1, wlsort=args.wlsort, blacklist=args.blacklist, wlnums=args.wlnums,
+        include_nonwords=args.include_nonwords, on_progress=on_progress, progress_max_items=PARTIAL_RESULT_MAX_ITEMS)
+    return dict(data=items[:num_items], complete=len(items) <= num_items)
+
+
+def calc_wordlist_bg(args: WordlistCalcArgs) -> Dict[str, Any]:
+    """
+    Calculate a word list and store it to the result cache. This is
+    expected to be run by a calculation worker.
+
+    returns:
+    a dict(num_items=..., complete=...) describing the stored result
+    """
+    cm = corplib.CorpusManager(subcpath=args.subcpath)
+    corp = cm.get_Corpus(args.corpname, subcname=args.subcname)
+    cache = result_cache.get_result_cache()
+
+    def on_progress(ratio, items):
+        cache.put(result_cache.RES_TYPE_WORDLIST, args.progress_key,
+                  dict(progress=min(99, int(ratio * 100)), data=items[:PARTIAL_RESULT_MAX_ITEMS]))
+
+    ans = calc_wordlist(corp, args, args.num_items, on_progress=on_progress if args.progress_key else None)
+    cache.put(result_cache.RES_TYPE_WORDLIST, args.cache_key, ans)
+    if args.progress_key:
+        cache.put(result_cache.RES_TYPE_WORDLIST, args.progress_key, dict(progress=100, data=[]))
+    return dict(num_items=len(ans['data']), complete=ans['complete'])
+
+
+def get_progress(progress_key: str) -> Dict[str, Any]:
+    """
+    Return a progress (0...100) of a background word list calculation along
+    with a partial result (top ranked items found so far).
+    """
+    ans = result_cache.get_result_cache().get(result_cache.RES_TYPE_WORDLIST, progress_key)
+    return ans if ans is not None else dict(progress=0, data=[])
+
+
+def _num_fetch_items(cached: Optional[Dict[str, Any]], offset: int, limit: Optional[int]) -> int:
+    """
+    Return a number of items to be calculated to serve a requested page
+    or 0 if the cached data are sufficient.
+    """
+    if limit is None:
+        if cached is not None and cached['complete']:
+            return 0
+        return sys.maxsize
+    if cached is not None and (cached['complete'] or len(cached['data']) >= offset + limit):
+        return 0
+    if cached is None:
+        return offset + NUM_PREFETCH_PAGES * limit
+    return max(offset + limit, FETCH_GROWTH_RATIO * len(cached['data']))
+
+
+def _find_running_task(app, cache: result_cache.ResultCache, cache_key: str):
+    """
+    Find a running task calculating a word list. Only one task per word list
+    is allowed to run (they share the progress record) so in case the running task
+    calculates fewer items than needed, a longer list is calculated by a next request.
+
+    returns:
+    an async result of the task or None if there is no such task
+    """
+    task = cache.get(result_cache.RES_TYPE_WORDLIST, mk_task_key(cache_key))
+    if task is None or time.time() - task['submitted'] > TASK_TIME_LIMIT:
+        return None
+    res = app.AsyncResult(task['task_id'])
+    if res is None or res.status in ('SUCCESS', 'FAILURE'):
+        return None
+    return res
+
+
+def _submit_task(app, cache: result_cache.ResultCache, args: WordlistCalcArgs, cache_key: str, num_fetch: int):
+    """
+    Send a new word list task and register it as a running one (see _find_running_task()).
+    This is expected to be called with the task lock held.
+    """
+    task_args = WordlistCalcArgs(**args.to_dict())
+    task_args.num_items = num_fetch
+    task_args.cache_key = cache_key
+    task_args.progress_key = mk_progress_key(cache_key)
+    cache.put(result_cache.RES_TYPE_WORDLIST, task_args.progress_key, dict(progress=0, data=[]))
+    res = app.send_task('calculate_wordlist', args=(task_args.to_dict(),), time_limit=TASK_TIME_LIMIT,
+                        queue=bgcalc.corpus_task_queue(settings, args.corpname))
+    cache.put(result_cache.RES_TYPE_WORDLIST, mk_task_key(cache_key),
+              dict(task_id=res.id, submitted=time.time()))
+    return res
+
+
+def _wait_for_task(res, max_wait: Optional[float]) -> None:
+    """
+    Wait for a word list task. An unfinished task is not considered an error
+    (the caller finds out from the cache whether the requested data are available).
+
+    raises:
+    UserActionException in case the task failed
+    """
+    try:
+        res.get(timeout=max_wait)
+    except bgcalc.TaskTimeoutError:
+        return
+    except Exception as ex:
+        if is_celery_timeout_error(ex):
+            return
+        logging.getLogger(__name__).error(f'Word list task {res.id} failed: {ex}')
+        if is_celery_user_error(ex):
+            raise UserActionException(str(ex)) from ex
+        raise UserActionException(translate('Failed to calculate the word list')) from ex
+    if res.status == 'FAILURE':  # some backends (rq) report failures only via the status
+        raise UserActionException(translate('Failed to calculate the word list'))
+
+
+def _get_wordlist(corp, args: WordlistCalcArgs, offset: int, limit: Optional[int],
+                  max_wait: Optional[float]) -> Dict[str, Any]:
+    """
+    Return a cached word list (dict(data=..., complete=...)) containing
+    the requested items. In case the cache does not contain them, the list
+    is calculated (or extended) in background.
+
+    raises:
+    see get_wordlist_page()
+    """
+    cache = result_cache.get_result_cache()
+    cache_key = mk_cache_key(args)
+    cached = cache.get(result_cache.RES_TYPE_WORDLIST, cache_key)
+    num_fetch = _num_fetch_items(cached, offset, limit)
+    if num_fetch > 0:
+        if '.' not in args.wlattr:
+            corplib.frq_db(corp, args.wlattr, args.wlnums)  # makes sure the frequency data are available
+        app = bgcalc.calc_backend_client(settings)
+        submitted = False
+        while num_fetch > 0:
+            with cache.lock(mk_task_key(cache_key)):
+                cached = cache.get(result_cache.RES_TYPE_WORDLIST, cache_key)
+                num_fetch = _num_fetch_items(cached, offset, limit)
+                if num_fetch == 0:
+                    break
+                res = _find_running_task(app, cache, cache_key)
+                if res is None:
+                    res = _submit_task(app, cache, args, cache_key, num_fetch)
+                    submitted = True
+            _wait_for_task(res, max_wait)
+            cached = cache.get(result_cache.RES_TYPE_WORDLIST, cache_key)
+            num_fetch = _num_fetch_items(cached, offset, limit)
+            if num_fetch > 0 and (submitted or res.status != 'SUCCESS'):
+                raise WordlistCalcInProgress(res.id, res.status, mk_progress_key(cache_key))
+            # otherwise we have waited for a finished task calculating a shorter list => let's continue
+    return cached
+
+
+def get_wordlist_page(corp, args: WordlistCalcArgs, offset: int = 0, limit: Optional[int] = None,
+                      max_wait: Optional[float] = SYNC_WAIT_TIME) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Return a page of a word list. The word list is calculated (or extended) in background
+    only in case the cached data do not contain the requested page.
+
+    arguments:
+    corp -- a corpus instance
+    args -- word list arguments
+    offset -- an index of the first item of the page
+    limit -- a page size (None = all the items starting from offset)
+    max_wait -- max. time in seconds to wait for a background calculation (None = until it is finished)
+
+    returns:
+    a 2-tuple (list of items {str: ..., freq: ...}, last page flag)
+
+    raises:
+    corplib.MissingSubCorpFreqFile in case subcorpus frequency data are not available yet
+    WordlistCalcInProgress in case the background calculation does not finish within max_wait
+    UserActionException in case the background calculation fails
+    """
+    cached = _get_wordlist(corp, args, offset, limit, max_wait)
+    stop = len(cached['data']) if limit is None else offset + limit
+    items = [dict(str=w, freq=f) for w, f in cached['data'][offset:stop]]
+    return corplib.add_block_items(items, offset=offset), cached['complete'] and stop >= len(cached['data'])
+
+
+def get_wordlist_size(corp, args: WordlistCalcArgs, max_wait: Optional[float] = SYNC_WAIT_TIME) -> int:
+    """
+    Return a size of a word list. The complete list is calculated in background
+    (and cached) in case it is not available yet.
+
+    raises:
+    see get_wordlist_page()
+    """
+    return len(_get_wordlist(corp, args, 0, None, max_wait)['data'])
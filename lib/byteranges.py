@@ -0,0 +1,136 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Helper functions for serving (partial) file content via HTTP
+(the 'Range' request header, RFC 7233).
+"""
+
+from typing import Any, Dict, List, Tuple, Optional, Iterator
+import io
+import uuid
+
+from werkzeug.wsgi import FileWrapper
+
+ByteRange = Tuple[int, int]  # (first byte, last byte + 1)
+
+CHUNK_SIZE = 65536
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_ranges(header: Optional[str], size: int) -> Optional[List[ByteRange]]:
+    """
+    Parse a value of the 'Range' header for a resource of the 'size' bytes.
+
+    returns:
+    a list of (start, stop) tuples (stop is exclusive) or None in case the header
+    is missing or malformed (in such case the whole resource should be returned)
+
+    raises:
+    RangeNotSatisfiable if none of the ranges overlaps the resource
+    """
+    if not header or not header.strip().startswith('bytes='):
+        return None
+    ans = []
+    for item in header.strip()[len('bytes='):].split(','):
+        item = item.strip()
+        if not item or '-' not in item:
+            return None
+        first, last = [x.strip() for x in item.split('-', 1)]
+        try:
+            if first == '':  # suffix range (e.g. "-500" = the last 500 bytes)
+                if last == '':
+                    return None
+                start, stop = max(0, size - int(last)), size
+            else:
+                start = int(first)
+                stop = size if last == '' else min(int(last) + 1, size)
+                if last != '' and int(last) < start:
+                    return None
+        except ValueError:
+            return None
+        if start < stop:
+            ans.append((start, stop))
+    if len(ans) == 0:
+        raise RangeNotSatisfiable()
+    return ans
+
+
+def iter_file_range(path: str, start: int, stop: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Generate a content of a file between 'start' (inclusive) and 'stop' (exclusive) in chunks.
+    """
+    with open(path, 'rb') as fr:
+        fr.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = fr.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def mk_multipart_boundary() -> str:
+    return uuid.uuid4().hex
+
+
+def multipart_byteranges_size(ranges: List[ByteRange], size: int, content_type: str, boundary: str) -> int:
+    """
+    Return a length of a multipart/byteranges body as generated by iter_multipart_byteranges()
+    """
+    ans = 0
+    for start, stop in ranges:
+        ans += len(_mk_part_header(start, stop, size, content_type, boundary)) + (stop - start)
+    return ans + len(_mk_closing_boundary(boundary))
+
+
+def _mk_part_header(start: int, stop: int, size: int, content_type: str, boundary: str) -> bytes:
+    return (f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+
+
+def _mk_closing_boundary(boundary: str) -> bytes:
+    return f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+
+def iter_multipart_byteranges(path: str, ranges: List[ByteRange], size: int, content_type: str,
+                              boundary: str) -> Iterator[bytes]:
+    """
+    Generate a multipart/byteranges body for provided file ranges.
+    """
+    for start, stop in ranges:
+        yield _mk_part_header(start, stop, size, content_type, boundary)
+        yield from iter_file_range(path, start, stop)
+    yield _mk_closing_boundary(boundary)
+
+
+def is_file_wrapper(environ: Dict[str, Any], body: Any) -> bool:
+    """
+    Test whether a response body is a file wrapped by werkzeug.wsgi.wrap_file()
+    (i.e. an instance of the server's 'wsgi.file_wrapper', werkzeug's FileWrapper
+    or - with servers like uWSGI - the file object itself). Such a body must be
+    passed to the server untouched (werkzeug's 'direct_passthrough') otherwise
+    the server cannot use sendfile().
+    """
+    if isinstance(body, (FileWrapper, io.IOBase)):
+        return True
+    wrapper = environ.get('wsgi.file_wrapper', None)
+    return isinstance(wrapper, type) and isinstance(body, wrapper)
@@ -36,6 +36,18 @@ import bgcalc
 
 TASK_TIME_LIMIT = settings.get_int('calc_backend', 'task_time_limit', 300)
 
+# A partial (i.e. still growing) concordance is re-published only once it grows at least
+# PARTIAL_SAVE_GROWTH_RATIO times since the last save or once the time since the last save
+# reaches the total calculation time at the last save (but at most PARTIAL_SAVE_MAX_INTERVAL
+# seconds). As each save rewrites the whole file, this keeps the number of saves (and thus
+# the amount of written data) logarithmic instead of linear while first lines are still
+# published quickly.
+PARTIAL_SAVE_GROWTH_RATIO = 2
+PARTIAL_SAVE_MAX_INTERVAL = 60
+
+# how often (in seconds) a running calculation checks the concordance size
+PARTIAL_SIZE_CHECK_INTERVAL = 0.5
+
 
 def _contains_shuffle_seq(q_ops: Tuple[str, ...]) -> bool:
     """
@@ -91,13 +103,13 @@ def wait_for_conc(cache_map: AbstractConcCache, q: Tuple[str, ...], subchash: Op
     """
     time_limit = 5 if minsize >= 0 else 30
     t0 = t1 = time.time()
-    i = 1
-    has_result, finished = _check_result(cache_map, q, subchash, minsize)
-    while not finished and t1 - t0 < time_limit:
-        time.sleep(i * 0.1)
-        i += 1
-        t1 = time.time()
+    # the listener must be created before the first check so no status change notification is missed
+    with cache_map.get_calc_status_listener(subchash, q) as listener:
         has_result, finished = _check_result(cache_map, q, subchash, minsize)
+        while not finished and t1 - t0 < time_limit:
+            listener.wait(time_limit - (t1 - t0))
+            t1 = time.time()
+            has_result, finished = _check_result(cache_map, q, subchash, minsize)
     if not os.path.isfile(cache_map.cache_file_path(subchash, q)):
         if finished:  # cache vs. filesystem mismatch
             cache_map.del_entry(subchash, q)
@@ -133,7 +145,7 @@ def _check_result(cache_map: AbstractConcCache, q: Tuple[str, ...], subchash: Op
 
 
 def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tuple[str, ...],
-                          minsize: int) -> Tuple[Optional[int], manatee.Concordance]:
+                          minsize: int, conc_dir: Optional[str] = None) -> Tuple[Optional[int], manatee.Concordance]:
     """
     Load a concordance from cache starting from a complete operation q[:],
     then trying q[:-1], q[:-2], q:[:-i] etc. A possible found concordance can be
@@ -142,6 +154,7 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
     arguments:
     minsize -- a minimum concordance size to return immediately (synchronously); please
                 note that unlike wait_for_conc here we accept also 0
+    conc_dir -- a directory of user's stored concordances (see PyConc)
 
     returns:
     a 2-tuple [an index within 'q' where to start with non-cached results], [a concordance instance]
@@ -149,7 +162,9 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
     start_time = time.time()
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
     cache_map.refresh_map()
-    calc_status = cache_map.get_calc_status(subchash, q)
+    # all the prefixes q[:1], q[:2], ..., q[:] (i.e. the whole chain of operations) are looked up at once
+    prefix_statuses = cache_map.get_prefix_calc_statuses(subchash, q)
+    calc_status = prefix_statuses[-1]
     if calc_status:
         if calc_status.error is None:
             corp_mtime = corplib_corp_mtime(corp)
@@ -157,10 +172,12 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
                 logging.getLogger(__name__).warning(
                     'Removed outdated cache file (older than corpus indices)')
                 cache_map.del_full_entry(subchash, q)
+                prefix_statuses = [None] * len(q)
         else:
             logging.getLogger(__name__).warning(
                 'Removed failed calculation cache record (error: {0}'.format(calc_status.error))
             cache_map.del_full_entry(subchash, q)
+            prefix_statuses = [None] * len(q)
 
     if _contains_shuffle_seq(q):
         srch_from = 1
@@ -172,6 +189,8 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
     # try to find the most complete cached operation
     # (e.g. query + filter + sample)
     for i in range(srch_from, 0, -1):
+        if prefix_statuses[i - 1] is None:
+            continue
         cache_path = cache_map.cache_file_path(subchash, q[:i])
         # now we know that someone already calculated the conc (but it might not be finished yet)
         if cache_path:
@@ -192,7 +211,10 @@ def find_cached_conc_base(corp: manatee.Corpus, subchash: Optional[str], q: Tupl
                         if qq.startswith('x-'):
                             mcorp = manatee.Corpus(qq[2:])
                             break
-                    conc = PyConc(mcorp, 'l', cache_path, orig_corp=corp)
+                    conc = PyConc(mcorp, 'l', cache_path, orig_corp=corp, conc_dir=conc_dir)
+                    # cache clean-up keeps frequently reused operations (e.g. popular base queries
+                    # other users keep filtering/sorting); the file's mtime must stay intact (ARF validity)
+                    cache_map.mark_used(subchash, q[:i])
             except (ConcCalculationStatusException, manatee.FileAccessError) as ex:
                 logging.getLogger(__name__).error(f'Failed to use cached concordance for {q[:i]}: {ex}')
                 cancel_async_task(cache_map, subchash, q[:i])
@@ -213,6 +235,17 @@ class ConcCalculation(GeneralWorker):
         """
         super(ConcCalculation, self).__init__(task_id=task_id, cache_factory=cache_factory)
 
+    @staticmethod
+    def _should_publish_partial(start_time: float, saved_time: float, saved_size: int, curr_size: int) -> bool:
+        """
+        Decide whether a partial concordance grew enough to be saved again
+        (see PARTIAL_SAVE_GROWTH_RATIO, PARTIAL_SAVE_MAX_INTERVAL)
+        """
+        if curr_size <= saved_size:
+            return False
+        return (curr_size >= saved_size * PARTIAL_SAVE_GROWTH_RATIO or
+                time.time() - saved_time >= min(saved_time - start_time, PARTIAL_SAVE_MAX_INTERVAL))
+
     def __call__(self, initial_args, subc_dirs, corpus_name, subc_name, subchash, query, samplesize):
         """
         initial_args -- a dict(cachefile=..., already_running=...)
@@ -232,17 +265,30 @@ class ConcCalculation(GeneralWorker):
             if not initial_args['already_running']:
                 # The conc object bellow is asynchronous; i.e. you obtain it immediately but it may
                 # not be ready yet (this is checked by the 'finished()' method).
+                start_time = time.time()
                 conc = self.compute_conc(corpus_obj, query, samplesize)
                 sleeptime = 0.1
                 time.sleep(sleeptime)
+                saved_size = conc.size()
                 conc.save(initial_args['cachefile'], False, True, False)  # partial
+                saved_time = time.time()
+                sizes = self.get_cached_conc_sizes(corpus_obj, query, initial_args['cachefile'])
+                cache_map.update_calc_status(subchash, query, finished=sizes['finished'],
+                                             concsize=sizes['concsize'], fullsize=sizes['fullsize'],
+                                             relconcsize=sizes['relconcsize'], arf=None, task_id=self._task_id)
                 while not conc.finished():
                     # TODO it looks like append=True does not work with Manatee 2.121.1 properly
+                    # (otherwise we could append just the new lines)
+                    time.sleep(sleeptime)
+                    sleeptime = min(sleeptime + 0.1, PARTIAL_SIZE_CHECK_INTERVAL)
+                    curr_size = conc.size()
+                    if not self._should_publish_partial(start_time, saved_time, saved_size, curr_size):
+                        continue
                     tmp_cachefile = initial_args['cachefile'] + '.tmp'
                     conc.save(tmp_cachefile, False, True, False)
                     os.rename(tmp_cachefile, initial_args['cachefile'])
-                    time.sleep(sleeptime)
-                    sleeptime += 0.1
+                    saved_size = curr_size
+                    saved_time = time.time()
                     sizes = self.get_cached_conc_sizes(corpus_obj, query, initial_args['cachefile'])
                     cache_map.update_calc_status(subchash, query, finished=sizes['finished'],
                                                  concsize=sizes['concsize'], fullsize=sizes['fullsize'],
@@ -251,12 +297,16 @@ class ConcCalculation(GeneralWorker):
                 conc.save(tmp_cachefile)  # whole
                 os.rename(tmp_cachefile, initial_args['cachefile'])
                 sizes = self.get_cached_conc_sizes(corpus_obj, query, initial_args['cachefile'])
+                if is_subcorpus(corpus_obj):
+                    arf_args = dict(arf=None)
+                else:
+                    file_stat = os.stat(initial_args['cachefile'])
+                    arf_args = dict(arf=round(conc.compute_ARF(), 2), arf_file_mtime=file_stat.st_mtime,
+                                    arf_file_size=file_stat.st_size)
                 cache_map.update_calc_status(subchash, query, finished=sizes['finished'],
                                              concsize=sizes['concsize'], fullsize=sizes['fullsize'],
-                                             relconcsize=sizes['relconcsize'],
-                                             arf=round(conc.compute_ARF(), 2) if not is_subcorpus(
-                                                 corpus_obj) else None,
-                                             task_id=self._task_id)
+                                             relconcsize=sizes['relconcsize'], task_id=self._task_id,
+                                             **arf_args)
                 # update size in map file
                 cache_map.add_to_map(subchash, query, conc.size())
         except Exception as e:
@@ -284,7 +334,7 @@ class ConcSyncCalculation(GeneralWorker):
         self.corpus_manager = CorpusManager(subcpath=subc_dirs)
         corpus_manager = CorpusManager(subcpath=subc_dirs)
         self.corpus_obj = corpus_manager.get_Corpus(corpus_name, subcname=subc_name)
-        setattr(self.corpus_obj, '_conc_dir', conc_dir)
+        self._conc_dir = conc_dir
         self.cache_map = self._cache_factory.get_mapping(self.corpus_obj)
 
     def _mark_calc_states_err(self, subchash: Optional[str], query: Tuple[str, ...], from_idx: int, err: BaseException):
@@ -293,9 +343,10 @@ class ConcSyncCalculation(GeneralWorker):
 
     def __call__(self,  subchash, query: Tuple[str, ...], samplesize: int):
         try:
-            calc_from, conc = find_cached_conc_base(self.corpus_obj, subchash, query, minsize=0)
+            calc_from, conc = find_cached_conc_base(self.corpus_obj, subchash, query, minsize=0,
+                                                   conc_dir=self._conc_dir)
             if isinstance(conc, EmptyConc):
-                conc = self.compute_conc(self.corpus_obj, query, samplesize)
+                conc = self.compute_conc(self.corpus_obj, query, samplesize, self._conc_dir)
                 conc.sync()
                 conc.save(self.cache_map.cache_file_path(subchash, query[:1]))
                 self.cache_map.update_calc_status(
@@ -21,6 +21,7 @@
 import logging
 import time
 import os
+import re
 from typing import Tuple, Optional,  Dict, Any
 
 from corplib import is_subcorpus, CorpusManager
@@ -34,6 +35,53 @@ import settings
 
 TASK_TIME_LIMIT = settings.get_int('calc_backend', 'task_time_limit', 300)
 
+# a size of an online sample in case neither the 'R' operation nor the caller specify it
+ONLINE_SAMPLE_DEFAULT_SIZE = 1000
+
+
+def parse_online_sample(q0: str, default_size: int = 0) -> Tuple[int, str]:
+    """
+    Parse an online sample operation 'R[size][base operation]'
+    (e.g. 'R500aword,[lemma="be"]' or 'Raword,[lemma="be"]').
+
+    arguments:
+    q0 -- the operation
+    default_size -- a size used in case the operation does not specify
+                    any (if 0 then ONLINE_SAMPLE_DEFAULT_SIZE is used)
+
+    returns:
+    a 2-tuple (sample size, base operation)
+    """
+    srch = re.match(r'R(\d*)(.+)$', q0)
+    if srch is None:
+        raise ValueError(f'Invalid online sample operation: {q0}')
+    if srch.group(1):
+        size = int(srch.group(1))
+    else:
+        size = default_size if default_size > 0 else ONLINE_SAMPLE_DEFAULT_SIZE
+    return size, srch.group(2)
+
+
+def normalize_online_sample(q: Tuple[str, ...], default_size: int = 0) -> Tuple[str, ...]:
+    """
+    In case a query starts with an online sample operation, make sure the operation
+    contains an explicit sample size (so samples of different sizes do not share cache records).
+    """
+    if q and q[0].startswith('R'):
+        size, base = parse_online_sample(q[0], default_size)
+        return (f'R{size}{base}',) + tuple(q[1:])
+    return q
+
+
+def online_sample_size(q: Tuple[str, ...]) -> int:
+    """
+    Return a requested size of an online sample for a normalized query
+    (see normalize_online_sample) or 0 in case the query is not an online sample.
+    """
+    if q and q[0].startswith('R'):
+        return parse_online_sample(q[0])[0]
+    return 0
+
 
 class GeneralWorker(object):
 
@@ -41,8 +89,61 @@ class GeneralWorker(object):
         self._cache_factory = cache_factory if cache_factory is not None else plugins.runtime.CONC_CACHE.instance
         self._task_id = task_id
 
-    def create_new_calc_status(self) -> CalcStatus:
-        return CalcStatus(task_id=self._task_id)
+    def create_new_calc_status(self, query: Tuple[str, ...] = ()) -> CalcStatus:
+        return CalcStatus(task_id=self._task_id, sample_size=online_sample_size(query))
+
+    def _find_cached_base(self, corp: manatee.Corpus, base_q0: str) -> Tuple[Optional[CalcStatus], Optional[str]]:
+        """
+        Return a calculation status and a cache file path of an already calculated
+        (finished) concordance for the operation 'base_q0' (or (None, None) if not available).
+        """
+        cache_map = self._cache_factory.get_mapping(corp)
+        subchash = getattr(corp, 'subchash', None)
+        status = cache_map.get_calc_status(subchash, (base_q0,))
+        if status is not None and status.finished and status.error is None:
+            cachefile = cache_map.cache_file_path(subchash, (base_q0,))
+            if cachefile and os.path.isfile(cachefile):
+                return status, cachefile
+        return None, None
+
+    def _sample_cached_base(self, corp: manatee.Corpus, base_q0: str, sample_size: int,
+                            conc_dir: Optional[str]) -> Optional[PyConc]:
+        """
+        In case the result of the operation 'base_q0' is already cached, create the sample by
+        reducing the cached concordance - i.e. no corpus search is needed at all. The cached
+        concordance must be either complete or (in case it is a sample itself) at least
+        as large as the requested sample.
+
+        returns:
+        a sample concordance or None if no suitable cached result is available
+        """
+        status, cachefile = self._find_cached_base(corp, base_q0)
+        if status is None:
+            return None
+        complete = status.fullsize <= status.concsize
+        if not complete and status.concsize < sample_size:
+            return None
+        try:
+            ans = PyConc(corp, 'l', cachefile, conc_dir=conc_dir)
+        except manatee.FileAccessError as ex:
+            logging.getLogger(__name__).warning(f'Failed to load cached concordance {cachefile}: {ex}')
+            return None
+        if ans.size() > sample_size:
+            ans.reduce_lines(str(sample_size))
+        return ans
+
+    def _find_known_fullsize(self, corp: manatee.Corpus, base_q0: str) -> int:
+        """
+        Return a size of an already calculated (cached) concordance
+        for the operation 'base_q0' or -1 if unknown.
+        """
+        status, _ = self._find_cached_base(corp, base_q0)
+        if status is not None:
+            if status.fullsize > 0:
+                return status.fullsize
+            elif status.concsize > 0:
+                return status.concsize
+        return -1
 
     def get_cached_conc_sizes(self, corp: manatee.Corpus, q: Tuple[str, ...] = None, cachefile: str = None) -> Dict[str, Any]:
         """
@@ -58,7 +159,8 @@ class GeneralWorker(object):
             concsize : int,
             fullsize : int,
             relconcsize : float (concordance size recalculated to a million corpus),
-            arf : ARF of the result (this is calculated only for the finished result, i.e. no intermediate values)
+            arf : ARF of the result (this is available only for the finished result, i.e. no intermediate values;
+                  also, in case 'cachefile' is provided, the value is always None)
         }
         """
         import struct
@@ -66,33 +168,43 @@ class GeneralWorker(object):
         if q is None:
             q = ()
         ans = dict(finished=False, concsize=0, fullsize=0, relconcsize=0)
+        status = None
         if not cachefile:  # AJAX call
             subchash = getattr(corp, 'subchash', None)
             cache_map = self._cache_factory.get_mapping(corp)
             cachefile = cache_map.cache_file_path(subchash, q)
             status = cache_map.get_calc_status(subchash, q)
-            status.test_error(TASK_TIME_LIMIT)
             if not status:
                 raise ConcCalculationStatusException('Concordance calculation not found', None)
-            elif status.error is not None:
+            status.test_error(TASK_TIME_LIMIT)
+            if status.error is not None:
                 raise ConcCalculationStatusException('Concordance calculation failed', status.error)
 
         if cachefile and os.path.isfile(cachefile):
-            cache = open(cachefile, 'rb')
-            cache.seek(15)
-            finished = bool(ord(cache.read(1)))
-            (fullsize,) = struct.unpack('q', cache.read(8))
-            cache.seek(32)
-            (concsize,) = struct.unpack('i', cache.read(4))
+            with open(cachefile, 'rb') as cache:
+                file_stat = os.fstat(cache.fileno())
+                cache.seek(15)
+                finished = bool(ord(cache.read(1)))
+                (fullsize,) = struct.unpack('q', cache.read(8))
+                cache.seek(32)
+                (concsize,) = struct.unpack('i', cache.read(4))
 
             if fullsize > 0:
                 relconcsize = 1000000.0 * fullsize / corp.search_size()
             else:
                 relconcsize = 1000000.0 * concsize / corp.search_size()
 
-            if finished and not is_subcorpus(corp):
-                conc = manatee.Concordance(corp, cachefile)
-                result_arf = round(conc.compute_ARF(), 2)
+            # ARF is calculated just once for a finished concordance (typically by ConcCalculation)
+            # and then it is read from the calculation status
+            if finished and not is_subcorpus(corp) and status is not None:
+                if status.has_valid_arf(file_stat):
+                    result_arf = status.arf
+                else:
+                    conc = manatee.Concordance(corp, cachefile)
+                    result_arf = round(conc.compute_ARF(), 2)
+                    cache_map.update_calc_status(
+                        subchash, q, arf=result_arf, arf_file_mtime=file_stat.st_mtime,
+                        arf_file_size=file_stat.st_size)
             else:
                 result_arf = None
 
@@ -103,13 +215,22 @@ class GeneralWorker(object):
             ans['arf'] = result_arf
         return ans
 
-    def compute_conc(self, corp: manatee.Corpus, q: Tuple[str, ...], samplesize: int) -> PyConc:
+    def compute_conc(self, corp: manatee.Corpus, q: Tuple[str, ...], samplesize: int,
+                     conc_dir: Optional[str] = None) -> PyConc:
         start_time = time.time()
         q = tuple(q)
         if q[0][0] != 'R':
-            ans_conc = PyConc(corp, q[0][0], q[0][1:], samplesize)
+            ans_conc = PyConc(corp, q[0][0], q[0][1:], samplesize, conc_dir=conc_dir)
         else:
-            raise NotImplementedError('Function "online sample" is not supported')
+            # online sample - if the full result is cached, the sample is taken from it
+            # without searching; otherwise Manatee keeps just a random sample of 'sample_size'
+            # lines while searching (i.e. the memory is bounded but all the hits are still
+            # scanned - stopping earlier would bias the sample towards the beginning of the corpus)
+            sample_size, base_q0 = parse_online_sample(q[0], samplesize)
+            ans_conc = self._sample_cached_base(corp, base_q0, sample_size, conc_dir)
+            if ans_conc is None:
+                ans_conc = PyConc(corp, base_q0[0], base_q0[1:], sample_size,
+                                  self._find_known_fullsize(corp, base_q0), conc_dir=conc_dir)
         logging.getLogger(__name__).debug(f'compute_conc({corp.corpname}, [{", ".join(q)}]) '
                                           f'-> {(time.time() - start_time):.4f}')
         return ans_conc
@@ -124,7 +245,7 @@ class TaskRegistration(GeneralWorker):
         corpus_manager = CorpusManager(subcpath=subcpaths)
         corpus_obj = corpus_manager.get_Corpus(corpus_name, subcname=subc_name)
         cache_map = self._cache_factory.get_mapping(corpus_obj)
-        new_status = self.create_new_calc_status()
+        new_status = self.create_new_calc_status(query)
         cachefile, prev_status = cache_map.add_to_map(subchash, query, 0, new_status)
         return dict(
             cachefile=cachefile,
@@ -22,13 +22,15 @@ import os
 from sys import stderr
 import re
 import logging
+import threading
 
 import manatee
 import l10n
+import corplib
 from l10n import escape
 from kwiclib import lngrp_sortcrit
 from translation import ugettext as translate
-from functools import reduce
+from array import array
 
 
 def get_conc_labelmap(infopath):
@@ -61,37 +63,133 @@ def lngrp_sortstr(lab, separator='.'):
     return '|'.join([f[c] % s for c, s in lngrp_sortcrit(lab, separator)])
 
 
+class FreqDistribution(object):
+    """
+    A sorted frequency distribution stored column-wise (typed arrays) as
+    produced by PyConc.xfreq_dist_columns(). Per-item dicts (as expected
+    by the frequency views) are created just for a requested page which
+    makes the instance suitable for caching of whole distributions.
+    """
+
+    NORMWIDTH_FREQ = 100
+
+    NORMWIDTH_REL = 100
+
+    def __init__(self, head, words, freqs, norms, rels, order, num_real, scaling, freq_range, maxrel, ml,
+                 rel_mode):
+        """
+        arguments:
+        head -- a list of column descriptions
+        words -- a list of values (the first 'num_real' ones are from the concordance,
+                 the rest are included empty text type values)
+        freqs -- absolute frequencies
+        norms -- sizes of the respective categories
+        rels -- relative frequencies (None if not applicable)
+        order -- indices of items in the sorted order
+        num_real -- a number of the non-empty values
+        scaling -- a 2-tuple (freq. scaling coeff., norm scaling coeff.) to match the bar length
+        freq_range -- a 2-tuple (min. freq, max. freq)
+        maxrel -- max. ratio of scaled freq. and scaled norm
+        ml -- if non-empty then the distribution is multi-level
+        rel_mode -- {0, 1} (see PyConc.xfreq_dist())
+        """
+        self._head = head
+        self._words = words
+        self._freqs = freqs
+        self._norms = norms
+        self._rels = rels
+        self._order = order
+        self._num_real = num_real
+        self._tofbar, self._tonbar = scaling
+        self._minf, self._maxf = freq_range
+        self._maxrel = maxrel
+        self._ml = ml
+        self._rel_mode = rel_mode
+
+    @property
+    def total(self):
+        return len(self._order)
+
+    def _mk_item(self, i):
+        if i >= self._num_real:
+            return dict(Word=[{'n': self._words[i]}], freq=0, rel=0, norm=0, nbar=0, relbar=0, norel=self._ml,
+                        freqbar=0, fbar=0)
+        f = self._freqs[i]
+        word = [{'n': '  '.join(n.split('\v'))} for n in self._words[i].split('\t')]
+        if self._rels is None:
+            return dict(Word=word, freq=f, fbar=int(f * self._tofbar) + 1, norel=1, relbar=None)
+        nf = self._norms[i]
+        if self._rel_mode == 0:
+            rel_bar = 1 + int(f * self._tofbar * self.NORMWIDTH_REL / (nf * self._tonbar * self._maxrel))
+            freq_bar = int(self.NORMWIDTH_FREQ * float(f) / (self._maxf - self._minf + 1) + 1)
+        else:
+            rel_bar = 1 + int(float(f) / self._maxf * self.NORMWIDTH_REL)
+            freq_bar = 10
+        return dict(Word=word, freq=f, fbar=int(f * self._tofbar) + 1, norm=nf, nbar=int(nf * self._tonbar),
+                    relbar=rel_bar, norel=self._ml, freqbar=freq_bar, rel=self._rels[i])
+
+    def page(self, offset=0, max_items=None):
+        """
+        Create per-item data for a window of the sorted distribution
+
+        arguments:
+        offset -- an index of the first returned item
+        max_items -- a max. number of returned items (None = all the items)
+
+        returns:
+        a dict(Head=..., Items=..., Total=...) where Total is the number of all the items
+        """
+        stop = self.total if max_items is None else offset + max_items
+        return dict(Head=self._head, Items=[self._mk_item(i) for i in self._order[offset:stop]], Total=self.total)
+
+
 class EmptyParallelCorporaIntersection(Exception):
     pass
 
 
+# Corpus handles are shared by requests (see corplib.CorpusHandleCache) so a query
+# with a custom default attribute must not leave the attribute changed. The lock
+# makes sure no query is compiled while a handle has a non-registry default attribute.
+_default_attr_lock = threading.Lock()
+
+
 class PyConc(manatee.Concordance):
     selected_grps: List[int] = []
 
-    def __init__(self, corp, action, params, sample_size=0, full_size=-1, orig_corp=None):
+    def __init__(self, corp, action, params, sample_size=0, full_size=-1, orig_corp=None, conc_dir=None):
+        """
+        conc_dir -- a directory of user's stored concordances (required by the 's' action
+                    and by the 'g' and 'a' commands)
+        """
         self.pycorp = corp
+        self._conc_dir = conc_dir
         self.corpname = corp.get_conffile()
         self.orig_corp = orig_corp or self.pycorp
         self.corpus_encoding = corp.get_conf('ENCODING')
         self._conc_file = None
         try:
             if action == 'q':
-                manatee.Concordance.__init__(
-                    self, corp, params, sample_size, full_size)
+                with _default_attr_lock:
+                    manatee.Concordance.__init__(
+                        self, corp, params, sample_size, full_size)
             elif action == 'a':
                 # query with a default attribute
                 default_attr, query = params.split(',', 1)
-                corp.set_default_attr(default_attr)
-                manatee.Concordance.__init__(
-                    self, corp, query, sample_size, full_size)
+                with _default_attr_lock:
+                    corp.set_default_attr(default_attr)
+                    try:
+                        manatee.Concordance.__init__(
+                            self, corp, query, sample_size, full_size)
+                    finally:
+                        corp.set_default_attr(corp.get_conf('DEFAULTATTR'))
             elif action == 'l':
                 # load from a file
                 self._conc_file = params
                 manatee.Concordance.__init__(self, corp, self._conc_file)
             elif action == 's':
-                # stored in _conc_dir
+                # stored in conc_dir
                 self._conc_file = os.path.join(
-                    self.pycorp._conc_dir, corp.corpname, params + '.conc')
+                    self._get_conc_dir(), corp.corpname, params + '.conc')
                 manatee.Concordance.__init__(self, corp, self._conc_file)
             else:
                 raise RuntimeError(translate('Unknown concordance action: %s') % action)
@@ -99,6 +197,11 @@ class PyConc(manatee.Concordance):
             raise RuntimeError('Character encoding of this corpus ({0}) does not support one or more characters in the query.'
                                .format(self.corpus_encoding))
 
+    def _get_conc_dir(self):
+        if not self._conc_dir:
+            raise RuntimeError('Directory of stored concordances not specified')
+        return self._conc_dir
+
     def get_conc_file(self):
         return self._conc_file
 
@@ -117,7 +220,7 @@ class PyConc(manatee.Concordance):
         """
         sort according to linegroups
         """
-        annot = get_stored_conc(self.pycorp, options, self.pycorp._conc_dir)
+        annot = get_stored_conc(self.pycorp, options, self._get_conc_dir())
         self.set_linegroup_from_conc(annot)
         lmap = annot.labelmap
         lmap[0] = None
@@ -133,7 +236,7 @@ class PyConc(manatee.Concordance):
 
     def command_a(self, options):
         annotname, options = options.split(' ', 1)
-        annot = get_stored_conc(self.pycorp, annotname, self.pycorp._conc_dir)
+        annot = get_stored_conc(self.pycorp, annotname, self._get_conc_dir())
         self.set_linegroup_from_conc(annot)
         if options[0] == '-':
             self.delete_linegroups(options[1:], True)
@@ -208,56 +311,19 @@ class PyConc(manatee.Concordance):
         """
         full_attr_name = re.split(r'\s+', full_attr_name)[0]
         struct_name, attr_name = full_attr_name.split('.')
-        struct = self.pycorp.get_struct(struct_name)
-        attr = struct.get_attr(attr_name)
-        normvals = dict([(struct.beg(
-            i), struct.end(i) - struct.beg(i)) for i in range(struct.size())])
-        ans = {}
-        for i in range(attr.id_range()):
-            value = attr.id2str(i)
-            valid = attr.str2id(value)
-            r = self.pycorp.filter_query(struct.attr_val(attr_name, valid))
-            cnt = 0
-            while not r.end():
-                cnt += normvals[r.peek_beg()]
-                r.next()
-            ans[value] = cnt
-        return ans
+        norms = corplib.get_struct_attr_norms(self.pycorp, struct_name, attr_name)
+        return dict((value, norms.tokens(value)) for value in norms.values())
 
-    def xfreq_dist(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
-                   collator_locale='en_US'):
+    def xfreq_dist_columns(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
+                           collator_locale='en_US'):
         """
-        Calculates data (including data for visual output) of a frequency distribution
-        specified by the 'crit' parameter
+        Calculates a sorted frequency distribution specified by the 'crit' parameter
+        and keeps it column-wise (see FreqDistribution). Arguments are the same
+        as in case of xfreq_dist().
 
-        arguments:
-        crit -- specified criteria (CQL)
-        limit -- str type!, minimal frequency accepted, this value is exclusive! (i.e. accepted
-                 values must be greater than the limit)
-        sortkey -- a key according to which the distribution will be sorted
-        ml -- str, if non-empty then multi-level freq. distribution is generated
-        ftt_include_empty -- str, TODO
-        rel_mode -- {0, 1} (0 for structural attrs. , 1 for positional ones ??)
+        returns:
+        a FreqDistribution instance or None if there are no items
         """
-        # ml = determines how the bar appears (multilevel x text type)
-        # import math
-        normwidth_freq = 100
-        normwidth_rel = 100
-
-        def calc_scale(freqs, norms):
-            """
-            Create proper scaling coefficients for freqs and norms
-            to match a 100 units length bar.
-            """
-            from operator import add
-            sumn = float(reduce(add, norms))
-            if sumn == 0:
-                return float(normwidth_rel) / max(freqs), 0
-            else:
-                sumf = float(reduce(add, freqs))
-                corr = min(sumf / max(freqs), sumn / max(norms))
-                return normwidth_rel / sumf * corr, normwidth_rel / sumn * corr
-
         def label(attr):
             if '/' in attr:
                 attr = attr[:attr.index('/')]
@@ -269,32 +335,42 @@ class PyConc(manatee.Concordance):
         norms = manatee.NumVector()
         self.pycorp.freq_dist(self.RS(), crit, limit, words, freqs, norms)
         if not len(freqs):
-            return {}
+            return None
+        # The post-processing below works with whole columns (typed arrays), per-item
+        # dicts are created only for the returned items (see FreqDistribution.page()).
+        words = list(words)
+        freqs = array('q', freqs)
         # now we intentionally rewrite norms as filled in by freq_dist()
         # because of "hard to explain" metrics they lead to
         if rel_mode == 0:
             norms2_dict = self.get_attr_values_sizes(crit)
-            norms = [norms2_dict.get(x, 0) for x in words]
-        sumf = float(sum([x for x in freqs]))
+            norms = array('q', [norms2_dict.get(x, 0) for x in words])
+        else:
+            norms = array('q', norms)
+        num_real = len(freqs)
         attrs = crit.split()
         head = [dict(n=label(attrs[x]), s=x / 2)
                 for x in range(0, len(attrs), 2)]
         head.append(dict(n=translate('Freq'), s='freq', title=translate('Frequency')))
 
-        tofbar, tonbar = calc_scale(freqs, norms)
+        # scaling coefficients for freqs and norms to match a 100 units length bar
+        normwidth_rel = FreqDistribution.NORMWIDTH_REL
+        sumf = float(sum(freqs))
+        maxf = max(freqs)
+        sumn = float(sum(norms))
+        if sumn == 0:
+            tofbar, tonbar = float(normwidth_rel) / maxf, 0
+        else:
+            corr = min(sumf / maxf, sumn / max(norms))
+            tofbar, tonbar = normwidth_rel / sumf * corr, normwidth_rel / sumn * corr
+
+        minf = maxrel = 0
         if tonbar and not ml:
-            maxf = max(freqs)  # because of bar height
-            minf = min(freqs)
-            maxrel = 0
-            # because of bar width
-            for index, (f, nf) in enumerate(zip(freqs, norms)):
-                if nf == 0:
-                    nf = 100000
-                    norms[index] = 100000
-                newrel = (f * tofbar / (nf * tonbar))
-                if maxrel < newrel:
-                    maxrel = newrel
+            minf = min(freqs)  # because of bar height
+            norms = array('q', [nf if nf else 100000 for nf in norms])  # because of bar width
+            maxrel = max(f * tofbar / (nf * tonbar) for f, nf in zip(freqs, norms))
             if rel_mode == 0:
+                rels = array('d', [round(f * 1e6 / nf, 2) for f, nf in zip(freqs, norms)])
                 head.append(dict(
                     n='i.p.m.',
                     title=translate(
@@ -302,72 +378,61 @@ class PyConc(manatee.Concordance):
                     s='rel'
                 ))
             else:
+                rels = array('d', [round(f / sumf * 100, 2) for f in freqs])
                 head.append(dict(n='Freq [%]', title='', s='rel'))
-
-            lines = []
-            for w, f, nf in zip(words, freqs, norms):
-                rel_norm_freq = {
-                    0: round(f * 1e6 / nf, 2),
-                    1: round(f / sumf * 100, 2)
-                }[rel_mode]
-
-                rel_bar = {
-                    0: 1 + int(f * tofbar * normwidth_rel / (nf * tonbar * maxrel)),
-                    1: 1 + int(float(f) / maxf * normwidth_rel)
-                }[rel_mode]
-
-                freq_bar = {
-                    0: int(normwidth_freq * float(f) / (maxf - minf + 1) + 1),
-                    1: 10
-                }[rel_mode]
-                lines.append(dict(
-                    Word=[{'n': '  '.join(n.split('\v'))} for n in w.split('\t')],
-                    freq=f,
-                    fbar=int(f * tofbar) + 1,
-                    norm=nf,
-                    nbar=int(nf * tonbar),
-                    relbar=rel_bar,
-                    norel=ml,
-                    freqbar=freq_bar,
-                    rel=rel_norm_freq
-                ))
         else:
-            lines = []
-            for w, f, nf in zip(words, freqs, norms):
-                lines.append(dict(
-                    Word=[{'n': '  '.join(n.split('\v'))} for n in w.split('\t')],
-                    freq=f,
-                    fbar=int(f * tofbar) + 1,
-                    norel=1,
-                    relbar=None
-                ))
+            rels = None
 
         if ftt_include_empty and limit == 0 and '.' in attrs[0]:
             attr = self.pycorp.get_attr(attrs[0])
-            all_vals = [attr.id2str(i) for i in range(attr.id_range())]
-            used_vals = [line['Word'][0]['n'] for line in lines]
-            for v in all_vals:
-                if v in used_vals:
-                    continue
-                lines.append(dict(
-                    Word=[{'n': v}],
-                    freq=0,
-                    rel=0,
-                    norm=0,
-                    nbar=0,
-                    relbar=0,
-                    norel=ml,
-                    freqbar=0,
-                    fbar=0
-                ))
-        if (sortkey in ('0', '1', '2')) and (int(sortkey) < len(lines[0]['Word'])):
-            sortkey = int(sortkey)
-            lines = l10n.sort(lines, loc=collator_locale, key=lambda v: v['Word'][sortkey]['n'])
+            used_vals = set('  '.join(w.split('\t', 1)[0].split('\v')) for w in words)
+            empty_vals = [v for v in (attr.id2str(i) for i in range(attr.id_range())) if v not in used_vals]
+            words.extend(empty_vals)
+            freqs.extend(array('q', bytes(freqs.itemsize * len(empty_vals))))
+            if rels is not None:
+                rels.extend(array('d', bytes(rels.itemsize * len(empty_vals))))
+        total = len(words)
+
+        if (sortkey in ('0', '1', '2')) and (int(sortkey) < len(words[0].split('\t'))):
+            col = int(sortkey)
+
+            def word_part(i):
+                if i >= num_real:
+                    return words[i] if col == 0 else ''
+                parts = words[i].split('\t')
+                return '  '.join(parts[col].split('\v')) if col < len(parts) else ''
+            order = l10n.sort(range(total), loc=collator_locale, key=word_part)
         else:
-            if sortkey not in ('freq', 'rel'):
-                sortkey = 'freq'
-            lines = sorted(lines, key=lambda v: v[sortkey], reverse=True)
-        return dict(Head=head, Items=lines)
+            column = rels if sortkey == 'rel' and rels is not None else freqs
+            order = sorted(range(total), key=column.__getitem__, reverse=True)
+
+        return FreqDistribution(head=head, words=words, freqs=freqs, norms=norms, rels=rels,
+                                order=array('q', order), num_real=num_real, scaling=(tofbar, tonbar),
+                                freq_range=(minf, maxf), maxrel=maxrel, ml=ml, rel_mode=rel_mode)
+
+    def xfreq_dist(self, crit, limit=1, sortkey='f', ml='', ftt_include_empty='', rel_mode=0,
+                   collator_locale='en_US', offset=0, max_items=None):
+        """
+        Calculates data (including data for visual output) of a frequency distribution
+        specified by the 'crit' parameter
+
+        arguments:
+        crit -- specified criteria (CQL)
+        limit -- str type!, minimal frequency accepted, this value is exclusive! (i.e. accepted
+                 values must be greater than the limit)
+        sortkey -- a key according to which the distribution will be sorted
+        ml -- str, if non-empty then multi-level freq. distribution is generated
+        ftt_include_empty -- str, TODO
+        rel_mode -- {0, 1} (0 for structural attrs. , 1 for positional ones ??)
+        offset -- an index of the first returned item (applied after sorting)
+        max_items -- a max. number of returned items (None = all the items)
+
+        returns:
+        a dict(Head=..., Items=..., Total=...) where Total is the number of all the items
+        (i.e. regardless of offset and max_items)
+        """
+        dist = self.xfreq_dist_columns(crit, limit, sortkey, ml, ftt_include_empty, rel_mode, collator_locale)
+        return dist.page(offset, max_items) if dist is not None else {}
 
     def xdistribution(self, xrange, yrange):
         """
@@ -379,6 +444,16 @@ class PyConc(manatee.Concordance):
         return list(zip(vals, begs))
 
     def collocs(self, cattr='-', csortfn='m', cbgrfns='mt', cfromw=-5, ctow=5, cminfreq=5, cminbgr=3, max_lines=0):
+        """
+        Calculate collocations ranked by the 'csortfn' function.
+
+        arguments:
+        max_lines -- a max. number of returned (top ranked) items (0 = all the items)
+
+        returns:
+        a dict(Head=..., Items=..., Complete=...) where Complete is True if there are no more
+        items beyond the returned ones
+        """
         statdesc = {'t': translate('T-score'),
                     'm': translate('MI'),
                     '3': translate('MI3'),
@@ -390,12 +465,12 @@ class PyConc(manatee.Concordance):
                     'd': translate('logDice')
                     }
         items = []
+        # one extra item tells us whether the ranking continues beyond max_lines
         colls = manatee.CollocItems(self, cattr, csortfn, cminfreq, cminbgr,
-                                    cfromw, ctow, max_lines)
+                                    cfromw, ctow, max_lines + 1 if max_lines > 0 else 0)
         qfilter = '%%s%i %i 1 [%s="%%s"]' % (cfromw, ctow, cattr)
-        i = 0
         while not colls.eos():
-            if 0 < max_lines < i:
+            if 0 < max_lines <= len(items):
                 break
             items.append(dict(
                 str=colls.get_item(),
@@ -405,11 +480,10 @@ class PyConc(manatee.Concordance):
                 nfilter=qfilter % ('N', escape(colls.get_item()))
             ))
             colls.next()
-            i += 1
 
         head = [{'n': ''}, {'n': 'Freq', 's': 'f'}] + \
             [{'n': statdesc.get(s, s), 's': s} for s in cbgrfns]
-        return dict(Head=head, Items=items)
+        return dict(Head=head, Items=items, Complete=bool(colls.eos()))
 
     def linegroup_info_select(self, selected_count=5):
         """
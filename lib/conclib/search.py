@@ -27,7 +27,7 @@ import plugins
 from plugins.abstract.conc_cache import CalcStatus
 from conclib.pyconc import PyConc
 from conclib.empty import EmptyConc
-from conclib.calc.base import GeneralWorker
+from conclib.calc.base import GeneralWorker, normalize_online_sample, online_sample_size
 from conclib.calc import find_cached_conc_base, wait_for_conc, del_silent
 from conclib.calc.errors import ConcCalculationStatusException
 import bgcalc
@@ -41,18 +41,27 @@ CONC_BG_SYNC_ALIGNED_CORP_THRESHOLD = 50000000
 CONC_BG_SYNC_SINGLE_CORP_THRESHOLD = 2000000000
 
 
+def _user_conc_dir(user_id) -> str:
+    """
+    Return a directory of user's stored concordances. Please note that the path
+    must not be attached to the corpus object as corpus handles are shared among users.
+    """
+    return os.path.join(settings.get('corpora', 'conc_dir'), str(user_id))
+
+
 def _get_async_conc(corp, user_id, q, subchash, samplesize, minsize):
     """
     """
     app = bgcalc.calc_backend_client(settings)
     ans = app.send_task('conc_register', (user_id, corp.corpname, getattr(corp, 'subcname', None),
                                           subchash, q, samplesize, TASK_TIME_LIMIT),
-                        time_limit=CONC_REGISTER_TASK_LIMIT)
+                        time_limit=CONC_REGISTER_TASK_LIMIT,
+                        queue=bgcalc.corpus_task_queue(settings, corp.corpname))
     ans.get(timeout=CONC_REGISTER_WAIT_LIMIT)
     cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
     conc_avail = wait_for_conc(cache_map=cache_map, subchash=subchash, q=q, minsize=minsize)
     if conc_avail:
-        return PyConc(corp, 'l', cache_map.cache_file_path(subchash, q))
+        return PyConc(corp, 'l', cache_map.cache_file_path(subchash, q), conc_dir=_user_conc_dir(user_id))
     else:
         return EmptyConc(corp, cache_map.cache_file_path(subchash, q))
 
@@ -67,27 +76,28 @@ def _get_bg_conc(corp: manatee.Corpus, user_id: int, q: Tuple[str, ...], subchas
     # let's create cache records of the operations we'll have to perform
     if calc_from < len(q):
         for i in range(calc_from, len(q)):
-            cachefile, _ = cache_map.add_to_map(subchash, q[:i + 1], 0, calc_status=CalcStatus())
+            cachefile, _ = cache_map.add_to_map(subchash, q[:i + 1], 0,
+                                                calc_status=CalcStatus(sample_size=online_sample_size(q)))
             if os.path.isfile(cachefile):
                 del_silent(cachefile)
                 logging.getLogger(__name__).warning(f'Removed unbound conc. cache file {cachefile}')
         app = bgcalc.calc_backend_client(settings)
         app.send_task('conc_sync_calculate',
                       (user_id, corp.corpname, getattr(corp, 'subcname', None), subchash, q, samplesize),
-                      time_limit=TASK_TIME_LIMIT)
+                      time_limit=TASK_TIME_LIMIT, queue=bgcalc.corpus_task_queue(settings, corp.corpname))
     # for smaller concordances/corpora there is a chance the data
     # is ready in a few seconds - let's try this:
     conc_avail = wait_for_conc(cache_map=cache_map, subchash=subchash, q=q, minsize=minsize)
     if conc_avail:
-        return PyConc(corp, 'l', cache_map.cache_file_path(subchash, q))
+        return PyConc(corp, 'l', cache_map.cache_file_path(subchash, q), conc_dir=_user_conc_dir(user_id))
     else:
         # return empty yet unfinished concordance to make the client watch the calculation
         return EmptyConc(corp, cache_map.cache_file_path(subchash, q))
 
 
-def _get_sync_conc(worker, corp, q, save, subchash, samplesize):
-    status = worker.create_new_calc_status()
-    conc = worker.compute_conc(corp, q, samplesize)
+def _get_sync_conc(worker, corp, q, save, subchash, samplesize, conc_dir):
+    status = worker.create_new_calc_status(q)
+    conc = worker.compute_conc(corp, q, samplesize, conc_dir)
     conc.sync()  # wait for the computation to finish
     status.finished = True
     status.concsize = conc.size()
@@ -127,10 +137,13 @@ def get_conc(corp, user_id, q: Tuple[str, ...] = None, fromp=0, pagesize=0, asnc
     asnc -- if 1 then KonText spawns an asynchronous process to calculate the concordance
             and will provide results as they are ready
     save -- specifies whether to use a caching mechanism
-    samplesize -- ?
+    samplesize -- a row limit passed to Manatee; for an online sample ('R[size][operation]' as the first
+                  operation) it is used as the sample size in case the operation does not specify one
     """
     if not q:
         return EmptyConc(corp=corp, finished=True)
+    # online sample ('R' operation) => the sample size becomes a part of the query (and the cache key)
+    q = normalize_online_sample(tuple(q), samplesize)
     # complete bg calc. without continuous data fetching => must accept 0
     if _should_be_bg_query(corp, q, asnc):
         minsize = 0
@@ -142,16 +155,9 @@ def get_conc(corp, user_id, q: Tuple[str, ...] = None, fromp=0, pagesize=0, asnc
     conc = EmptyConc(corp=corp, finished=True)
     # try to locate concordance in cache
     if save:
-        calc_from, conc = find_cached_conc_base(corp, subchash, q, minsize)
+        calc_from, conc = find_cached_conc_base(corp, subchash, q, minsize, conc_dir=_user_conc_dir(user_id))
         if calc_from == len(q):
             save = 0
-        if not conc and q[0][0] == 'R':  # online sample
-            q_copy = list(q)
-            q_copy[0] = q[0][1:]
-            q_copy = tuple(q_copy)
-            t, c = find_cached_conc_base(corp, subchash, q_copy, -1)
-            if c:
-                fullsize = c.fullsize()  # TODO fullsize ???
     else:
         calc_from = 1
         asnc = 0
@@ -173,7 +179,7 @@ def get_conc(corp, user_id, q: Tuple[str, ...] = None, fromp=0, pagesize=0, asnc
             # do the calc here and return (OK for small to mid sized corpora without alignments)
             else:
                 conc = _get_sync_conc(worker=worker, corp=corp, q=q, save=save, subchash=subchash,
-                                      samplesize=samplesize)
+                                      samplesize=samplesize, conc_dir=_user_conc_dir(user_id))
         # save additional concordance actions to cache (e.g. sample)
         for act in range(calc_from, len(q)):
             command, args = q[act][0], q[act][1:]
@@ -183,7 +189,7 @@ def get_conc(corp, user_id, q: Tuple[str, ...] = None, fromp=0, pagesize=0, asnc
             if save:
                 cache_map = plugins.runtime.CONC_CACHE.instance.get_mapping(corp)
                 cachefile, stored_status = cache_map.add_to_map(subchash, q[:act + 1], conc.size(),
-                                                                calc_status=worker.create_new_calc_status())
+                                                                calc_status=worker.create_new_calc_status(q))
                 if stored_status and not stored_status.finished:
                     ready = wait_for_conc(cache_map=cache_map,
                                           subchash=subchash, q=q[:act + 1], minsize=-1)
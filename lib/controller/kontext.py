@@ -110,6 +110,7 @@ class AsyncTaskStatus(object):
         status (str): one of
     """
     CATEGORY_SUBCORPUS = 'subcorpus'
+    CATEGORY_WORDLIST = 'wordlist'
 
     def __init__(self, ident: str, label: str, status: int, category: str, args: Dict[str, Any], created: Optional[float] = None, error: Optional[str] = None) -> None:
         self.ident: str = ident
@@ -493,7 +494,7 @@ class Kontext(Controller):
     def _save_query_to_history(self, query_id, conc_data):
         if conc_data.get('lastop_form', {}).get('form_type') in ('query', 'filter') and not self.user_is_anonymous():
             with plugins.runtime.QUERY_STORAGE as qh:
-                qh.write(user_id=self.session_get('user', 'id'), query_id=query_id)
+                qh.write(user_id=self.session_get('user', 'id'), query_id=query_id, conc_data=conc_data)
 
     def _store_conc_params(self) -> List[str]:
         """
@@ -510,13 +511,16 @@ class Kontext(Controller):
                             curr_data=curr_data, prev_data=self._prev_q_data)]
             self._save_query_to_history(ans[0], curr_data)
             lines_groups = prev_data.get('lines_groups', self._lines_groups.serialize())
+            last_data = curr_data if curr_data.get('id') == ans[-1] else prev_data
             for q_idx, op in self._auto_generated_conc_ops:
                 prev = dict(id=ans[-1], lines_groups=lines_groups, q=getattr(self.args, 'q')[:q_idx],
-                            user_id=self.session_get('user', 'id'))
+                            user_id=self.session_get('user', 'id'),
+                            ancestors=last_data.get('ancestors', []) if last_data.get('id') == ans[-1] else [])
                 curr = dict(lines_groups=lines_groups,
                             q=getattr(self.args, 'q')[:q_idx + 1], lastop_form=op.to_dict(),
                             user_id=self.session_get('user', 'id'))
                 ans.append(cp.store(self.session_get('user', 'id'), curr_data=curr, prev_data=prev))
+                last_data = curr if curr.get('id') == ans[-1] else prev
             return ans
 
     def _clear_prev_conc_params(self):
@@ -814,7 +818,6 @@ class Kontext(Controller):
                 if not self._curr_corpus or self.args.usesubcorp and not hasattr(self._curr_corpus, 'subcname'):
                     self._curr_corpus = self.cm.get_Corpus(self.args.corpname, subcname=self.args.usesubcorp,
                                                            corp_variant=self._corpus_variant)
-                self._curr_corpus._conc_dir = self._conc_dir
                 return self._curr_corpus
             except Exception as ex:
                 return fallback_corpus.ErrorCorpus(ex)
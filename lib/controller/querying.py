@@ -25,7 +25,6 @@ from typing import Dict, Any, Optional, List
 from argmapping.query import ConcFormArgs
 from werkzeug import Request
 
-import logging
 
 from controller.kontext import Kontext
 from l10n import corpus_get_conf
@@ -172,22 +171,12 @@ class Querying(Kontext):
     @staticmethod
     def load_pipeline_ops(last_id: str) -> List[ConcFormArgs]:
         ans = []
-        # here checking if instance exists -> we can ignore type check error cp.open does not exist on None
+        # here checking if instance exists -> we can ignore type check error cp.open_chain does not exist on None
         if plugins.runtime.CONC_PERSISTENCE.exists:
             with plugins.runtime.CONC_PERSISTENCE as cp:
-                data = cp.open(last_id)  # type: ignore
-                if data is not None:
+                for data in cp.open_chain(last_id):  # type: ignore
                     ans.append(build_conc_form_args(
                         data.get('corpora', []), data.get('lastop_form', {}), data['id']))
-                limit = 100
-                while data is not None and data.get('prev_id') and limit > 0:
-                    data = cp.open(data['prev_id'])  # type: ignore
-                    ans.insert(0, build_conc_form_args(
-                        data.get('corpora', []), data.get('lastop_form', {}), data['id']))
-                    limit -= 1
-                    if limit == 0:
-                        logging.getLogger(__name__).warning('Reached hard limit when loading query pipeline {0}'.format(
-                            last_id))
         return ans
 
     def _get_structs_and_attrs(self) -> Dict[str, List[str]]:
@@ -18,17 +18,23 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from typing import List, Any, Optional, Tuple, Dict, Union, Set
+from typing import List, Any, Optional, Tuple, Dict, Union, Set, Callable
 from manatee import Corpus, SubCorpus, Concordance, StrVector, PosAttr, Structure
 from array import array
 import re
 
 import os
 import glob
+import mmap
 from hashlib import md5
 from datetime import datetime
 import json
+import sqlite3
 import logging
+import time
+import threading
+import heapq
+from collections import OrderedDict
 
 
 try:
@@ -48,6 +54,7 @@ except ImportError:
     def k_markdown(s): return cgi.escape(s)
 
 import l10n
+from subc_catalogue import SubcCatalogue, subc_signature
 import manatee
 from functools import partial
 from translation import ugettext as _
@@ -103,53 +110,84 @@ class PublishedSubcMetadata(object):
         return PublishedSubcMetadata(**json.loads(data))
 
 
-def _list_public_corp_dir(corpname: str, path: str, value_prefix: Optional[str]) -> List[Dict[str, Any]]:
+def _load_user_subc_entry(corpname: str, spath: str) -> Dict[str, Any]:
+    """
+    Load catalogue metadata of a user subcorpus (this requires the subcorpus to be opened).
+    """
+    subc = open_corpus(corpname, subc_path=spath)
+    return dict(size=subc.search_size(), created=int(os.path.getctime(spath)),
+                human_corpname=subc.get_conf('NAME'), orig_subcname=subc.orig_subcname,
+                description=subc.description, published=subc.is_published)
+
+
+def _load_public_subc_entry(corpname: str, spath: str) -> Dict[str, Any]:
+    """
+    Load catalogue metadata of a published subcorpus (only its '.name' file is read).
+    """
+    meta, desc = get_subcorp_pub_info(spath)
+    return dict(author_id=meta.author_id, author_name=meta.author_name, orig_spath=meta.subcpath,
+                description=desc, created=int(os.path.getctime(spath)))
+
+
+def get_subc_catalogue(root_dir: str) -> SubcCatalogue:
+    """
+    Return a catalogue of subcorpora located in root_dir (a user subcorpora
+    directory or the directory of published subcorpora).
+    """
+    if os.path.basename(os.path.normpath(root_dir)) == 'published':
+        return SubcCatalogue(root_dir, _load_public_subc_entry)
+    return SubcCatalogue(root_dir, _load_user_subc_entry)
+
+
+def update_subc_catalogue(spath: str) -> None:
+    """
+    Update a catalogue entry of a created, published or deleted subcorpus.
+    A failure is only logged as the catalogue is reconciled with the filesystem
+    during listing anyway.
+    """
+    try:
+        get_subc_catalogue(os.path.dirname(os.path.dirname(spath))).refresh(spath)
+    except (sqlite3.Error, OSError) as ex:
+        logging.getLogger(__name__).warning(f'Failed to update subcorpus catalogue for {spath}: {ex}')
+
+
+def _list_public_corp_dir(subc_root: str, entries: List[Dict[str, Any]],
+                          value_prefix: Optional[str]) -> List[Dict[str, Any]]:
     ans: List[Dict[str, Any]] = []
-    subc_root = os.path.dirname(os.path.dirname(path))
-    for item in glob.glob(f'{path}/*.subc'):
-        full_path = os.path.join(path, item)
-        meta, desc = get_subcorp_pub_info(full_path)
-        if meta.subcpath is None or meta.author_name is None or not desc:
+    for entry in entries:
+        if entry['orig_spath'] is None or entry['author_name'] is None or not entry['description']:
             logging.getLogger(__name__).warning(
-                f'Missing metainformation for published subcorpus {item}')
+                f'Missing metainformation for published subcorpus {entry["path"]}')
         else:
             try:
-                ident = os.path.splitext(os.path.basename(item))[0]
-                author_rev = ' '.join(reversed(meta.author_name.split(' '))
-                                      ).lower() if meta.author_name else ''
-                if ident.startswith(value_prefix) or author_rev.startswith(value_prefix.lower()):
+                author_rev = ' '.join(reversed(entry['author_name'].split(' '))
+                                      ).lower() if entry['author_name'] else ''
+                if entry['subcname'].startswith(value_prefix) or author_rev.startswith(value_prefix.lower()):
                     ans.append(dict(
-                        ident=ident,
-                        origName=os.path.splitext(os.path.basename(meta.subcpath))[0],
-                        corpname=corpname,
-                        author=meta.author_name,
-                        description=k_markdown(desc),
-                        created=int(os.path.getctime(full_path)),
-                        userId=int(meta.subcpath.lstrip(subc_root).split(os.path.sep, 1)[0])
+                        ident=entry['subcname'],
+                        origName=os.path.splitext(os.path.basename(entry['orig_spath']))[0],
+                        corpname=entry['corpname'],
+                        author=entry['author_name'],
+                        description=k_markdown(entry['description']),
+                        created=entry['created'],
+                        userId=int(entry['orig_spath'].lstrip(subc_root).split(os.path.sep, 1)[0])
                     ))
             except Exception as ex:
-                logging.getLogger(__name__).warning(f'Broken published subcorpus {full_path}: {ex}')
+                logging.getLogger(__name__).warning(f'Broken published subcorpus {entry["path"]}: {ex}')
     return ans
 
 
 def list_public_subcorpora(subcpath: str, value_prefix: Optional[str] = None,
                            offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
-    data: List[Dict[str, Any]] = []
-    for corp in os.listdir(subcpath):
-        try:
-            data += _list_public_corp_dir(corp, os.path.join(subcpath, corp), value_prefix)
-            if len(data) >= offset + limit:
-                break
-        except Exception as ex:
-            logging.getLogger(__name__).warning(ex)
-    return data[offset:limit]
-
-
-def open_corpus(*args: Any, **kwargs: Any) -> Corpus:
     """
-    Creates a manatee.Corpus instance
+    List published subcorpora matching value_prefix (a subcorpus code or an author's surname).
+    Metadata are read from the catalogue of published subcorpora.
     """
-    return manatee.Corpus(*args, **kwargs)
+    subc_root = os.path.dirname(os.path.normpath(subcpath))
+    corpnames = sorted(item.name for item in os.scandir(subcpath) if item.is_dir())
+    entries = get_subc_catalogue(subcpath).list_subcorpora(corpnames)
+    data = _list_public_corp_dir(subc_root, entries, value_prefix)
+    return data[offset:offset + limit]
 
 
 def create_subcorpus(path: str, corpus: Corpus, structname: str, subquery: str) -> SubCorpus:
@@ -231,8 +269,9 @@ def get_subcorp_pub_info(spath: str) -> Tuple[PublishedSubcMetadata, Optional[st
 def rewrite_subc_desc(publicpath: str, desc: str):
     meta, _ = get_subcorp_pub_info(publicpath)
     with open(os.path.splitext(publicpath)[0] + '.name', 'wb') as fw:
-        fw.write(meta.to_json().encode('utf-8') + '\n\n')
+        fw.write(meta.to_json().encode('utf-8') + b'\n\n')
         fw.write(desc.encode('utf-8'))
+    update_subc_catalogue(publicpath)
 
 
 def mk_publish_links(subcpath: str, publicpath: str, author: str, desc: str):
@@ -274,6 +313,195 @@ def mk_publish_links(subcpath: str, publicpath: str, author: str, desc: str):
         raise ex
     finally:
         os.chdir(orig_cwd)
+    update_subc_catalogue(subcpath)
+    update_subc_catalogue(publicpath)
+
+
+def _get_process_rss() -> Optional[int]:
+    """
+    Return the current resident memory size of the process in bytes
+    (or None if it cannot be determined)
+    """
+    try:
+        with open('/proc/self/statm') as fr:
+            return int(fr.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class CorpusHandleCache(object):
+    """
+    A process-wide LRU cache of opened corpora and subcorpora (i.e. manatee.Corpus
+    and manatee.SubCorpus instances). Each item is stored along with a signature
+    (typically based on files' mtime) and it is considered valid only in case
+    a provided signature matches the stored one.
+    """
+
+    def __init__(self, max_size: int, max_rss: Optional[int] = None) -> None:
+        """
+        arguments:
+        max_size -- max. number of cached items
+        max_rss -- if set then the cache stops growing once the process resident memory
+                   size (in bytes) exceeds the value - each new item then replaces
+                   the least recently used one. Please note that removing items does not
+                   necessarily make the RSS drop (freed memory is not always returned
+                   to the OS) so the value cannot be used to shrink the cache.
+        """
+        self._max_size = max_size
+        self._max_rss = max_rss
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size: Optional[int] = None, max_rss: Optional[int] = None) -> None:
+        with self._lock:
+            if max_size is not None:
+                self._max_size = max_size
+            self._max_rss = max_rss
+            self._trim()
+
+    def _trim(self) -> None:
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    def _rss_exceeded(self) -> bool:
+        return bool(self._max_rss) and (_get_process_rss() or 0) > self._max_rss
+
+    def get(self, key: Tuple, signature: Any) -> Optional[Corpus]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] != signature:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def put(self, key: Tuple, signature: Any, corp: Corpus) -> None:
+        with self._lock:
+            if key not in self._data and len(self._data) > 0 and self._rss_exceeded():
+                # memory limit reached => do not grow, just replace the least recently used item
+                self._data.popitem(last=False)
+            self._data[key] = (signature, corp)
+            self._data.move_to_end(key)
+            self._trim()
+
+    def invalidate(self, test_fn) -> None:
+        """
+        Remove all the items whose keys match the provided test function
+        """
+        with self._lock:
+            for k in [k for k in self._data.keys() if test_fn(k)]:
+                del self._data[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+CORPUS_HANDLE_CACHE_SIZE = 50
+
+# max. number of memory-mapped frequency files (.frq, .arf, .docf) kept open
+FREQ_FILE_CACHE_SIZE = 100
+
+# a minimum interval (in seconds) between two updates of a subcorpus '.used' mark file
+SUBC_USED_MARK_INTERVAL = 3600
+
+_corpus_handle_cache = CorpusHandleCache(CORPUS_HANDLE_CACHE_SIZE)
+
+_freq_file_cache = CorpusHandleCache(FREQ_FILE_CACHE_SIZE)
+
+
+def clear_corpus_handle_cache() -> None:
+    """
+    Remove all the cached corpora/subcorpora handles and mapped frequency
+    files (e.g. on a soft reset)
+    """
+    _corpus_handle_cache.clear()
+    _freq_file_cache.clear()
+    _struct_attr_norms_cache.clear()
+
+
+def configure_corpus_handle_cache(max_size: Optional[int] = None, max_rss: Optional[int] = None) -> None:
+    """
+    Change limits of the corpus handle cache (e.g. a calculation worker may want
+    to keep more corpora open but bounded by its memory)
+
+    arguments:
+    max_size -- max. number of cached corpora/subcorpora (None = keep the current value)
+    max_rss -- a resident memory size of the process (in bytes) above which the cache
+               does not grow anymore (see CorpusHandleCache)
+    """
+    _corpus_handle_cache.configure(max_size, max_rss)
+
+
+def invalidate_corpus(corpname: str) -> None:
+    """
+    Remove cached handles of a corpus and all its subcorpora (e.g. once
+    precalculated frequency data of the corpus changes).
+    """
+    _corpus_handle_cache.invalidate(
+        lambda k: (k[0] == 'corp' and k[1] == corpname) or (k[0] == 'subc' and k[1] == corpname))
+
+
+def open_corpus(corpname: str, subc_path: Optional[str] = None) -> Corpus:
+    """
+    Open a corpus or a subcorpus specified by a path to its data file
+    using the process-wide handle cache (i.e. the returned object may be shared
+    with other callers and must not be modified).
+
+    arguments:
+    corpname -- a corpus identifier (a registry file name)
+    subc_path -- an optional path to a subcorpus data file
+    """
+    cm = CorpusManager()
+    corp = cm._get_cached_corpus(corpname, corpname, '')
+    if subc_path:
+        subcname = os.path.splitext(os.path.basename(subc_path))[0]
+        return cm._get_cached_subcorpus(corpname, subcname, corpname, corp, subc_path, False)
+    return corp
+
+
+def invalidate_subcorpus(spath: str) -> None:
+    """
+    Remove cached handles of a (typically deleted) subcorpus
+    along with its stored content hash.
+    """
+    _corpus_handle_cache.invalidate(lambda k: k[0] == 'subc' and k[2] == spath)
+    _freq_file_cache.invalidate(lambda k: k[0] == 'freqfile' and k[1].startswith(spath[:-4]))
+    try:
+        os.unlink(_subc_hash_path(spath))
+    except OSError:
+        pass
+
+
+def _subc_hash_path(spath: str) -> str:
+    return os.path.splitext(spath)[0] + '.subchash'
+
+
+def _get_subc_hash(spath: str) -> str:
+    """
+    Return an md5 hash of a subcorpus file content. The value is stored
+    along with the file (validated by file mtime and size) to prevent
+    repeated hashing of (possibly large) files.
+    """
+    st = os.stat(spath)
+    hash_path = _subc_hash_path(spath)
+    try:
+        with open(hash_path, 'r') as fr:
+            mtime, size, subchash = fr.read().split()
+            if int(mtime) == st.st_mtime_ns and int(size) == st.st_size:
+                return subchash
+    except (OSError, ValueError):
+        pass
+    with open(spath, 'rb') as subcinfo:
+        subchash = md5(subcinfo.read()).hexdigest()
+    try:
+        with open(hash_path, 'w') as fw:
+            fw.write(f'{st.st_mtime_ns} {st.st_size} {subchash}')
+    except OSError as ex:
+        logging.getLogger(__name__).warning(f'Failed to store subcorpus hash {hash_path}: {ex}')
+    return subchash
 
 
 class CorpusManager(object):
@@ -293,18 +521,23 @@ class CorpusManager(object):
                 return os.path.splitext(os.path.basename(os.path.realpath(test)))[0]
         return None
 
+    @staticmethod
+    def _mark_subc_used(subc: SubCorpus) -> None:
+        now = time.time()
+        if now - getattr(subc, 'used_marked', 0) > SUBC_USED_MARK_INTERVAL:
+            try:
+                open(subc.spath[:-4] + 'used', 'w')
+            except IOError:
+                pass
+            subc.used_marked = now
+
     def _open_subcorpus(self, corpname: str, subcname: str, corp: Corpus, spath: str, decode_desc: bool) -> Corpus:
         subc = manatee.SubCorpus(corp, spath)
         subc.corp = corp
         subc.spath = spath
-        try:
-            open(spath[:-4] + 'used', 'w')
-        except IOError:
-            pass
         subc.corpname = str(corpname)  # never unicode (paths)
         subc.subcname = subcname
-        with open(spath, 'rb') as subcinfo:
-            subc.subchash = md5(subcinfo.read()).hexdigest()
+        subc.subchash = _get_subc_hash(spath)
         subc.created = datetime.fromtimestamp(int(os.path.getctime(spath)))
         subc.is_published = subcorpus_is_published(spath)
         meta, desc = get_subcorp_pub_info(os.path.splitext(spath)[0] + '.name')
@@ -322,6 +555,36 @@ class CorpusManager(object):
             subc.description = None
         return subc
 
+    def _get_cached_subcorpus(self, corpname: str, subcname: str, registry_file: str, corp: Corpus, spath: str,
+                              decode_desc: bool) -> Corpus:
+        key = ('subc', registry_file, spath, subcname, decode_desc)
+        signature = subc_signature(spath)
+        subc = _corpus_handle_cache.get(key, signature)
+        if subc is None or subc.corp is not corp:
+            subc = self._open_subcorpus(corpname, subcname, corp, spath, decode_desc)
+            _corpus_handle_cache.put(key, signature, subc)
+        self._mark_subc_used(subc)
+        return subc
+
+    def _get_cached_corpus(self, corpname: str, registry_file: str, corp_variant: str) -> Corpus:
+        fullpath = os.path.join(os.environ['MANATEE_REGISTRY'], registry_file)
+        if not os.path.isfile(fullpath):
+            self._ensure_reg_file(registry_file, corp_variant)
+        key = ('corp', registry_file)
+        try:
+            signature = os.path.getmtime(fullpath)
+        except OSError:
+            signature = None
+        corp = _corpus_handle_cache.get(key, signature)
+        if corp is None:
+            corp = manatee.Corpus(registry_file)
+            corp.corpname = str(corpname)  # never unicode (paths)
+            corp.is_published = False
+            corp.author = None
+            corp.author_id = None
+            _corpus_handle_cache.put(key, signature, corp)
+        return corp
+
     def get_Corpus(self, corpname: str, corp_variant: str = '', subcname: str = '', decode_desc: bool = True) -> Corpus:
         """
         args:
@@ -338,12 +601,7 @@ class CorpusManager(object):
         if cache_key in self._cache:
             return self._cache[cache_key]
         registry_file = os.path.join(corp_variant, corpname) if corp_variant else corpname
-        self._ensure_reg_file(registry_file, corp_variant)
-        corp = manatee.Corpus(registry_file)
-        corp.corpname = str(corpname)  # never unicode (paths)
-        corp.is_published = False
-        corp.author = None
-        corp.author_id = None
+        corp = self._get_cached_corpus(corpname, registry_file, corp_variant)
 
         # NOTE: line corp.cm = self (as present in NoSke and older KonText versions) has
         # been causing file descriptor leaking for some operations (e.g. corp.get_attr).
@@ -355,7 +613,8 @@ class CorpusManager(object):
             for sp in self.subcpath:
                 spath = os.path.join(sp, corpname, subcname + '.subc')
                 if os.path.isfile(spath):
-                    subc = self._open_subcorpus(corpname, subcname, corp, spath, decode_desc)
+                    subc = self._get_cached_subcorpus(
+                        corpname, subcname, registry_file, corp, spath, decode_desc)
                     self._cache[cache_key] = subc
                     return subc
             raise RuntimeError(_('Subcorpus "%s" not found') % subcname)
@@ -406,8 +665,13 @@ class CorpusManager(object):
                 for s in self.subc_files(corpname)]
 
 
-def add_block_items(items: List[Dict[str, Any]], attr: str = 'class', val: str = 'even', block_size: int = 3) -> List[Dict[str, Any]]:
-    for i in [i for i in range(len(items)) if (i / block_size) % 2]:
+def add_block_items(items: List[Dict[str, Any]], attr: str = 'class', val: str = 'even', block_size: int = 3,
+                    offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    arguments:
+    offset -- an index of the first item within a whole list (in case 'items' is a page of a longer list)
+    """
+    for i in [i for i in range(len(items)) if ((i + offset) / block_size) % 2]:
         items[i][attr] = val
     return items
 
@@ -436,12 +700,19 @@ def get_wordlist_length(corp: Corpus, wlattr: str, wlpat: str, wlnums: str, wlmi
     return i
 
 
-def _wordlist_by_pattern(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, words, blacklist, wlnums, wlsort, wlmaxitems):
+# a progress callback (see ranked_wordlist()) is called each time this portion of work is done
+WORDLIST_PROGRESS_STEP = 0.1
+
+
+def _wordlist_by_pattern(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, words, blacklist, wlnums, wlsort, wlmaxitems,
+                         on_progress=None):
     try:
         gen = attr.regexp2ids(enc_pattern, 0, excl_pattern)
     except TypeError:
         gen = attr.regexp2ids(enc_pattern, 0)
     items = []
+    id_range = attr.id_range()
+    next_progress = WORDLIST_PROGRESS_STEP
     while not gen.end():
         if len(items) > 5 * wlmaxitems:
             if wlsort == 'f':
@@ -452,6 +723,10 @@ def _wordlist_by_pattern(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, w
                 del items[wlmaxitems:]
 
         wid = gen.next()
+        # ids are generated in an ascending order for most of the patterns so this is just an estimate
+        if on_progress is not None and id_range and wid / id_range >= next_progress:
+            on_progress(wid / id_range, items)
+            next_progress = wid / id_range + WORDLIST_PROGRESS_STEP
         frq = attrfreq[wid]
         if not frq:
             continue
@@ -465,9 +740,10 @@ def _wordlist_by_pattern(attr, attrfreq, enc_pattern, excl_pattern, wlminfreq, w
     return items
 
 
-def _wordlist_from_list(attr, attrfreq, words, blacklist, wlsort, wlminfreq, wlmaxitems, wlnums):
+def _wordlist_from_list(attr, attrfreq, words, blacklist, wlsort, wlminfreq, wlmaxitems, wlnums, on_progress=None):
     items = []
-    for word in words:
+    next_progress = WORDLIST_PROGRESS_STEP
+    for i, word in enumerate(words):
         if len(items) > 5 * wlmaxitems:
             if wlsort == 'f':
                 items.sort(key=lambda x: x[0])
@@ -476,6 +752,9 @@ def _wordlist_from_list(attr, attrfreq, words, blacklist, wlsort, wlminfreq, wlm
                 items.sort(key=lambda x: x[1])
                 del items[wlmaxitems:]
 
+        if on_progress is not None and i / len(words) >= next_progress:
+            on_progress(i / len(words), items)
+            next_progress = i / len(words) + WORDLIST_PROGRESS_STEP
         id = attr.str2id(word)
         if id == -1:
             frq = 0
@@ -491,13 +770,9 @@ def _wordlist_from_list(attr, attrfreq, words, blacklist, wlsort, wlminfreq, wlm
 
 def _get_attrfreq(corp, attr, wlattr, wlnums):
     if '.' in wlattr:  # attribute of a structure
-        struct = corp.get_struct(wlattr.split('.')[0])
-        if wlnums == 'doc sizes':
-            normvals = dict([(struct.beg(i), struct.end(i) - struct.beg(i))
-                             for i in range(struct.size())])
-        else:
-            normvals = dict([(struct.beg(i), 1) for i in range(struct.size())])
-        attrfreq = dict([(i, doc_sizes(corp, struct, wlattr, i, normvals))
+        struct_name, attr_name = wlattr.split('.', 1)
+        norms = get_struct_attr_norms(corp, struct_name, attr_name)
+        attrfreq = dict([(i, doc_sizes(norms, attr.id2str(i), wlnums))
                          for i in range(attr.id_range())])
     else:  # positional attribute
         attrfreq = frq_db(corp, wlattr, wlnums)
@@ -509,13 +784,59 @@ def wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', w
     """
     Note: 'words' and 'blacklist' are expected to contain utf-8-encoded strings.
     """
+    items = ranked_wordlist(corp=corp, words=words, wlattr=wlattr, wlpat=wlpat, wlminfreq=wlminfreq,
+                            wlmaxitems=wlmaxitems, wlsort=wlsort, blacklist=blacklist, wlnums=wlnums,
+                            include_nonwords=include_nonwords)
+    return add_block_items([{'str': w, 'freq': f} for w, f in items])
+
+
+def ranked_wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', wlpat: str = '', wlminfreq: int = 5,
+                    wlmaxitems: int = 100, wlsort: str = '', blacklist: Optional[Set[str]] = None,
+                    wlnums: Optional[str] = 'frq', include_nonwords: int = 0,
+                    on_progress: Optional[Callable[[float, List[Tuple[str, Union[int, float]]]], None]] = None,
+                    progress_max_items: Optional[int] = None) -> List[Tuple[str, Union[int, float]]]:
+    """
+    Same as wordlist() but the items are returned as (word, freq) tuples.
+
+    arguments:
+    on_progress -- an optional function called repeatedly during the calculation with
+                   a (roughly estimated) ratio of processed data and ranked items found so far
+    progress_max_items -- max. number of top ranked items passed to on_progress (None = all)
+    """
     blacklist = set(w for w in blacklist) if blacklist else set()
     words = set(w for w in words) if words else set()
     attr = corp.get_attr(wlattr)
     attrfreq = _get_attrfreq(corp=corp, attr=attr, wlattr=wlattr, wlnums=wlnums)
+    by_id = not words or wlpat != '.*'
+
+    def rank(items):
+        if by_id:
+            items = [(f, attr.id2str(i)) for (f, i) in items]
+        if wlsort == 'f':
+            items = sorted(items, key=lambda x: x[0], reverse=True)
+        else:
+            items = sorted(items, key=lambda x: x[1])
+        del items[wlmaxitems:]
+        return [(w, f) for f, w in items]
+
+    def rank_top(items, n):
+        # the same as rank(items)[:n] but only n items are sorted and decoded
+        if wlsort == 'f':
+            top = heapq.nlargest(n, items, key=lambda x: x[0])
+        else:
+            top = heapq.nsmallest(n, items, key=lambda x: attr.id2str(x[1]) if by_id else x[1])
+        return rank(top)
+
+    def progress_fn(ratio, items):
+        if progress_max_items is None:
+            on_progress(ratio, rank(items))
+        else:
+            on_progress(ratio, rank_top(items, min(progress_max_items, wlmaxitems)))
+
     if words and wlpat == '.*':  # word list just for given words
         items = _wordlist_from_list(attr=attr, attrfreq=attrfreq, words=words, blacklist=blacklist, wlsort=wlsort,
-                                    wlminfreq=wlminfreq, wlmaxitems=wlmaxitems, wlnums=wlnums)
+                                    wlminfreq=wlminfreq, wlmaxitems=wlmaxitems, wlnums=wlnums,
+                                    on_progress=progress_fn if on_progress else None)
     else:  # word list according to pattern
         if not include_nonwords:
             nwre = corp.get_conf('NONWORDRE')
@@ -523,26 +844,150 @@ def wordlist(corp: Corpus, words: Optional[Set[str]] = None, wlattr: str = '', w
             nwre = ''
         items = _wordlist_by_pattern(attr=attr, enc_pattern=wlpat.strip(), excl_pattern=nwre,
                                      wlminfreq=wlminfreq, words=words, blacklist=blacklist, wlnums=wlnums,
-                                     wlsort=wlsort, wlmaxitems=wlmaxitems, attrfreq=attrfreq)
+                                     wlsort=wlsort, wlmaxitems=wlmaxitems, attrfreq=attrfreq,
+                                     on_progress=progress_fn if on_progress else None)
+    return rank(items)
+
 
-    if not words or wlpat != '.*':
-        items = [(f, attr.id2str(i)) for (f, i) in items]
-    if wlsort == 'f':
-        items = sorted(items, key=lambda x: x[0], reverse=True)
+def doc_sizes(norms: 'StructAttrNorms', value: str, wlnums: str) -> int:
+    """
+    Return a size of texts with the provided structural attribute value. For
+    wlnums == 'doc sizes' the size is in tokens, otherwise the number of structures
+    is returned.
+    """
+    if wlnums == 'doc sizes':
+        return norms.tokens(value)
+    return norms.structs(value)
+
+
+class StructAttrNorms(object):
+    """
+    A precomputed index of sizes of all the values of a structural attribute
+    within a corpus (or a subcorpus). For each value, a number of tokens, a number
+    of documents (see the DOCSTRUCTURE registry directive) and a number of structures
+    is available.
+    """
+
+    def __init__(self, data: Dict[str, List[int]]) -> None:
+        """
+        arguments:
+        data -- a dict value => [num. of tokens, num. of documents, num. of structures]
+        """
+        self._data = data
+
+    def tokens(self, value: str) -> int:
+        return self._data[value][0] if value in self._data else 0
+
+    def structs(self, value: str) -> int:
+        return self._data[value][2] if value in self._data else 0
+
+    def values(self) -> List[str]:
+        return list(self._data.keys())
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        return self._data
+
+
+# max. number of loaded norms kept in memory
+STRUCT_NORMS_CACHE_SIZE = 100
+
+# an in-process cache of already loaded norms; key is (corpus registry, subc. path, struct.attr)
+_struct_attr_norms_cache = CorpusHandleCache(STRUCT_NORMS_CACHE_SIZE)
+
+STRUCT_NORMS_SUBC_TTL = 3600 * 24 * 7
+
+
+def _struct_attr_norms_signature(corp: Corpus) -> str:
+    """
+    Return a string which changes each time the corpus
+    (or the subcorpus) data change.
+    """
+    if getattr(corp, 'spath', None):
+        return getattr(corp, 'subchash', None) or str(os.path.getmtime(corp.spath))
+    try:
+        return str(corp_mtime(corp))
+    except OSError:
+        return ''
+
+
+def _calc_struct_attr_norms(corp: Corpus, struct_name: str, attr_name: str) -> StructAttrNorms:
+    """
+    Calculate sizes of all the values of a structural attribute
+    in a single pass over the structure.
+    """
+    struct = corp.get_struct(struct_name)
+    attr = struct.get_attr(attr_name)
+    doc_struct_name = corp.get_conf('DOCSTRUCTURE')
+    doc_struct = None
+    if doc_struct_name and doc_struct_name != struct_name:
+        try:
+            doc_struct = corp.get_struct(doc_struct_name)
+        except Exception as ex:
+            logging.getLogger(__name__).warning(f'Failed to open document structure {doc_struct_name}: {ex}')
+
+    nums: Union[List[int], range]
+    if is_subcorpus(corp):
+        nums = []
+        r = corp.filter_query(struct.whole())
+        while not r.end():
+            nums.append(struct.num_at_pos(r.peek_beg()))
+            r.next()
     else:
-        items = sorted(items, key=lambda x: x[1])
-    del items[wlmaxitems:]
-    return add_block_items([{'str': w, 'freq': f}
-                            for f, w in items])
+        nums = range(struct.size())
+
+    data: Dict[str, List[int]] = {}
+    last_docs: Dict[str, int] = {}
+    for num in nums:
+        value = attr.pos2str(num)
+        beg = struct.beg(num)
+        if value not in data:
+            data[value] = [0, 0, 0]
+        item = data[value]
+        item[0] += struct.end(num) - beg
+        item[2] += 1
+        if doc_struct is not None:
+            doc_num = doc_struct.num_at_pos(beg)
+            if last_docs.get(value) != doc_num:  # structures are visited in the corpus order
+                item[1] += 1
+                last_docs[value] = doc_num
+        else:
+            item[1] += 1
+    return StructAttrNorms(data)
+
 
+def get_struct_attr_norms(corp: Corpus, struct_name: str, attr_name: str) -> StructAttrNorms:
+    """
+    Return sizes of all the values of a structural attribute. The index is calculated
+    just once per corpus (or subcorpus) and stored using the 'db' plug-in. A change
+    of corpus data or subcorpus content invalidates the index.
 
-def doc_sizes(corp: Corpus, struct: Structure, attrname: str, i: int, normvals: Dict[int, int]) -> int:
-    r = corp.filter_query(struct.attr_val(attrname.split('.')[1], i))
-    cnt = 0
-    while not r.end():
-        cnt += normvals[r.peek_beg()]
-        r.next()
-    return cnt
+    arguments:
+    corp -- a manatee.Corpus or manatee.SubCorpus instance (as returned by CorpusManager)
+    struct_name -- a structure name (e.g. 'doc')
+    attr_name -- an attribute of the structure (e.g. 'genre')
+    """
+    subc_path = getattr(corp, 'spath', None) or ''
+    cache_key = (corp.get_confpath(), subc_path, f'{struct_name}.{attr_name}')
+    signature = _struct_attr_norms_signature(corp)
+    cached = _struct_attr_norms_cache.get(cache_key, signature)
+    if cached is not None:
+        return cached
+
+    db = plugins.runtime.DB.instance
+    # subcorpora are identified by their content so users with identical subcorpora share the index
+    db_key = 'struct_norms:{0}:{1}:{2}.{3}'.format(
+        getattr(corp, 'corpname', corp.get_conffile()), signature if subc_path else '', struct_name, attr_name)
+    stored = db.get(db_key) if db is not None else None
+    if stored and stored.get('signature') == signature:
+        norms = StructAttrNorms(stored['data'])
+    else:
+        norms = _calc_struct_attr_norms(corp, struct_name, attr_name)
+        if db is not None:
+            db.set(db_key, dict(signature=signature, data=norms.to_dict()))
+            if subc_path:
+                db.set_ttl(db_key, STRUCT_NORMS_SUBC_TTL)
+    _struct_attr_norms_cache.put(cache_key, signature, norms)
+    return norms
 
 
 def texttype_values(corp: Corpus, subcorpattrs: str, maxlistsize: int, shrink_list: Union[Tuple[str, ...], List[str]] = (), collator_locale: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -741,15 +1186,59 @@ class MissingSubCorpFreqFile(Exception):
         return self._corpus
 
 
-def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) -> array:
-    import array
+def _map_freq_file(filename: str, typecode: str) -> memoryview:
+    """
+    Return a read-only numeric view (typecode 'f', 'i' or 'q') of a whole
+    frequency file. Mapped files are shared within a process and remapped
+    once they change (mtime, size).
+
+    raises:
+    IOError in case the file cannot be opened
+    """
+    st = os.stat(filename)
+    key = ('freqfile', filename, typecode)
+    signature = (st.st_mtime_ns, st.st_size)
+    view = _freq_file_cache.get(key, signature)
+    if view is None:
+        itemsize = array(typecode).itemsize
+        if st.st_size < itemsize:
+            view = memoryview(array(typecode))
+        else:
+            with open(filename, 'rb') as fr:
+                mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mm)[:st.st_size - st.st_size % itemsize].cast(typecode)
+        _freq_file_cache.put(key, signature, view)
+    return view
+
+
+def _freq_file_range(filename: str, typecode: str, id_range: int) -> memoryview:
+    """
+    Return a view of the first id_range items of a frequency file.
+
+    raises:
+    IOError in case the file cannot be opened
+    EOFError in case the file contains less than id_range items
+    """
+    view = _map_freq_file(filename, typecode)
+    if len(view) < id_range:
+        _freq_file_cache.invalidate(lambda k: k[0] == 'freqfile' and k[1] == filename)
+        raise EOFError('{0}: expected {1} items, found {2}'.format(filename, id_range, len(view)))
+    return view[:id_range]
+
+
+def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) -> Union[array, memoryview]:
+    """
+    Return frequencies (nums = 'frq', 'docf' or 'arf') of the attribute
+    values (indexed by their ids). Precalculated frequency files are
+    not read into memory - a read-only view of a memory-mapped file
+    is returned instead (i.e. slicing the result does not copy data).
+    """
     filename = (subcorp_base_file(corp, attrname) + '.' + nums)
     if not id_range:
         id_range = corp.get_attr(attrname).id_range()
     if nums == 'arf':
-        frq = array.array('f')
         try:
-            frq.fromfile(open(filename, 'rb'), id_range)  # type: ignore
+            frq = _freq_file_range(filename, 'f', id_range)
         except IOError as ex:
             raise MissingSubCorpFreqFile(corp, ex)
         except EOFError as ex:
@@ -759,8 +1248,7 @@ def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) ->
         try:
             if corp.get_conf('VIRTUAL') and not hasattr(corp, 'spath') and nums == 'frq':
                 raise IOError
-            frq = array.array('i')
-            frq.fromfile(open(filename, 'rb'), id_range)  # type: ignore
+            frq = _freq_file_range(filename, 'i', id_range)
         except EOFError as ex:
             os.remove(filename.rsplit('.', 1)[0] + '.docf')
             os.remove(filename.rsplit('.', 1)[0] + '.arf')
@@ -768,12 +1256,11 @@ def frq_db(corp: Corpus, attrname: str, nums: str = 'frq', id_range: int = 0) ->
             raise MissingSubCorpFreqFile(corp, ex)
         except IOError:
             try:
-                frq = array.array('l')
-                frq.fromfile(open(filename + '64', 'rb'), id_range)  # type: ignore
-            except IOError as ex:
+                frq = _freq_file_range(filename + '64', 'q', id_range)
+            except (IOError, EOFError) as ex:
                 if not hasattr(corp, 'spath') and nums == 'frq':
                     a = corp.get_attr(attrname)
-                    frq.fromlist([a.freq(i) for i in range(a.id_range())])
+                    frq = array('q', [a.freq(i) for i in range(a.id_range())])
                 else:
                     raise MissingSubCorpFreqFile(corp, ex)
     return frq
@@ -16,7 +16,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-from typing import Any, List, Mapping, Dict, Tuple, Union
+from typing import Any, List, Mapping, Dict, Tuple, Union, Iterator
 
 from collections import defaultdict
 import re
@@ -288,11 +288,7 @@ class Kwic(object):
             pagination.last_page = 1
 
         out.concsize = self.conc.size()
-
-        if is_subcorpus(self.corpus):
-            out.result_arf = ''
-        else:
-            out.result_arf = round(self.conc.compute_ARF(), 2)
+        out.result_arf = self.get_result_arf()
 
         if is_subcorpus(self.corpus):
             corpsize = self.corpus.search_size(
@@ -308,6 +304,39 @@ class Kwic(object):
         out.pagination = pagination.export()
         return dict(out)
 
+    def get_result_arf(self) -> Union[float, str]:
+        if is_subcorpus(self.corpus):
+            return ''
+        return round(self.conc.compute_ARF(), 2)
+
+    def kwicpage_chunks(self, args: KwicPageArgs, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Generates lines (including aligned ones) of a range specified by
+        the 'args' (fromp, pagesize, line_offset) in chunks of 'chunk_size'
+        lines. Unlike kwicpage(), this allows processing large concordance
+        ranges (e.g. when exporting) with bounded memory.
+
+        arguments:
+            args -- a KwicArgs instance
+            chunk_size -- max. number of lines in a chunk
+        """
+        args.refs = getattr(args, 'refs', '').replace('.MAP_OUP', '')  # to be removed ...
+        fromline = args.calc_fromline()
+        toline = min(args.calc_toline(), self.conc.size())
+        for chunk_from in range(fromline, toline, chunk_size):
+            chunk_to = min(chunk_from + chunk_size, toline)
+            if args.alignlist:  # add_aligns() leaves the concordance switched to an aligned corpus
+                self.conc.switch_aligned(self.conc.orig_corp.get_conffile())
+            out = KwicPageData()
+            out.Lines = self.kwiclines(args.create_kwicline_args(fromline=chunk_from, toline=chunk_to))
+            self.add_aligns(out, args.create_kwicline_args(
+                speech_segment=None, fromline=chunk_from, toline=chunk_to))
+            if args.hidenone:
+                for line, part in itertools.product(out.Lines, ('Kwic', 'Left', 'Right')):
+                    for item in line[part]:
+                        item['str'] = item['str'].replace('===NONE===', '')
+            yield out.Lines
+
     def add_aligns(self, result, args):
         """
         Adds lines from aligned corpora. Method modifies passed KwicPageData instance by setting
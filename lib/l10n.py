@@ -36,7 +36,6 @@ internationalisation of KonText:
 from typing import Dict, Any
 
 import re
-from functools import cmp_to_key
 from threading import local
 try:
     from icu import Locale, Collator
@@ -56,6 +55,9 @@ except ImportError:
         def compare(self, s1, s2):
             return locale.strcoll(s1, s2)
 
+        def getSortKey(self, s):
+            return locale.strxfrm(s)
+
         @staticmethod
         def createInstance(locale):
             return Collator(locale)
@@ -76,12 +78,12 @@ def sort(iterable, loc, key=None, reverse=False):
     reverse -- whether the result should be in reversed order (default is False)
     """
     collator = Collator.createInstance(Locale(loc))
+    # collation keys are computed just once per item (compared to O(n log n) calls of compare())
     if key is None:
-        kf = cmp_to_key(collator.compare)
+        kf = collator.getSortKey
     else:
-        def tmp(v1, v2):
-            return collator.compare(key(v1), key(v2))
-        kf = cmp_to_key(tmp)
+        def kf(v):
+            return collator.getSortKey(key(v))
     return sorted(iterable, key=kf, reverse=reverse)
 
 
@@ -44,7 +44,9 @@ class CalcStatus(object):
     def __init__(self, task_id: Optional[str] = None, pid: Optional[int] = None, created: Optional[int] = None,
                  last_upd: Optional[int] = None, concsize: Optional[int] = 0, fullsize: Optional[int] = 0,
                  relconcsize: Optional[int] = 0, arf: Optional[float] = 0,
-                 error: Union[str, BaseException, None] = None, finished: Optional[bool] = False) -> None:
+                 error: Union[str, BaseException, None] = None, finished: Optional[bool] = False,
+                 arf_file_mtime: Optional[float] = None, arf_file_size: Optional[int] = None,
+                 sample_size: Optional[int] = 0, last_access: Optional[int] = None) -> None:
         self.task_id: Optional[str] = task_id
         self.pid = pid if pid else os.getpid()
         self.created = created if created else int(time.time())
@@ -53,8 +55,16 @@ class CalcStatus(object):
         self.fullsize = fullsize
         self.relconcsize = relconcsize
         self.arf = arf
+        # mtime and size of the cache file the 'arf' value has been calculated for
+        self.arf_file_mtime = arf_file_mtime
+        self.arf_file_size = arf_file_size
         self.error: str = str(error) if isinstance(error, BaseException) else error
         self.finished = finished
+        # a requested size of an online random sample ('R' operation); 0 for a regular concordance
+        self.sample_size = sample_size
+        # the last time the cached result has been reused (see AbstractConcCache.mark_used);
+        # please note that the cache file itself must not be touched as it would invalidate its ARF
+        self.last_access = last_access
 
     def to_dict(self) -> Dict[str, Any]:
         return dict(self.__dict__)
@@ -68,6 +78,14 @@ class CalcStatus(object):
                                        f', limit: {time_limit})')
         return None
 
+    def has_valid_arf(self, file_stat: os.stat_result) -> bool:
+        """
+        Test whether the stored ARF value has been calculated for
+        the cache file described by the provided 'file_stat'.
+        """
+        return (self.arf is not None and self.arf_file_mtime == file_stat.st_mtime and
+                self.arf_file_size == file_stat.st_size)
+
     def has_some_result(self, minsize: int) -> bool:
         return minsize == -1 and self.finished or self.concsize >= minsize
 
@@ -82,6 +100,36 @@ class CalcStatus(object):
         return self
 
 
+class CalcStatusListener(object):
+    """
+    A listener used by processes waiting for a concordance calculation
+    to change its status. This default implementation just sleeps for
+    a gradually increasing time (i.e. it polls). Cache implementations
+    able to notify waiting processes should provide their own variant.
+    """
+
+    def __init__(self) -> None:
+        self._num_waits = 0
+
+    def wait(self, timeout: float) -> None:
+        """
+        Block until a status change may have happened but no longer
+        than 'timeout' seconds. A caller is expected to re-read the
+        calculation status once the method returns.
+        """
+        self._num_waits += 1
+        time.sleep(max(0, min(self._num_waits * 0.1, timeout)))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'CalcStatusListener':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class AbstractConcCache(abc.ABC):
 
     @abc.abstractmethod
@@ -100,6 +148,14 @@ class AbstractConcCache(abc.ABC):
     def get_calc_status(self, subchash: str, query: QueryType) -> CalcStatus:
         pass
 
+    def get_prefix_calc_statuses(self, subchash: Optional[str], query: QueryType) -> List[Optional[CalcStatus]]:
+        """
+        Return calculation statuses of all the query prefixes (i.e. query[:1], query[:2], ...,
+        query[:]) where missing entries are represented by None. Implementations should
+        perform this as a single (batched) lookup.
+        """
+        return [self.get_calc_status(subchash, query[:i + 1]) for i in range(len(query))]
+
     @abc.abstractmethod
     def refresh_map(self):
         """
@@ -175,6 +231,23 @@ class AbstractConcCache(abc.ABC):
     def update_calc_status(self, subchash: Optional[str], query: Tuple[str, ...], **kw):
         pass
 
+    def mark_used(self, subchash: Optional[str], query: QueryType):
+        """
+        Record that a cached concordance has been reused so cache clean-up
+        can keep frequently used entries (see CalcStatus.last_access).
+        """
+        self.update_calc_status(subchash, query, last_access=int(time.time()))
+
+    def get_calc_status_listener(self, subchash: Optional[str], query: QueryType) -> CalcStatusListener:
+        """
+        Return a listener which allows waiting for calculation status changes
+        of a specific entry. Please note that the listener should be obtained
+        before the status is read for the first time to prevent missed notifications.
+
+        By default, a polling listener is returned.
+        """
+        return CalcStatusListener()
+
 
 class AbstractCacheMappingFactory(abc.ABC):
     """
@@ -17,7 +17,11 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import abc
-from typing import Dict, Optional, Tuple, Any
+import logging
+from typing import Dict, List, Optional, Tuple, Any
+
+# max. number of operations in a chain (query pipeline) handled as a whole
+MAX_CHAIN_LENGTH = 100
 
 
 class AbstractConcPersistence(abc.ABC):
@@ -66,6 +70,61 @@ class AbstractConcPersistence(abc.ABC):
         a dictionary containing operation data or None if nothing is found
         """
 
+    def open_many(self, data_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Load operation data of multiple operations. Implementations should
+        perform this as a single (batched) lookup.
+
+        arguments:
+        data_ids -- a list of unique IDs of operation data
+
+        returns:
+        a dictionary data_id => operation data (or None if nothing is found)
+        """
+        return dict((data_id, self.open(data_id)) for data_id in data_ids)
+
+    def open_chain(self, data_id: str, max_length: int = MAX_CHAIN_LENGTH) -> List[Dict]:
+        """
+        Load an operation along with all its ancestors (i.e. operations linked
+        via 'prev_id'). Ancestor IDs stored along with operations (see mk_ancestors())
+        are loaded via open_many() so a whole chain typically takes two batches.
+        Operations stored without the ancestor IDs are loaded one by one.
+
+        arguments:
+        data_id -- an ID of the last operation of the chain
+        max_length -- max. number of operations to load
+
+        returns:
+        a list of operation data starting with the first operation
+        of the chain (an empty list if data_id is not found)
+        """
+        ans = []
+        batch = [data_id]
+        while len(batch) > 0:
+            loaded = self.open_many(batch)
+            for item_id in batch:
+                if loaded.get(item_id) is None:  # broken chain
+                    logging.getLogger(__name__).warning(f'Operation {item_id} of chain {data_id} not found')
+                    return list(reversed(ans))
+                ans.append(loaded[item_id])
+            prev_id = ans[-1].get('prev_id')
+            if not prev_id:
+                break
+            if len(ans) >= max_length:
+                logging.getLogger(__name__).warning(f'Reached hard limit when loading query pipeline {data_id}')
+                break
+            batch = (ans[-1].get('ancestors') or [prev_id])[:max_length - len(ans)]
+        return list(reversed(ans))
+
+    @staticmethod
+    def mk_ancestors(prev_data: Dict) -> List[str]:
+        """
+        Create a list of ancestor IDs (the nearest first) of an operation
+        following prev_data. Implementations should store the list along with
+        new operations (as 'ancestors') to allow batched loading of whole chains.
+        """
+        return ([prev_data['id']] + prev_data.get('ancestors', []))[:MAX_CHAIN_LENGTH]
+
     @abc.abstractmethod
     def store(self, user_id: int, curr_data: Dict, prev_data: Optional[Dict] = None) -> str:
         """
@@ -17,11 +17,39 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import abc
-from typing import Union, List, Dict
+import time
+from typing import Union, List, Dict, Optional
 
 Serializable = Union[int, float, str, bool, list, dict, None]
 
 
+class Subscription(object):
+    """
+    A subscription to a notification channel (see KeyValueStorage.subscribe()).
+    This default implementation receives no messages - it just waits for a gradually
+    increasing time so a caller can poll for the respective change.
+    """
+
+    POLL_STEP = 0.1
+
+    def __init__(self) -> None:
+        self._num_waits = 0
+
+    def get_message(self, timeout: float) -> Optional[Serializable]:
+        """
+        Wait for a message at most 'timeout' seconds.
+
+        returns:
+        a JSON-decoded message or None if nothing has been received
+        """
+        self._num_waits += 1
+        time.sleep(max(0, min(self._num_waits * self.POLL_STEP, timeout)))
+        return None
+
+    def close(self) -> None:
+        pass
+
+
 class KeyValueStorage(abc.ABC):
     """
     A general key-value storage is a core data storage for KonText and its default
@@ -221,6 +249,84 @@ class KeyValueStorage(abc.ABC):
         key -- data access key
         """
 
+    def get_multi(self, keys: List[str]) -> List[Serializable]:
+        """
+        Return values stored under the passed keys (in the order of the keys).
+        Missing keys produce None. Back-ends are encouraged to implement this
+        using a single round-trip.
+        """
+        return [self.get(key) for key in keys]
+
+    def hash_get_all_multi(self, keys: List[str]) -> List[Dict[str, Serializable]]:
+        """
+        Return complete hash objects stored under the passed keys (in the order
+        of the keys). Missing keys produce empty dicts. Back-ends are encouraged
+        to implement this using a single round-trip.
+        """
+        return [self.hash_get_all(key) for key in keys]
+
+    def hash_set_map_nx(self, key: str, mapping: Dict[str, Serializable]) -> bool:
+        """
+        Set all the fields from the 'mapping' dict only if there is no hash
+        under the 'key' yet. Back-ends should implement this as an atomic
+        operation (this default implementation is not atomic).
+
+        returns:
+        True if the hash has been created else False
+        """
+        if self.exists(key):
+            return False
+        for field, value in mapping.items():
+            self.hash_set(key, field, value)
+        return True
+
+    def hash_update_map(self, key: str, mapping: Dict[str, Serializable]) -> bool:
+        """
+        Set all the fields from the 'mapping' dict only if there already
+        is a hash under the 'key'. Back-ends should implement this as an atomic
+        operation (this default implementation is not atomic).
+
+        returns:
+        True if the hash has been updated else False
+        """
+        if not self.exists(key):
+            return False
+        for field, value in mapping.items():
+            self.hash_set(key, field, value)
+        return True
+
+    def hash_set_max(self, key: str, field: str, value: Union[int, float]) -> bool:
+        """
+        Set a numeric field of an existing hash only if the new value is bigger
+        than the stored one. Back-ends should implement this as an atomic
+        operation (this default implementation is not atomic).
+
+        returns:
+        True if the value has been changed else False
+        """
+        if not self.exists(key):
+            return False
+        curr = self.hash_get(key, field)
+        if curr is not None and curr >= value:
+            return False
+        self.hash_set(key, field, value)
+        return True
+
+    def publish(self, channel: str, message: Serializable) -> None:
+        """
+        Send a JSON-serializable message to all the subscribers of the channel.
+        The default implementation does nothing (i.e. subscribers have to poll).
+        """
+
+    def subscribe(self, channel: str) -> Subscription:
+        """
+        Subscribe to a channel. Please do not forget to close
+        the returned subscription once it is not needed.
+        The default implementation returns a polling subscription
+        receiving no messages.
+        """
+        return Subscription()
+
     def get_instance(self, plugin_id):
         """
         Return the current instance of the plug-in
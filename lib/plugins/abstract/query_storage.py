@@ -26,13 +26,16 @@ import abc
 class AbstractQueryStorage(abc.ABC):
 
     @abc.abstractmethod
-    def write(self, user_id, query_id):
+    def write(self, user_id, query_id, conc_data=None):
         """
         Write data as a new saved query
 
         arguments:
         user_id -- a numeric ID of a user
         query_id -- a query identifier as produced by query_storage plug-in
+        conc_data -- optional stored data of the respective operation (as returned
+                     by conc_persistence); implementations may use them to avoid
+                     loading the operation again
 
         returns:
         an ID of the query (either new or existing)
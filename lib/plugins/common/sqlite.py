@@ -0,0 +1,33 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from typing import Iterator, Sequence, TypeVar
+
+T = TypeVar('T')
+
+# SQLite before 3.32 limits the number of host parameters of a statement to 999
+# (a margin is left for parameters other than the IN list values)
+MAX_IN_PARAMS = 900
+
+
+def in_list_chunks(values: Sequence[T], chunk_size: int = MAX_IN_PARAMS) -> Iterator[Sequence[T]]:
+    """
+    Split values for an 'IN (?, ?, ...)' query into chunks small enough
+    to fit SQLite's limit of host parameters.
+    """
+    for i in range(0, len(values), chunk_size):
+        yield values[i:i + chunk_size]
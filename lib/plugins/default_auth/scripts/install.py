@@ -35,9 +35,12 @@ def import_user_redis(data):
 
 def import_user_sqlite3(data):
     import sqlite3
+    from plugins.sqlite3_db import DefaultDb
     db = sqlite3.connect(db_conf['default:db_path'])
     cursor = db.cursor()
     cursor.execute('BEGIN')
+    for sql in DefaultDb.SCHEMA:
+        cursor.execute(sql)
     data['pwd_hash'] = mk_pwd_hash_default(data['pwd']) if data['pwd'] else None
     del data['pwd']
     cursor.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, -1)', ('corplist:user:{0}'.format(data['id']),
@@ -45,16 +48,8 @@ def import_user_sqlite3(data):
     del data['permitted_corpora']
     cursor.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, -1)', ('user:{0}'.format(data['id']),
                                                                                 json.dumps(data)))
-    cursor.execute('SELECT value FROM data WHERE key = ?', ('user_index',))
-    tmp = cursor.fetchone()
-    if not tmp:
-        uindex = {}
-    else:
-        uindex = json.loads(tmp[0])
-    uindex[data['username']] = 'user:{0}'.format(data['id'])
-
-    cursor.execute('INSERT OR REPLACE INTO data (key, value, expires) VALUES (?, ?, -1)',
-                   ('user_index', json.dumps(uindex)))
+    cursor.execute('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                   ('user_index', data['username'], json.dumps('user:{0}'.format(data['id']))))
     cursor.execute('COMMIT')
     print(('Installed user {}'.format(data['username'])))
 
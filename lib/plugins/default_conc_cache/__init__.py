@@ -32,12 +32,13 @@ element conc_cache {
 
 """
 import os
+import time
 import hashlib
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, List
 import manatee
 
 import plugins
-from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus
+from plugins.abstract.conc_cache import AbstractConcCache, AbstractCacheMappingFactory, CalcStatus, CalcStatusListener
 from plugins import inject
 from plugins.abstract.general_storage import KeyValueStorage
 
@@ -60,37 +61,77 @@ def _uniqname(subchash: Optional[str], query: Tuple[str, ...]):
     return hashlib.md5(('#'.join([q for q in query]) + subchash).encode('utf-8')).hexdigest()
 
 
+class DbCalcStatusListener(CalcStatusListener):
+    """
+    A calculation status listener based on a notification channel
+    provided by the 'db' plug-in (see KeyValueStorage.subscribe()).
+    """
+
+    def __init__(self, subscription):
+        super().__init__()
+        self._subscription = subscription
+
+    def wait(self, timeout):
+        self._subscription.get_message(max(0, timeout))
+
+    def close(self):
+        self._subscription.close()
+
+
 class DefaultCacheMapping(AbstractConcCache):
     """
     This class provides cache mapping between subchash+query and cached information
     stored via DB plug-in
 
-    Mapping looks like this:
-    md5(subchash, q) => [stored_conc_size, calc_status, hash_of(subchash, q[0])]
+    Each cache entry is stored as a separate hash with native fields so it can be
+    created and updated atomically (db plug-in methods hash_set_map_nx, hash_update_map,
+    hash_set_max):
+    conc_cache_entry:corpname:md5(subchash, q) => {size, q0hash, [calc_status attributes]}
+
+    A corpus-level map (used e.g. by the cleanup scripts) lists all the entries:
+    conc_cache:corpname => {md5(subchash, q) => hash_of(subchash, q[0])}
+
+    A secondary index lists entries derived from the same initial query:
+    conc_cache_q0:corpname:hash_of(subchash, q[0]) => {md5(subchash, q) => 1}
     """
 
     KEY_TEMPLATE = 'conc_cache:%s'
 
+    ENTRY_KEY_TEMPLATE = 'conc_cache_entry:%s:%s'
+
+    Q0_INDEX_KEY_TEMPLATE = 'conc_cache_q0:%s:%s'
+
     def __init__(self, cache_dir: str, corpus: manatee.Corpus, db: KeyValueStorage):
         self._cache_root_dir = cache_dir
         self._corpus = corpus
         self._db = db
 
     def _get_entry(self, subchash, q) -> Union[CachedConcInfo, None]:
-        val = self._db.hash_get(self._mk_key(), _uniqname(subchash, q))
-        if val:
-            if type(val[1]) is not dict:
+        return self._decode_entry(self._db.hash_get_all(self._mk_entry_key(_uniqname(subchash, q))))
+
+    @staticmethod
+    def _decode_entry(val) -> Union[CachedConcInfo, None]:
+        if val and 'size' in val:
+            size = val.pop('size')
+            q0hash = val.pop('q0hash', None)
+            try:
+                return size, CalcStatus(**val), q0hash
+            except TypeError:
                 return None
-            return val[0], CalcStatus(**val[1]), val[2]
         return None
 
-    def _set_entry(self, subchash, q, data: CachedConcInfo):
-        tmp = [data[0], data[1].to_dict(), data[2]]
-        self._db.hash_set(self._mk_key(), _uniqname(subchash, q), tmp)
-
     def _mk_key(self) -> str:
         return DefaultCacheMapping.KEY_TEMPLATE % self._corpus.corpname
 
+    def _mk_entry_key(self, uniqname: str) -> str:
+        return DefaultCacheMapping.ENTRY_KEY_TEMPLATE % (self._corpus.corpname, uniqname)
+
+    def _mk_q0_index_key(self, q0hash: str) -> str:
+        return DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (self._corpus.corpname, q0hash)
+
+    def _mk_channel(self, subchash: Optional[str], q: Tuple[str, ...]) -> str:
+        return '{0}:{1}'.format(self._mk_key(), _uniqname(subchash, q))
+
     def get_stored_calc_status(self, subchash: Optional[str], q: Tuple[str, ...]) -> Union[CalcStatus, None]:
         val = self._get_entry(subchash, q)
         return val[1] if val else None
@@ -121,20 +162,23 @@ class DefaultCacheMapping(AbstractConcCache):
 
     def add_to_map(self, subchash: Optional[str], query: Tuple[str, ...], size: int, calc_status: CalcStatus = None) -> Tuple[str, CalcStatus]:
         """
-        TODO: the current implementation has serious issues
-        regarding hidden arguments and cache status relationships
-        user cannot possibly understand. I.e. if a record is
-        not present yet then calc_status cannot be None.
+        Add a new entry (if there is none yet and calc_status is provided) or
+        update the size of an existing one (only if the new size is bigger).
+        Creating an entry is atomic so in case of concurrent requests only one
+        of them receives None as the stored calc. status (i.e. only one should
+        start the calculation).
         """
-        stored_data = self._get_entry(subchash, query)
-        if stored_data:
-            storedsize, stored_calc_status, q0hash = stored_data
-            if storedsize < size:
-                self._set_entry(subchash, query, (size, stored_calc_status, q0hash))
-        else:
-            stored_calc_status = None
-            self._set_entry(subchash, query, (size, calc_status, _uniqname(subchash, query[:1])))
-        return self._create_cache_file_path(subchash, query), stored_calc_status
+        uniqname = _uniqname(subchash, query)
+        entry_key = self._mk_entry_key(uniqname)
+        q0hash = _uniqname(subchash, query[:1])
+        if calc_status is not None:
+            entry = dict(calc_status.to_dict(), size=size, q0hash=q0hash)
+            if self._db.hash_set_map_nx(entry_key, entry):
+                self._db.hash_set(self._mk_key(), uniqname, q0hash)
+                self._db.hash_set(self._mk_q0_index_key(q0hash), uniqname, 1)
+                return self._create_cache_file_path(subchash, query), None
+        self._db.hash_set_max(entry_key, 'size', size)
+        return self._create_cache_file_path(subchash, query), self.get_calc_status(subchash, query)
 
     def get_calc_status(self, subchash: Optional[str], query: Tuple[str, ...]) -> Union[CalcStatus, None]:
         stored_data = self._get_entry(subchash, query)
@@ -142,21 +186,42 @@ class DefaultCacheMapping(AbstractConcCache):
             return stored_data[1]
         return None
 
+    def get_prefix_calc_statuses(self, subchash: Optional[str], query: Tuple[str, ...]) -> List[Optional[CalcStatus]]:
+        keys = [self._mk_entry_key(_uniqname(subchash, query[:i + 1])) for i in range(len(query))]
+        entries = [self._decode_entry(val) for val in self._db.hash_get_all_multi(keys)]
+        return [entry[1] if entry else None for entry in entries]
+
     def update_calc_status(self, subchash: Optional[str], query: Tuple[str, ...], **kw):
-        stored_data = self._get_entry(subchash, query)
-        if stored_data:
-            storedsize, stored_calc_status, q0hash = stored_data
-            stored_calc_status.update(**kw)
-            self._set_entry(subchash, query, (storedsize, stored_calc_status, q0hash))
+        # CalcStatus validates and normalizes the values (and sets 'last_upd')
+        normalized = CalcStatus().update(**kw).to_dict()
+        upd = dict((k, normalized[k]) for k in list(kw.keys()) + ['last_upd'])
+        if self._db.hash_update_map(self._mk_entry_key(_uniqname(subchash, query)), upd):
+            self._db.publish(self._mk_channel(subchash, query),
+                             dict((k, v) for k, v in upd.items() if k in ('concsize', 'finished')))
+
+    def mark_used(self, subchash: Optional[str], query: Tuple[str, ...]):
+        # no 'last_upd' change and no notification here - the calculation status stays the same
+        self._db.hash_update_map(self._mk_entry_key(_uniqname(subchash, query)), dict(last_access=int(time.time())))
+
+    def get_calc_status_listener(self, subchash: Optional[str], query: Tuple[str, ...]) -> CalcStatusListener:
+        return DbCalcStatusListener(self._db.subscribe(self._mk_channel(subchash, query)))
+
+    def _del_by_uniqname(self, uniqname: str, q0hash: Optional[str]):
+        self._db.remove(self._mk_entry_key(uniqname))
+        self._db.hash_del(self._mk_key(), uniqname)
+        if q0hash:
+            self._db.hash_del(self._mk_q0_index_key(q0hash), uniqname)
 
     def del_entry(self, subchash: Optional[str], q: Tuple[str, ...]):
-        self._db.hash_del(self._mk_key(), _uniqname(subchash, q))
+        self._del_by_uniqname(_uniqname(subchash, q), _uniqname(subchash, q[:1]))
 
     def del_full_entry(self, subchash: Optional[str], q: Tuple[str, ...]):
-        for k, stored in list(self._db.hash_get_all(self._mk_key()).items()):
-            if _uniqname(subchash, q[:1]) == stored[2]:  # stored[2] = q0hash
-                # original record's key must be used (k ~ entry_key match can be partial)
-                self._db.hash_del(self._mk_key(), k)  # must use direct access here (no del_entry())
+        q0hash = _uniqname(subchash, q[:1])
+        index_key = self._mk_q0_index_key(q0hash)
+        for uniqname in self._db.hash_get_all(index_key).keys():
+            self._db.remove(self._mk_entry_key(uniqname))
+            self._db.hash_del(self._mk_key(), uniqname)
+        self._db.remove(index_key)
 
 
 class CacheMappingFactory(AbstractCacheMappingFactory):
@@ -173,6 +238,24 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
     def get_mapping(self, corpus):
         return DefaultCacheMapping(self._cache_dir, corpus, self._db)
 
+    def _del_map_entry(self, corpus_id, uniqname):
+        """
+        Remove a cache map entry including its index records
+        (to be used by maintenance tasks which have no corpus instance)
+        """
+        key = DefaultCacheMapping.KEY_TEMPLATE % corpus_id
+        q0hash = self._db.hash_get(key, uniqname)
+        self._db.remove(DefaultCacheMapping.ENTRY_KEY_TEMPLATE % (corpus_id, uniqname))
+        self._db.hash_del(key, uniqname)
+        if isinstance(q0hash, str):
+            self._db.hash_del(DefaultCacheMapping.Q0_INDEX_KEY_TEMPLATE % (corpus_id, q0hash), uniqname)
+
+    def _get_last_access(self, corpus_id, uniqname):
+        """
+        Return the last time a cache entry has been reused (or None if unknown)
+        """
+        return self._db.hash_get(DefaultCacheMapping.ENTRY_KEY_TEMPLATE % (corpus_id, uniqname), 'last_access')
+
     def export_tasks(self):
         """
         Export tasks for Celery worker(s)
@@ -183,7 +266,8 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
         def conc_cache_cleanup(ttl, subdir, dry_run, corpus_id=None):
             return run_cleanup(root_dir=self._cache_dir,
                                corpus_id=corpus_id, ttl=ttl, subdir=subdir, dry_run=dry_run,
-                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c)
+                               db_plugin=self._db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                               entry_del=self._del_map_entry, last_access_getter=self._get_last_access)
 
         def conc_cache_monitor(min_file_age, free_capacity_goal, free_capacity_trigger, elastic_conf):
             """
@@ -201,7 +285,8 @@ class CacheMappingFactory(AbstractCacheMappingFactory):
             return run_monitor(root_dir=self._cache_dir, db_plugin=self._db,
                                entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
                                min_file_age=min_file_age, free_capacity_goal=free_capacity_goal,
-                               free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf)
+                               free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf,
+                               entry_del=self._del_map_entry, last_access_getter=self._get_last_access)
 
         return conc_cache_cleanup, conc_cache_monitor
 
@@ -87,14 +87,28 @@ class CacheFiles(object):
 
 class CacheCleanup(CacheFiles):
 
-    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen):
+    def __init__(self, db, root_path, corpus, ttl, subdir, entry_key_gen, entry_del=None, last_access_getter=None):
         super(CacheCleanup, self).__init__(root_path, subdir, corpus)
         self._db = db
         self._ttl = ttl
         self._entry_key_gen = entry_key_gen
+        if entry_del is None:
+            entry_del = lambda corp_id, item_hash: db.hash_del(entry_key_gen(corp_id), item_hash)
+        self._entry_del = entry_del
+        self._last_access_getter = last_access_getter
         self._num_processed = 0
         self._num_removed = 0
 
+    def _recently_used(self, corpus_id, item_key):
+        """
+        Test whether a cache entry has been reused within TTL
+        (in such case its file is kept even if it is older)
+        """
+        if self._last_access_getter is None:
+            return False
+        last_access = self._last_access_getter(corpus_id, item_key)
+        return isinstance(last_access, (int, float)) and self._ttl >= (self._curr_time - last_access) / 60.
+
     @staticmethod
     def _log_stats(files):
         for k, v in list(files.items()):
@@ -109,7 +123,7 @@ class CacheCleanup(CacheFiles):
         Performs the clean-up operation by taking the following sequence of steps:
          1. lists all cache files in individual corpora cache dirs
          2. for all the corpora
-           2.1 find which files are old enough (see TTL) to be deleted
+           2.1 find which files are old enough (see TTL) and not reused within TTL to be deleted
            2.2 find an cache map entry in Redis and iterate over records found there
              2.2.1 if a record matches a file which is waiting to be deleted, then both the
                     file and the record are removed
@@ -143,7 +157,7 @@ class CacheCleanup(CacheFiles):
                 num_processed += 1
                 item_key = os.path.basename(cache_entry[0]).rsplit('.conc')[0]
                 real_file_hashes.add(item_key)
-                if self._ttl < cache_entry[1] / 60.:
+                if self._ttl < cache_entry[1] / 60. and not self._recently_used(corpus_id, item_key):
                     to_del[item_key] = cache_entry[0]
 
             cache_key = self._entry_key_gen(corpus_id)
@@ -154,13 +168,13 @@ class CacheCleanup(CacheFiles):
                         if item_hash in to_del:
                             if not dry_run:
                                 os.unlink(to_del[item_hash])
-                                self._db.hash_del(cache_key, item_hash)
+                                self._entry_del(corpus_id, item_hash)
                             else:
                                 del to_del[item_hash]
                             num_deleted += 1
                         elif item_hash not in real_file_hashes:
                             if not dry_run:
-                                self._db.hash_del(cache_key, item_hash)
+                                self._entry_del(corpus_id, item_hash)
                             logging.getLogger().warn(
                                 'deleted stale cache map entry [%s][%s]' % (cache_key, item_hash))
                 except Exception as ex:
@@ -181,7 +195,8 @@ class CacheCleanup(CacheFiles):
         return ans
 
 
-def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen):
+def run(root_dir, corpus_id, ttl, subdir, dry_run, db_plugin, entry_key_gen, entry_del=None,
+        last_access_getter=None):
     proc = CacheCleanup(db=db_plugin, root_path=root_dir, corpus=corpus_id, ttl=ttl, subdir=subdir,
-                        entry_key_gen=entry_key_gen)
+                        entry_key_gen=entry_key_gen, entry_del=entry_del, last_access_getter=last_access_getter)
     return proc.run(dry_run=dry_run)
@@ -40,7 +40,7 @@ class Record(object):
 class Monitor(object):
 
     def __init__(self, root_dir, db_plugin, entry_key_gen, min_file_age, free_capacity_goal, free_capacity_trigger,
-                 elastic_conf):
+                 elastic_conf, entry_del=None, last_access_getter=None):
         """
         arguments:
             root_dir -- cache root directory
@@ -52,10 +52,19 @@ class Monitor(object):
             free_capacity_trigger -- a maximum disk free capacity which triggers file removal process
             elastic_conf -- a tuple (URL, index, type) containing ElasticSearch server, index and document type
                             configuration for storing monitoring info; if None then the function is disabled
+            entry_del -- an optional function (corpus_id, entry_hash) removing a cache map entry
+                         (by default, a respective field of the entry_key_gen(corpus_id) hash is removed)
+            last_access_getter -- an optional function (corpus_id, entry_hash) returning the last time
+                                  a cache entry has been reused (the age of the entry is then
+                                  counted from the time instead of the file creation)
         """
         self._root_dir = root_dir
         self.db_plugin = db_plugin
         self.entry_key_gen = entry_key_gen
+        if entry_del is None:
+            entry_del = lambda corp_id, item_hash: db_plugin.hash_del(entry_key_gen(corp_id), item_hash)
+        self.entry_del = entry_del
+        self.last_access_getter = last_access_getter
         self.min_file_age = min_file_age
         self.free_capacity_goal = free_capacity_goal
         self.free_capacity_trigger = free_capacity_trigger
@@ -107,18 +116,29 @@ class Monitor(object):
         return sum(x.size for x in sorted(self._data, key=lambda x: x.size, reverse=True)[:10])
 
     def parse_conc_code(self, path):
-        return self.entry_key_gen(os.path.basename(os.path.dirname(path))), os.path.basename(path)[:-len('.conc')]
+        return os.path.basename(os.path.dirname(path)), os.path.basename(path)[:-len('.conc')]
+
+    def _update_age_by_access(self, record):
+        if self.last_access_getter is not None:
+            try:
+                last_access = self.last_access_getter(*self.parse_conc_code(record.path))
+            except Exception:
+                last_access = None
+            if isinstance(last_access, (int, float)):
+                record.age = min(record.age, round(self._time - last_access))
+        return record
 
     def find_rm_candidates(self):
-        rmlist = sorted([v for v in self._data if v.age > self.min_file_age],
+        candidates = [self._update_age_by_access(v) for v in self._data if v.age > self.min_file_age]
+        rmlist = sorted([v for v in candidates if v.age > self.min_file_age],
                         key=lambda v: v.size * v.age, reverse=True)
         total = 0
         i = 0
         errors = []
         while i < len(rmlist) and total < self.free_capacity_goal:
             try:
-                key, key2 = self.parse_conc_code(rmlist[i].path)
-                self.db_plugin.hash_del(key, key2)
+                corp_id, key2 = self.parse_conc_code(rmlist[i].path)
+                self.entry_del(corp_id, key2)
                 os.unlink(rmlist[i].path)
                 total += rmlist[i].size
                 i += 1
@@ -132,11 +152,12 @@ class Monitor(object):
 
 
 def run(db_plugin, entry_key_gen, root_dir, min_file_age, free_capacity_goal, free_capacity_trigger,
-        elastic_conf=None):
+        elastic_conf=None, entry_del=None, last_access_getter=None):
     """
     See Monitor.__init__() for arguments. 
     """
     monitor = Monitor(root_dir=root_dir, db_plugin=db_plugin, entry_key_gen=entry_key_gen,
                       min_file_age=min_file_age, free_capacity_goal=free_capacity_goal,
-                      free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf)
+                      free_capacity_trigger=free_capacity_trigger, elastic_conf=elastic_conf,
+                      entry_del=entry_del, last_access_getter=last_access_getter)
     return monitor.run()
@@ -0,0 +1,87 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from plugins.abstract.conc_cache import CalcStatus
+from plugins.default_conc_cache import CacheMappingFactory, DefaultCacheMapping
+from plugins.default_conc_cache.cleanup import run as run_cleanup
+from plugins.sqlite3_db import DefaultDb
+
+
+class MockCorpus(object):
+    corpname = 'susanne'
+
+
+class CacheMappingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # please note that the plug-in keeps a single (thread-local) connection
+        self.db = DefaultDb({'default:db_path': ':memory:'})
+        with self.db._transaction() as cursor:
+            for table in ('data', 'hash_data', 'list_data', 'key_expires'):
+                cursor.execute(f'DELETE FROM {table}')
+        self.factory = CacheMappingFactory(cache_dir=os.path.join(self.tmp_dir, 'cache'), db=self.db)
+        self.cache_map = self.factory.get_mapping(MockCorpus())
+        self.cache_map.refresh_map()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create_cached_conc(self, q, age):
+        cachefile, _ = self.cache_map.add_to_map(None, q, 10, calc_status=CalcStatus(finished=True, concsize=10))
+        with open(cachefile, 'wb') as fw:
+            fw.write(b'conc. data')
+        created = time.time() - age
+        os.utime(cachefile, (created, created))
+        file_stat = os.stat(cachefile)
+        self.cache_map.update_calc_status(None, q, arf=1.5, arf_file_mtime=file_stat.st_mtime,
+                                          arf_file_size=file_stat.st_size)
+        return cachefile
+
+    def test_reuse_keeps_arf(self):
+        q = ('aword,[lemma="test"]',)
+        cachefile = self._create_cached_conc(q, age=3600)
+        self.cache_map.mark_used(None, q)
+        status = self.cache_map.get_calc_status(None, q)
+        # reusing the concordance must not force ARF recalculation
+        self.assertTrue(status.has_valid_arf(os.stat(cachefile)))
+        self.assertEqual(1.5, status.arf)
+        self.assertAlmostEqual(time.time(), status.last_access, delta=5)
+
+    def test_cleanup_keeps_reused_entries(self):
+        q1 = ('aword,[lemma="test"]',)
+        q2 = ('aword,[lemma="other"]',)
+        cachefile1 = self._create_cached_conc(q1, age=7200)
+        cachefile2 = self._create_cached_conc(q2, age=7200)
+        self.cache_map.mark_used(None, q1)
+        run_cleanup(root_dir=os.path.join(self.tmp_dir, 'cache'), corpus_id=None, ttl=60, subdir=None,
+                    dry_run=False, db_plugin=self.db, entry_key_gen=lambda c: DefaultCacheMapping.KEY_TEMPLATE % c,
+                    entry_del=self.factory._del_map_entry, last_access_getter=self.factory._get_last_access)
+        self.assertTrue(os.path.exists(cachefile1))
+        self.assertIsNotNone(self.cache_map.get_calc_status(None, q1))
+        self.assertFalse(os.path.exists(cachefile2))
+        self.assertIsNone(self.cache_map.get_calc_status(None, q2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,6 +33,7 @@ import json
 import time
 
 from plugins.abstract.conc_persistence import AbstractConcPersistence
+from plugins.common.sqlite import in_list_chunks
 import plugins
 from plugins import inject
 from controller.errors import ForbiddenException, UserActionException
@@ -140,6 +141,22 @@ class Sqlite3ArchBackend(object):
             return json.loads(raw_ans[0])
         return None
 
+    def load_multi(self, db_keys):
+        """
+        Load archived data stored under the passed keys using a single query
+        (per MAX_IN_PARAMS keys).
+
+        returns:
+        a dictionary db_key => data (missing keys are not present)
+        """
+        ans = {}
+        cursor = self.archive_db.cursor()
+        for chunk in in_list_chunks(db_keys):
+            cursor.execute('SELECT id, data FROM conc_archive WHERE id IN ({0})'.format(', '.join(['?'] * len(chunk))),
+                           chunk)
+            ans.update((db_key, json.loads(data)) for db_key, data in cursor.fetchall())
+        return ans
+
     def is_archived(self, db_key):
         cursor = self.archive_db.cursor()
         cursor.execute('SELECT id FROM conc_archive WHERE id = ?', (db_key,))
@@ -169,6 +186,9 @@ class DbPluginArchBackend(object):
     def load(self, db_key):
         return None  # can't help here as normal load searches in the very same db
 
+    def load_multi(self, db_keys):
+        return {}
+
     def is_archived(self, db_key):
         return self._db.get_ttl(db_key) == -1
 
@@ -233,6 +253,12 @@ class ConcPersistence(AbstractConcPersistence):
             ans = self._archive_backend.load(key)
         return ans
 
+    def open_many(self, data_ids):
+        keys = [self._mk_key(data_id) for data_id in data_ids]
+        values = dict(zip(keys, self._db.get_multi(keys)))
+        values.update(self._archive_backend.load_multi([key for key, v in values.items() if v is None]))
+        return dict((data_id, values[key]) for data_id, key in zip(data_ids, keys))
+
     def store(self, user_id, curr_data, prev_data=None):
         """
         Stores current operation (defined in curr_data) into the database. If also prev_date argument is
@@ -259,6 +285,7 @@ class ConcPersistence(AbstractConcPersistence):
             curr_data['id'] = data_id
             if prev_data is not None:
                 curr_data['prev_id'] = prev_data['id']
+                curr_data['ancestors'] = self.mk_ancestors(prev_data)
             data_key = self._mk_key(data_id)
 
             self._db.set(data_key, curr_data)
@@ -63,7 +63,7 @@ class QueryStorage(AbstractQueryStorage):
     def _mk_tmp_key(self, user_id):
         return 'query_history:user:%d:new' % user_id
 
-    def write(self, user_id, query_id):
+    def write(self, user_id, query_id, conc_data=None):
         """
         stores information about a query; from time
         to time also check remove too old records
@@ -71,11 +71,31 @@ class QueryStorage(AbstractQueryStorage):
         arguments:
         see the super class
         """
+        if conc_data is None:
+            conc_data = self._conc_persistence.open(query_id)
         item = dict(created=self._current_timestamp(), query_id=query_id, name=None)
+        if conc_data and 'lastop_form' in conc_data:
+            item.update(self._mk_filter_props(conc_data))
         self.db.list_append(self._mk_key(user_id), item)
         if random.random() < QueryStorage.PROB_DELETE_OLD_RECORDS:
             self.delete_old_records(user_id)
 
+    @staticmethod
+    def _mk_filter_props(conc_data):
+        """
+        Extract properties of a concordance operation needed to filter query
+        history records. The properties are stored (denormalised) along with
+        the records so the filtering does not require loading the operations.
+        """
+        form_data = conc_data['lastop_form']
+        if form_data.get('form_type') == 'query':
+            corpora = conc_data['corpora']
+            query_types = [form_data['curr_query_types'].get(corp) for corp in corpora]
+        else:
+            corpora = conc_data['corpora'][:1]
+            query_types = [form_data.get('query_type')]
+        return dict(corpora=corpora, query_types=query_types)
+
     def make_persistent(self, user_id, query_id, name):
         k = self._mk_key(user_id)
         data = self.db.list_get(k)
@@ -97,15 +117,7 @@ class QueryStorage(AbstractQueryStorage):
                 return True
         return False
 
-    def _is_paired_with_conc(self, data):
-        q_id = data['query_id']
-        edata = self._conc_persistence.open(q_id)
-        return edata and 'lastop_form' in edata
-
-    def _merge_conc_data(self, data):
-        q_id = data['query_id']
-        edata = self._conc_persistence.open(q_id)
-
+    def _merge_conc_data(self, data, edata):
         def get_ac_val(data, name, corp): return data[name][corp] if name in data else None
 
         if edata and 'lastop_form' in edata:
@@ -151,63 +163,66 @@ class QueryStorage(AbstractQueryStorage):
         arguments:
         see the super-class
         """
-        def matches_corp_prop(data, prop_name, value):
-            if data.get(prop_name, None) == value:
-                return True
-            for aligned in data.get('aligned', []):
-                if aligned[prop_name] == value:
-                    return True
-            return False
+        def filter_props(item):
+            if 'corpora' in item:
+                return item
+            if 'query_id' in item:
+                edata = legacy_data.get(item['query_id'])
+                return self._mk_filter_props(edata) if edata and 'lastop_form' in edata else None
+            # deprecated type of record (without a persistent operation)
+            return dict(corpora=[item.get('corpname')], query_types=[item.get('query_type')])
+
+        def matches(item):
+            props = filter_props(item)
+            if props is None:
+                return False
+            if from_date and item['created'] < from_date:
+                return False
+            if to_date and item['created'] > to_date:
+                return False
+            if query_type and query_type not in props['query_types']:
+                return False
+            if corpname and corpname not in props['corpora']:
+                return False
+            if archived_only and ('query_id' not in item or item.get('name', None) is None):
+                return False
+            return True
 
         data = self.db.list_get(self._mk_key(user_id))
-        full_data = []
-
-        for item in data:
-            if 'query_id' in item:
-                tmp = self._merge_conc_data(item)
-                if tmp:
-                    full_data.append(tmp)
-            else:
-                # deprecated type of record (this will vanish soon as there
-                # are no persistent history records based on the old format)
-                tmp = {}
-                tmp.update(item)
-                tmp['default_attr'] = None
-                tmp['lpos'] = None
-                tmp['qmcase'] = None
-                tmp['pcq_pos_neg'] = None
-                tmp['include_empty'] = None
-                tmp['selected_text_types'] = {}
-                tmp['aligned'] = []
-                tmp['name'] = None
-                full_data.append(tmp)
+        # records created before filtering properties were stored along with them
+        legacy_ids = [item['query_id'] for item in data if 'query_id' in item and 'corpora' not in item]
+        legacy_data = self._conc_persistence.open_many(legacy_ids) if len(legacy_ids) > 0 else {}
 
         if from_date:
             from_date = [int(d) for d in from_date.split('-')]
             from_date = time.mktime(
                 datetime(from_date[0], from_date[1], from_date[2], 0, 0, 0).timetuple())
-            full_data = [x for x in full_data if x['created'] >= from_date]
 
         if to_date:
             to_date = [int(d) for d in to_date.split('-')]
             to_date = time.mktime(
                 datetime(to_date[0], to_date[1], to_date[2], 23, 59, 59).timetuple())
-            full_data = [x for x in full_data if x['created'] <= to_date]
-
-        if query_type:
-            full_data = [x for x in full_data if matches_corp_prop(x, 'query_type', query_type)]
-
-        if corpname:
-            full_data = [x for x in full_data if matches_corp_prop(
-                x, 'corpname', corpname)]
-
-        if archived_only:
-            full_data = [x for x in full_data if x.get('name', None) is not None]
 
+        candidates = [item for item in reversed(data) if matches(item)][offset:]
         if limit is None:
-            limit = len(full_data)
+            limit = len(candidates)
+
+        # operations are loaded in batches; a batch is repeated only in case
+        # some of the operations are not available anymore
+        tmp = []
+        while len(tmp) < limit and len(candidates) > 0:
+            batch, candidates = candidates[:limit - len(tmp)], candidates[limit - len(tmp):]
+            to_load = [item['query_id'] for item in batch if 'query_id' in item and item['query_id'] not in legacy_data]
+            conc_data = self._conc_persistence.open_many(to_load) if len(to_load) > 0 else {}
+            conc_data.update(legacy_data)
+            for item in batch:
+                if 'query_id' in item:
+                    merged = self._merge_conc_data(item, conc_data.get(item['query_id']))
+                    if merged:
+                        tmp.append(merged)
+                else:
+                    tmp.append(self._merge_legacy_data(item))
 
-        tmp = [v for v in reversed(full_data)][offset:(offset + limit)]
         corp_cache = {}
         for i, item in enumerate(tmp):
             item['idx'] = offset + i
@@ -220,6 +235,22 @@ class QueryStorage(AbstractQueryStorage):
                 ac['human_corpname'] = corp_cache[ac['corpname']].get_conf('NAME')
         return tmp
 
+    @staticmethod
+    def _merge_legacy_data(item):
+        # deprecated type of record (this will vanish soon as there
+        # are no persistent history records based on the old format)
+        tmp = {}
+        tmp.update(item)
+        tmp['default_attr'] = None
+        tmp['lpos'] = None
+        tmp['qmcase'] = None
+        tmp['pcq_pos_neg'] = None
+        tmp['include_empty'] = None
+        tmp['selected_text_types'] = {}
+        tmp['aligned'] = []
+        tmp['name'] = None
+        return tmp
+
     def find_by_qkey(self, query_key):
         if query_key:
             items = query_key.split(':')
@@ -238,10 +269,13 @@ class QueryStorage(AbstractQueryStorage):
         tmp_key = self._mk_tmp_key(user_id)
         self.db.remove(tmp_key)
         curr_time = time.time()
+        named = self._conc_persistence.open_many(
+            [item['query_id'] for item in curr_data if item.get('name', None) is not None])
         new_list = []
         for item in curr_data:
             if item.get('name', None) is not None:
-                if self._is_paired_with_conc(item):
+                edata = named.get(item['query_id'])
+                if edata and 'lastop_form' in edata:
                     new_list.append(item)
                 else:
                     logging.getLogger(__name__).warning(
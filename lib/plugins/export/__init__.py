@@ -51,6 +51,31 @@ class AbstractExport(object):
     def write_ref_headings(self, data):
         pass  # optional implementation
 
+    def enable_streaming(self):
+        """
+        Switch the exporter into a streaming mode where the produced content
+        is fetched continuously via pop_content() and close_content() instead
+        of raw_content(). The method must be called before any data is written.
+
+        returns:
+        True if the exporter supports streaming else False (in such case
+        raw_content() must be used)
+        """
+        return False
+
+    def pop_content(self):
+        """
+        Return a content written since the last call (streaming mode only)
+        """
+        raise NotImplementedError()
+
+    def close_content(self):
+        """
+        Finish the document and generate its remaining content
+        in chunks (streaming mode only)
+        """
+        raise NotImplementedError()
+
 
 def lang_row_to_list(row):
     ans = []
@@ -56,6 +56,17 @@ class CSVExport(AbstractExport):
     def raw_content(self):
         return ''.join(self.csv_buff.rows)
 
+    def enable_streaming(self):
+        return True
+
+    def pop_content(self):
+        ans = ''.join(self.csv_buff.rows)
+        self.csv_buff.rows = []
+        return ans
+
+    def close_content(self):
+        yield self.pop_content()
+
     def write_ref_headings(self, data):
         self.csv_writer.writerow(data)
 
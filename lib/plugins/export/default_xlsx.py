@@ -19,9 +19,14 @@ A plug-in allowing export of a concordance (in fact, any row/cell
 like data can be used) to XLSX (Office Open XML) format.
 
 Plug-in requires openpyxl library.
+
+In the streaming mode, a write-only (constant memory) workbook is used.
 """
 from io import BytesIO
+import tempfile
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 try:
     from openpyxl.utils import get_column_letter
 except ImportError:
@@ -34,11 +39,14 @@ from translation import ugettext as _
 
 class XLSXExport(AbstractExport):
 
+    STREAM_CHUNK_SIZE = 65536
+
     def __init__(self, subtype):
         self._wb = Workbook()
         self._sheet = self._wb.active
         self._col_types = ()
         self._curr_line = 1
+        self._write_only = False
         if subtype == 'concordance':
             self._sheet.title = _('concordance')
             self._import_row = lang_row_to_list
@@ -60,16 +68,49 @@ class XLSXExport(AbstractExport):
         self._wb.save(filename=output)
         return output.getvalue()
 
+    def enable_streaming(self):
+        title = self._sheet.title
+        self._wb = Workbook(write_only=True)
+        self._sheet = self._wb.create_sheet(title=title)
+        self._write_only = True
+        return True
+
+    def pop_content(self):
+        return b''  # a write-only workbook can be serialized only as a whole
+
+    def close_content(self):
+        with tempfile.TemporaryFile() as tmp:
+            self._wb.save(tmp)
+            tmp.seek(0)
+            chunk = tmp.read(self.STREAM_CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = tmp.read(self.STREAM_CHUNK_SIZE)
+
     def writeheading(self, data):
         self._curr_line = 1
         if type(data) is dict:
             data = ['%s: %s' % (k, v) for (k, v) in list(data.items())]
+        if self._write_only:
+            self._sheet.append(data)
+            self._sheet.append([])
+            self._curr_line += 2
+            return
         for i in range(1, len(data) + 1):
             col = get_column_letter(i)
             self._sheet['%s%s' % (col, self._curr_line)].value = data[i - 1]
         self._curr_line += 2
 
     def write_ref_headings(self, data):
+        if self._write_only:
+            cells = []
+            for v in data:
+                cell = WriteOnlyCell(self._sheet, value=v)
+                cell.font = Font(bold=True)
+                cells.append(cell)
+            self._sheet.append(cells)
+            self._curr_line += 1
+            return
         for i in range(1, len(data) + 1):
             col = get_column_letter(i)
             cell = self._sheet['%s%s' % (col, self._curr_line)]
@@ -104,6 +145,16 @@ class XLSXExport(AbstractExport):
             row.append(line_num)
         for lang_row in lang_rows:
             row += self._import_row(lang_row)
+        if self._write_only:
+            cells = []
+            for i, v in enumerate(row):
+                value, cell_format = self._import_value(v, i)
+                cell = WriteOnlyCell(self._sheet, value=value)
+                cell.number_format = cell_format
+                cells.append(cell)
+            self._sheet.append(cells)
+            self._curr_line += 1
+            return
         for i in range(1, len(row) + 1):
             col = get_column_letter(i)
             value, cell_format = self._import_value(row[i - 1], i - 1)
@@ -39,6 +39,9 @@ class GeneralDocument(object):
     def tostring(self):
         return etree.tostring(self._root, pretty_print=True, encoding='UTF-8')
 
+    def enable_streaming(self):
+        return False
+
     def _auto_add_heading(self, data):
         if data is None:
             items = []
@@ -142,6 +145,29 @@ class ConcDocument(GeneralDocument):
         super(ConcDocument, self).__init__('concordance')
         self._lines = etree.Element('lines')
         self._root.append(self._lines)
+        self._stream_started = False
+
+    def enable_streaming(self):
+        return True
+
+    def pop_content(self):
+        """
+        Serialize and remove all the lines added since the last call. The first call
+        also produces the document opening part (including the heading).
+        """
+        ans = []
+        if not self._stream_started:
+            ans.append(b"<?xml version='1.0' encoding='UTF-8'?>\n<concordance>\n")
+            ans.append(etree.tostring(self._heading, pretty_print=True, encoding='UTF-8', xml_declaration=False))
+            ans.append(b'<lines>\n')
+            self._stream_started = True
+        for line_elm in list(self._lines):
+            ans.append(etree.tostring(line_elm, pretty_print=True, encoding='UTF-8', xml_declaration=False))
+            self._lines.remove(line_elm)
+        return b''.join(ans)
+
+    def close_content(self):
+        yield self.pop_content() + b'</lines>\n</concordance>\n'
 
     def _append_lang(self, elm, data):
         """
@@ -233,6 +259,15 @@ class XMLExport(AbstractExport):
     def raw_content(self):
         return self._document.tostring()
 
+    def enable_streaming(self):
+        return self._document.enable_streaming()
+
+    def pop_content(self):
+        return self._document.pop_content()
+
+    def close_content(self):
+        return self._document.close_content()
+
     def add_block(self, name):
         self._document.add_block(name)
 
@@ -28,10 +28,66 @@ required XML: please see config.rng
 
 import json
 import redis
-from plugins.abstract.general_storage import KeyValueStorage
+from plugins.abstract.general_storage import KeyValueStorage, Subscription
+
+
+class RedisSubscription(Subscription):
+    """
+    A subscription to a Redis pub/sub channel
+    """
+
+    def __init__(self, redis_conn, channel):
+        super().__init__()
+        self._pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(channel)
+
+    def get_message(self, timeout):
+        """
+        Wait for a message at most 'timeout' seconds.
+
+        returns:
+        a JSON-decoded message or None if nothing has been received
+        """
+        msg = self._pubsub.get_message(timeout=timeout)
+        return json.loads(msg['data']) if msg else None
+
+    def close(self):
+        self._pubsub.close()
 
 
 class RedisDb(KeyValueStorage):
+
+    # set all the hash fields only if the hash does not exist yet
+    _HASH_SET_MAP_NX = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+    return 1
+    """
+
+    # update hash fields only if the hash already exists
+    _HASH_UPDATE_MAP = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], unpack(ARGV))
+    return 1
+    """
+
+    # set a numeric hash field only if the hash exists and the new value is bigger
+    _HASH_SET_MAX = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local curr = tonumber(redis.call('HGET', KEYS[1], ARGV[1]))
+    if curr == nil or curr < tonumber(ARGV[2]) then
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        return 1
+    end
+    return 0
+    """
+
     def __init__(self, conf):
         """
         arguments:
@@ -42,6 +98,9 @@ class RedisDb(KeyValueStorage):
         self._db = int(conf['default:id'])
         self.redis = redis.StrictRedis(host=self._host, port=self._port, db=self._db)
         self._scan_chunk_size = 50
+        self._hash_set_map_nx = self.redis.register_script(self._HASH_SET_MAP_NX)
+        self._hash_update_map = self.redis.register_script(self._HASH_UPDATE_MAP)
+        self._hash_set_max = self.redis.register_script(self._HASH_SET_MAX)
 
     def rename(self, key, new_key):
         return self.redis.rename(key, new_key)
@@ -153,6 +212,17 @@ class RedisDb(KeyValueStorage):
         """
         return dict((k, json.loads(v)) for k, v in list(self.redis.hgetall(key).items()))
 
+    def hash_get_all_multi(self, keys):
+        """
+        Return complete hash objects stored under the passed keys
+        (a list of dicts in the order of the keys) using a single
+        round-trip. Missing keys produce empty dicts.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        return [dict((k, json.loads(v)) for k, v in item.items()) for item in pipe.execute()]
+
     def get(self, key, default=None):
         """
         Gets a value stored with passed key and returns its JSON decoded form.
@@ -166,6 +236,15 @@ class RedisDb(KeyValueStorage):
             return json.loads(data)
         return default
 
+    def get_multi(self, keys):
+        """
+        Get values stored under the passed keys (a list in the order
+        of the keys) using a single round-trip. Missing keys produce None.
+        """
+        if len(keys) == 0:
+            return []
+        return [json.loads(v) if v else None for v in self.redis.mget(keys)]
+
     def set(self, key, data):
         """
         Saves 'data' with 'key'.
@@ -252,6 +331,61 @@ class RedisDb(KeyValueStorage):
             new_mapping[name] = json.dumps(mapping[name])
         return self.redis.hmset(key, new_mapping)
 
+    @staticmethod
+    def _flatten_mapping(mapping):
+        ans = []
+        for k, v in mapping.items():
+            ans.append(k)
+            ans.append(json.dumps(v))
+        return ans
+
+    def hash_set_map_nx(self, key, mapping):
+        """
+        An atomic operation which sets all the fields from
+        the 'mapping' dict only if there is no hash under the 'key' yet.
+
+        returns:
+        True if the hash has been created else False
+        """
+        return bool(self._hash_set_map_nx(keys=[key], args=self._flatten_mapping(mapping)))
+
+    def hash_update_map(self, key, mapping):
+        """
+        An atomic operation which sets all the fields from the 'mapping'
+        dict only if there already is a hash under the 'key'.
+
+        returns:
+        True if the hash has been updated else False
+        """
+        return bool(self._hash_update_map(keys=[key], args=self._flatten_mapping(mapping)))
+
+    def hash_set_max(self, key, field, value):
+        """
+        An atomic operation which sets a numeric field of an existing hash
+        only if the new value is bigger than the stored one.
+
+        returns:
+        True if the value has been changed else False
+        """
+        return bool(self._hash_set_max(keys=[key], args=[field, json.dumps(value)]))
+
+    def publish(self, channel, message):
+        """
+        Send a JSON-serializable message to all the subscribers
+        of the channel.
+        """
+        self.redis.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        """
+        Subscribe to a channel. Please do not forget to close
+        the returned subscription once it is not needed.
+
+        returns:
+        a RedisSubscription instance
+        """
+        return RedisSubscription(self.redis, channel)
+
 
 def create_instance(conf):
     """
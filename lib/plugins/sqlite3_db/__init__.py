@@ -29,28 +29,108 @@ NoSQL engines like MongoDB, CouchDB, Redis etc.
 Please note that this concrete solution is not suitable for environments
 with high concurrency (hundreds or more simultaneous users).
 
-The sqlite3 plugin stores data in a single table called "data" with the following structure:
-CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)
+The sqlite3 plugin stores data in the following tables (created automatically; data
+stored by previous versions of the plug-in, where hashes and lists were serialized
+into the "data" table, are converted on the first connection):
+CREATE TABLE data (key text PRIMARY KEY, value text, expires integer) -- plain values
+CREATE TABLE hash_data (key text, field text, value text, PRIMARY KEY (key, field))
+CREATE TABLE list_data (key text, pos integer, value text, PRIMARY KEY (key, pos))
+CREATE TABLE key_expires (key text PRIMARY KEY, expires real) -- TTLs of keys of all types
+
+Expired keys are swept periodically (see DefaultDb.SWEEP_INTERVAL) and also
+lazily once they are accessed.
+
+The plug-in also provides simple local (i.e. single node) notification channels based
+on named pipes created within 'default:notify_dir' (the system temporary directory
+is used by default).
 """
 
 import threading
 import json
 import time
+import os
+import glob
+import uuid
+import select
+import hashlib
+import tempfile
+import errno
+import math
+from contextlib import contextmanager
 
 import sqlite3
 
-from plugins.abstract.general_storage import KeyValueStorage
+from plugins.abstract.general_storage import KeyValueStorage, Subscription
+from plugins.common.sqlite import in_list_chunks
 
 thread_local = threading.local()
 
 
+class FifoSubscription(Subscription):
+    """
+    A subscription to a local notification channel. Each subscriber
+    owns a named pipe ([notify dir]/[channel id].[subscriber id].fifo)
+    and publishers write messages to all the pipes of the channel.
+    """
+
+    def __init__(self, notify_dir, channel_id):
+        super().__init__()
+        os.makedirs(notify_dir, exist_ok=True)
+        self._path = os.path.join(notify_dir, '{0}.{1}.fifo'.format(channel_id, uuid.uuid1().hex))
+        os.mkfifo(self._path, 0o600)
+        self._fd = os.open(self._path, os.O_RDONLY | os.O_NONBLOCK)
+        # we keep our own writing end open so the pipe never signals EOF
+        self._wfd = os.open(self._path, os.O_WRONLY | os.O_NONBLOCK)
+
+    def get_message(self, timeout):
+        """
+        Wait for a message at most 'timeout' seconds.
+
+        returns:
+        a JSON-decoded message (the latest one in case more messages
+        arrived) or None if nothing has been received
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if ready:
+            try:
+                lines = [x for x in os.read(self._fd, 65536).split(b'\n') if x]
+            except BlockingIOError:
+                return None
+            if lines:
+                return json.loads(lines[-1])
+        return None
+
+    def close(self):
+        os.close(self._wfd)
+        os.close(self._fd)
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+
 class DefaultDb(KeyValueStorage):
+
+    # how often (in seconds) expired keys are swept
+    SWEEP_INTERVAL = 60
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS data (key text PRIMARY KEY, value text, expires integer)',
+        'CREATE TABLE IF NOT EXISTS hash_data (key text, field text, value text, PRIMARY KEY (key, field)) '
+        'WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS list_data (key text, pos integer, value text, PRIMARY KEY (key, pos)) '
+        'WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS key_expires (key text PRIMARY KEY, expires real)',
+        'CREATE INDEX IF NOT EXISTS key_expires_expires_idx ON key_expires (expires)'
+    )
+
     def __init__(self, conf):
         """
         arguments:
         conf -- a dictionary containing 'settings' module compatible configuration of the plug-in
         """
         self.conf = conf
+        self._last_sweep = 0
 
     def _conn(self):
         """
@@ -58,83 +138,205 @@ class DefaultDb(KeyValueStorage):
         """
         if not hasattr(thread_local, 'conn'):
             thread_local.conn = sqlite3.connect(self.conf.get('default:db_path'))
+            self._init_schema(thread_local.conn)
         return thread_local.conn
 
-    def _delete_expired(self, key):
-        cursor = self._conn().cursor()
-        cursor.execute('SELECT expires FROM data WHERE key = ?', (key,))
-        ans = cursor.fetchone()
-        if ans and -1 < ans[0] < time.time():
+    def _init_schema(self, conn):
+        """
+        Create missing tables. In case the database comes from a previous version
+        (where hashes and lists were stored as JSON values in the 'data' table),
+        the data are converted.
+        """
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'hash_data'")
+            migrate = cursor.fetchone()[0] == 0
+            for sql in self.SCHEMA:
+                cursor.execute(sql)
+            if migrate:
+                self._migrate_legacy_data(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _migrate_legacy_data(cursor):
+        for key, value, expires in cursor.execute('SELECT key, value, expires FROM data').fetchall():
+            if expires is not None and expires > -1:
+                cursor.execute('INSERT INTO key_expires (key, expires) VALUES (?, ?)', (key, expires))
+            data = json.loads(value)
+            if type(data) is dict:
+                cursor.executemany('INSERT INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                                   [(key, k, json.dumps(v)) for k, v in data.items()])
+            elif type(data) is list:
+                cursor.executemany('INSERT INTO list_data (key, pos, value) VALUES (?, ?, ?)',
+                                   [(key, i, json.dumps(v)) for i, v in enumerate(data)])
+            else:
+                continue
             cursor.execute('DELETE FROM data WHERE key = ?', (key,))
-            self._conn().commit()
-        return None
+        cursor.execute('UPDATE data SET expires = -1')
 
-    def _load_raw_data(self, key):
-        self._delete_expired(key)
+    @contextmanager
+    def _transaction(self):
+        """
+        Run a block of writing operations within an immediate (i.e. write-locking)
+        transaction. Expired keys are swept here from time to time.
+        """
+        conn = self._conn()
+        if conn.in_transaction:
+            conn.commit()
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if time.time() - self._last_sweep > self.SWEEP_INTERVAL:
+                self._sweep_expired(cursor)
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _sweep_expired(self, cursor):
+        now = time.time()
+        for table in ('data', 'hash_data', 'list_data'):
+            cursor.execute(f'DELETE FROM {table} WHERE key IN (SELECT key FROM key_expires WHERE expires < ?)',
+                           (now,))
+        cursor.execute('DELETE FROM key_expires WHERE expires < ?', (now,))
+        self._last_sweep = now
+
+    @staticmethod
+    def _is_expired(cursor, key):
+        cursor.execute('SELECT expires FROM key_expires WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row is not None and row[0] < time.time()
+
+    @staticmethod
+    def _delete_key(cursor, key):
+        for table in ('data', 'hash_data', 'list_data', 'key_expires'):
+            cursor.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+    def _read_cursor(self, key):
+        """
+        Returns a cursor for reading data or None if the key has expired
+        (in such case the key is removed).
+        """
         cursor = self._conn().cursor()
-        cursor.execute('SELECT value, expires FROM data WHERE key = ?', (key,))
-        ans = cursor.fetchone()
-        if ans:
-            return ans
-        return None
+        if self._is_expired(cursor, key):
+            with self._transaction() as tc:
+                if self._is_expired(tc, key):
+                    self._delete_key(tc, key)
+            return None
+        return cursor
+
+    def _write_cursor(self, cursor, key):
+        """
+        Prepare a key for writing within a transaction (expired data are removed first)
+        """
+        if self._is_expired(cursor, key):
+            self._delete_key(cursor, key)
+        return cursor
 
-    def _save_raw_data(self, path, data):
-        cursor = self._conn().cursor()
-        cursor.execute('INSERT OR REPLACE INTO data (key, value, expires) VALUES (?, ?, ?)',
-                       (path, data, -1))
-        self._conn().commit()
+    @staticmethod
+    def _list_bounds(cursor, key):
+        """
+        List items occupy a continuous range of positions so the bounds
+        are enough to calculate both list length and positions of items.
+
+        returns:
+        a 2-tuple (first position, last position + 1)
+        """
+        cursor.execute('SELECT MIN(pos), MAX(pos) FROM list_data WHERE key = ?', (key,))
+        head, last = cursor.fetchone()
+        if head is None:
+            return 0, 0
+        return head, last + 1
+
+    @staticmethod
+    def _normalize_range(from_idx, to_idx, size):
+        """
+        Transform Redis-like (inclusive, possibly negative) indices to
+        a Python-like range (both values are non-negative, the second one is exclusive)
+        """
+        if from_idx < 0:
+            from_idx = max(0, size + from_idx)
+        if to_idx < 0:
+            to_idx = size + to_idx
+        to_idx = min(to_idx, size - 1) + 1
+        return from_idx, max(from_idx, to_idx)
 
     def rename(self, key, new_key):
-        self._delete_expired(key)
-        cursor = self._conn().cursor()
-        cursor.execute('UPDATE data SET key = ? WHERE key = ?', (new_key, key))
-        self._conn().commit()
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            self._delete_key(cursor, new_key)
+            for table in ('data', 'hash_data', 'list_data', 'key_expires'):
+                cursor.execute(f'UPDATE {table} SET key = ? WHERE key = ?', (new_key, key))
 
     def list_get(self, key, from_idx=0, to_idx=-1):
-        data = []
-        raw_data = self._load_raw_data(key)
-        if raw_data is not None:
-            data = json.loads(raw_data[0])
-            if type(data) is not list:
+        cursor = self._read_cursor(key)
+        if cursor is None:
+            return []
+        head, tail = self._list_bounds(cursor, key)
+        if head == tail:
+            cursor.execute('SELECT COUNT(*) FROM data WHERE key = ?', (key,))
+            if cursor.fetchone()[0] > 0:
                 raise TypeError('There is no list with key %s' % key)
-            # simulate redis behavior - return values including the one at the end index:
-            if to_idx < 0:
-                to_idx = (len(data) + 1 + to_idx)
-                if to_idx < 0:
-                    to_idx = -len(data) - 1
-            else:
-                to_idx += 1
-            data = data[from_idx:to_idx]
-        return data
+            return []
+        start, stop = self._normalize_range(from_idx, to_idx, tail - head)
+        cursor.execute('SELECT value FROM list_data WHERE key = ? AND pos >= ? AND pos < ? ORDER BY pos',
+                       (key, head + start, head + stop))
+        return [json.loads(row[0]) for row in cursor.fetchall()]
 
     def list_append(self, key, value):
-        data = self.list_get(key)
-        data.append(value)
-        self.set(key, data)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            _, tail = self._list_bounds(cursor, key)
+            cursor.execute('INSERT INTO list_data (key, pos, value) VALUES (?, ?, ?)',
+                           (key, tail, json.dumps(value)))
 
     def list_pop(self, key):
-        data = self.list_get(key)
-        ans = data.pop(0)
-        self.set(key, data)
-        return ans
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.execute('SELECT pos, value FROM list_data WHERE key = ? ORDER BY pos LIMIT 1', (key,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute('DELETE FROM list_data WHERE key = ? AND pos = ?', (key, row[0]))
+            return json.loads(row[1])
 
     def list_len(self, key):
-        return len(self.list_get(key))
+        cursor = self._read_cursor(key)
+        if cursor is None:
+            return 0
+        head, tail = self._list_bounds(cursor, key)
+        return tail - head
 
     def list_set(self, key, idx, value):
-        data = self.list_get(key)
-        data[idx] = value
-        self.set(key, data)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            head, tail = self._list_bounds(cursor, key)
+            pos = head + idx if idx >= 0 else tail + idx
+            if not head <= pos < tail:
+                raise IndexError('list index out of range')
+            cursor.execute('UPDATE list_data SET value = ? WHERE key = ? AND pos = ?',
+                           (json.dumps(value), key, pos))
 
     def list_trim(self, key, keep_left, keep_right):
-        data = self.list_get(key, keep_left, keep_right)
-        self.set(key, data)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            head, tail = self._list_bounds(cursor, key)
+            start, stop = self._normalize_range(keep_left, keep_right, tail - head)
+            cursor.execute('DELETE FROM list_data WHERE key = ? AND (pos < ? OR pos >= ?)',
+                           (key, head + start, head + stop))
 
     def hash_get(self, key, field):
-        data = self.get(key)
-        if type(data) is not dict:
-            return {}
-        return data.get(field, None)
+        cursor = self._read_cursor(key)
+        if cursor is None:
+            return None
+        cursor.execute('SELECT value FROM hash_data WHERE key = ? AND field = ?', (key, field))
+        row = cursor.fetchone()
+        return json.loads(row[0]) if row else None
 
     def hash_set(self, key, field, value):
         """
@@ -145,21 +347,15 @@ class DefaultDb(KeyValueStorage):
         field -- hash table entry key
         value -- a value to be stored
         """
-        data = self.get(key)
-        if type(data) is not dict:
-            data = {}
-        data[field] = value
-        self.set(key, data)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.execute('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                           (key, field, json.dumps(value)))
 
     def hash_del(self, key, field):
-        sdata = self._load_raw_data(key)
-        data = json.loads(sdata[0])
-        if field in data:
-            del data[field]
-        if len(data):
-            self._save_raw_data(key, json.dumps(data))
-        else:
-            self.remove(key)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.execute('DELETE FROM hash_data WHERE key = ? AND field = ?', (key, field))
 
     def hash_get_all(self, key):
         """
@@ -169,8 +365,45 @@ class DefaultDb(KeyValueStorage):
         arguments:
         key -- data access key
         """
-        sdata = self._load_raw_data(key)
-        return json.loads(sdata[0]) if sdata is not None else {}
+        cursor = self._read_cursor(key)
+        if cursor is None:
+            return {}
+        cursor.execute('SELECT field, value FROM hash_data WHERE key = ?', (key,))
+        return dict((field, json.loads(value)) for field, value in cursor.fetchall())
+
+    def hash_get_all_multi(self, keys):
+        """
+        Return complete hash objects stored under the passed keys
+        (a list of dicts in the order of the keys) using a single
+        query (per MAX_IN_PARAMS keys). Missing (or expired) keys produce empty dicts.
+        """
+        ans = dict((key, {}) for key in keys)
+        cursor = self._conn().cursor()
+        for chunk in in_list_chunks(tuple(ans.keys())):
+            cursor.execute(
+                'SELECT h.key, h.field, h.value FROM hash_data AS h LEFT JOIN key_expires AS e ON e.key = h.key '
+                'WHERE h.key IN ({0}) AND (e.expires IS NULL OR e.expires >= ?)'.format(', '.join(['?'] * len(chunk))),
+                chunk + (time.time(),))
+            for key, field, value in cursor.fetchall():
+                ans[key][field] = json.loads(value)
+        return [ans[key] for key in keys]
+
+    def get_multi(self, keys):
+        """
+        Load values stored under the passed keys (a list in the order
+        of the keys) using a single query (per MAX_IN_PARAMS keys). Missing (or expired) keys
+        produce None. Unlike get(), hashes and lists are not returned.
+        """
+        ans = dict((key, None) for key in keys)
+        cursor = self._conn().cursor()
+        for chunk in in_list_chunks(tuple(ans.keys())):
+            cursor.execute(
+                'SELECT d.key, d.value FROM data AS d LEFT JOIN key_expires AS e ON e.key = d.key '
+                'WHERE d.key IN ({0}) AND (e.expires IS NULL OR e.expires >= ?)'.format(', '.join(['?'] * len(chunk))),
+                chunk + (time.time(),))
+            for key, value in cursor.fetchall():
+                ans[key] = json.loads(value)
+        return [ans[key] for key in keys]
 
     def get(self, key, default=None):
         """
@@ -183,14 +416,26 @@ class DefaultDb(KeyValueStorage):
         returns:
         a dictionary containing respective data
         """
-        raw_data = self._load_raw_data(key)
-        if raw_data is not None:
-            data = json.loads(raw_data[0])
-            if type(data) is dict:
-                data['__timestamp__'] = raw_data[1]
-                data['__key__'] = key
-            return data
-        return default
+        cursor = self._read_cursor(key)
+        if cursor is None:
+            return default
+        cursor.execute('SELECT value FROM data WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        if row is not None:
+            data = json.loads(row[0])
+        else:
+            # to stay compatible with previous versions, hashes and lists are accessible too
+            data = self.hash_get_all(key)
+            if len(data) == 0:
+                data = self.list_get(key)
+                if len(data) == 0:
+                    return default
+        if type(data) is dict:
+            cursor.execute('SELECT expires FROM key_expires WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            data['__timestamp__'] = row[0] if row else -1
+            data['__key__'] = key
+        return data
 
     def set(self, key, data):
         """
@@ -205,7 +450,9 @@ class DefaultDb(KeyValueStorage):
                       for k, v in list(data.items()) if not k.startswith('__') and not k.endswith('__'))
         else:
             d2 = data
-        self._save_raw_data(key, json.dumps(d2))
+        with self._transaction() as cursor:
+            self._delete_key(cursor, key)
+            cursor.execute('INSERT INTO data (key, value, expires) VALUES (?, ?, -1)', (key, json.dumps(d2)))
 
     def remove(self, key):
         """
@@ -214,10 +461,16 @@ class DefaultDb(KeyValueStorage):
         arguments:
         key -- an access key
         """
-        conn = self._conn()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM data WHERE key = ?', (key,))
-        conn.commit()
+        with self._transaction() as cursor:
+            self._delete_key(cursor, key)
+
+    @staticmethod
+    def _exists(cursor, key):
+        for table in ('data', 'hash_data', 'list_data'):
+            cursor.execute(f'SELECT 1 FROM {table} WHERE key = ? LIMIT 1', (key,))
+            if cursor.fetchone() is not None:
+                return True
+        return False
 
     def exists(self, key):
         """
@@ -229,10 +482,8 @@ class DefaultDb(KeyValueStorage):
         returns:
         boolean answer
         """
-        self._delete_expired(key)
-        cursor = self._conn().cursor()
-        cursor.execute('SELECT COUNT(*) FROM data WHERE key = ?', (key,))
-        return cursor.fetchone()[0] > 0
+        cursor = self._read_cursor(key)
+        return cursor is not None and self._exists(cursor, key)
 
     def set_ttl(self, key, ttl):
         """
@@ -243,46 +494,148 @@ class DefaultDb(KeyValueStorage):
         ttl -- number of seconds to wait before the value is removed
         (please note that set/update actions reset the timer to zero)
         """
-        self._delete_expired(key)
-        if self.exists(key):
-            cursor = self._conn().cursor()
-            cursor.execute('UPDATE data SET expires = ? WHERE key = ?', (time.time() + ttl, key))
-            self._conn().commit()
-        return None
+        with self._transaction() as cursor:
+            if self._exists(self._write_cursor(cursor, key), key):
+                cursor.execute('INSERT OR REPLACE INTO key_expires (key, expires) VALUES (?, ?)',
+                               (key, time.time() + ttl))
 
     def get_ttl(self, key):
-        cursor = self._conn().cursor()
-        cursor.execute('SELECT expires FROM data WHERE key = ?', (key,))
-        return cursor.fetchone()[0]
+        """
+        Returns a remaining time to live in seconds (-1 if there is no TTL set,
+        -2 if there is no such key).
+        """
+        cursor = self._read_cursor(key)
+        if cursor is None or not self._exists(cursor, key):
+            return -2
+        cursor.execute('SELECT expires FROM key_expires WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return int(math.ceil(row[0] - time.time())) if row else -1
 
     def clear_ttl(self, key):
-        self._delete_expired(key)
-        if self.exists(key):
-            cursor = self._conn().cursor()
-            cursor.execute('UPDATE data SET expires = -1 WHERE key = ?', (key,))
-            self._conn().commit()
-        return None
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.execute('DELETE FROM key_expires WHERE key = ?', (key,))
 
     def incr(self, key, amount=1):
         """
         Increments the value of 'key' by 'amount'.  If no key exists,
         the value will be initialized as 'amount'
         """
-        val = self.get(key)
-        if val is None:
-            val = 0
-        val += amount
-        self.set(key, val)
-        return val
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.execute('SELECT value FROM data WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            val = (json.loads(row[0]) if row else 0) + amount
+            cursor.execute('INSERT OR REPLACE INTO data (key, value, expires) VALUES (?, ?, -1)',
+                           (key, json.dumps(val)))
+            return val
 
     def hash_set_map(self, key, mapping):
         """
         Set key to value within hash 'name' for each corresponding
         key and value from the 'mapping' dict.
         """
-        self.set(key, mapping)
+        with self._transaction() as cursor:
+            self._write_cursor(cursor, key)
+            cursor.executemany('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                               [(key, k, json.dumps(v)) for k, v in mapping.items()])
         return True
 
+    def hash_set_map_nx(self, key, mapping):
+        """
+        An atomic operation which sets all the fields from
+        the 'mapping' dict only if there is no hash under the 'key' yet.
+
+        returns:
+        True if the hash has been created else False
+        """
+        with self._transaction() as cursor:
+            if self._exists(self._write_cursor(cursor, key), key):
+                return False
+            cursor.executemany('INSERT INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                               [(key, k, json.dumps(v)) for k, v in mapping.items()])
+            return True
+
+    def hash_update_map(self, key, mapping):
+        """
+        An atomic operation which sets all the fields from the 'mapping'
+        dict only if there already is a hash under the 'key'.
+
+        returns:
+        True if the hash has been updated else False
+        """
+        with self._transaction() as cursor:
+            if self._is_expired(cursor, key):
+                return False
+            cursor.execute('SELECT 1 FROM hash_data WHERE key = ? LIMIT 1', (key,))
+            if cursor.fetchone() is None:
+                return False
+            cursor.executemany('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                               [(key, k, json.dumps(v)) for k, v in mapping.items()])
+            return True
+
+    def hash_set_max(self, key, field, value):
+        """
+        An atomic operation which sets a numeric field of an existing hash
+        only if the new value is bigger than the stored one.
+
+        returns:
+        True if the value has been changed else False
+        """
+        with self._transaction() as cursor:
+            if self._is_expired(cursor, key):
+                return False
+            cursor.execute('SELECT 1 FROM hash_data WHERE key = ? LIMIT 1', (key,))
+            if cursor.fetchone() is None:
+                return False
+            cursor.execute('SELECT value FROM hash_data WHERE key = ? AND field = ?', (key, field))
+            row = cursor.fetchone()
+            if row is not None and json.loads(row[0]) is not None and json.loads(row[0]) >= value:
+                return False
+            cursor.execute('INSERT OR REPLACE INTO hash_data (key, field, value) VALUES (?, ?, ?)',
+                           (key, field, json.dumps(value)))
+            return True
+
+    def _notify_dir(self):
+        return self.conf.get('default:notify_dir', os.path.join(tempfile.gettempdir(), 'kontext_sqlite3_db'))
+
+    @staticmethod
+    def _channel_id(channel):
+        return hashlib.md5(channel.encode('utf-8')).hexdigest()
+
+    def publish(self, channel, message):
+        """
+        Send a JSON-serializable message to all the subscribers
+        of the channel (within the current machine).
+        """
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        for path in glob.glob(os.path.join(self._notify_dir(), '{0}.*.fifo'.format(self._channel_id(channel)))):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as ex:
+                if ex.errno in (errno.ENXIO, errno.ENOENT):  # abandoned pipe (no reader)
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                os.write(fd, data)
+            except BlockingIOError:
+                pass  # the subscriber has unread messages so it will wake up anyway
+            finally:
+                os.close(fd)
+
+    def subscribe(self, channel):
+        """
+        Subscribe to a channel. Please do not forget to close
+        the returned subscription once it is not needed.
+
+        returns:
+        a FifoSubscription instance
+        """
+        return FifoSubscription(self._notify_dir(), self._channel_id(channel))
+
 
 def create_instance(conf):
     """
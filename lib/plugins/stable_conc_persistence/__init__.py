@@ -39,6 +39,7 @@ import logging
 from plugins import inject
 import plugins
 from plugins.abstract.conc_persistence import AbstractConcPersistence
+from plugins.common.sqlite import in_list_chunks
 from controller.errors import ForbiddenException, NotFoundException
 
 
@@ -85,6 +86,10 @@ class StableConcPersistence(AbstractConcPersistence):
         1st operation.
         """
         data = self._load_query(query_id, save_access=False)
+        if data is not None and 'corpname' not in data and data.get('ancestors'):
+            ancestors = self._load_queries(data['ancestors'], save_access=False)
+            data = next((ancestors[x] for x in data['ancestors']
+                         if ancestors[x] is not None and 'corpname' in ancestors[x]), data)
         while data is not None and 'corpname' not in data:
             data = self._load_query(data.get('prev_id', ''), save_access=False)
         return data.get('corpora', []) if data is not None else []
@@ -95,6 +100,25 @@ class StableConcPersistence(AbstractConcPersistence):
             ans['corpora'] = self.find_used_corpora(ans.get('prev_id'))
         return ans
 
+    def open_many(self, data_ids):
+        ans = self._load_queries(data_ids, save_access=True)
+        for data in ans.values():
+            if data is not None and 'corpora' not in data:
+                data['corpora'] = self._find_used_corpora_in(ans, data)
+        return ans
+
+    def _find_used_corpora_in(self, loaded, data):
+        """
+        Like find_used_corpora() but already loaded operations
+        (a dict data_id => data) are searched first.
+        """
+        prev_id = data.get('prev_id')
+        while loaded.get(prev_id) is not None:
+            if 'corpname' in loaded[prev_id]:
+                return loaded[prev_id].get('corpora', [])
+            prev_id = loaded[prev_id].get('prev_id')
+        return self.find_used_corpora(prev_id)
+
     def _load_query(self, data_id: str, save_access: bool):
         """
         Loads operation data according to the passed data_id argument.
@@ -121,6 +145,36 @@ class StableConcPersistence(AbstractConcPersistence):
                     break
         return data
 
+    def _load_queries(self, data_ids, save_access: bool):
+        """
+        A batch variant of _load_query(). The primary db is read in a single
+        round-trip (see KeyValueStorage.get_multi()) and each archive is
+        searched (for the remaining items) by a single query (per MAX_IN_PARAMS items).
+
+        returns:
+        a dictionary data_id => operation data (or None if nothing is found)
+        """
+        ans = dict(zip(data_ids, self.db.get_multi([mk_key(data_id) for data_id in data_ids])))
+        missing = [data_id for data_id, data in ans.items() if data is None]
+        for arch_db in self._archives:
+            if len(missing) == 0:
+                break
+            cursor = arch_db.cursor()
+            rows = []
+            for chunk in in_list_chunks(missing):
+                rows += cursor.execute(
+                    'SELECT id, data FROM archive WHERE id IN ({0})'.format(', '.join(['?'] * len(chunk))),
+                    chunk).fetchall()
+            for data_id, data in rows:
+                ans[data_id] = json.loads(data)
+            if save_access and len(rows) > 0:
+                curr_time = int(round(time.time()))
+                cursor.executemany('UPDATE archive SET last_access = ?, num_access = num_access + 1 WHERE id = ?',
+                                   [(curr_time, row[0]) for row in rows])
+                arch_db.commit()
+            missing = [data_id for data_id in missing if ans[data_id] is None]
+        return ans
+
     def find_key_db(self, data_id):
         for arch_db in self._archives:
             cursor = arch_db.cursor()
@@ -136,9 +190,13 @@ class StableConcPersistence(AbstractConcPersistence):
                     r1.get('lines_groups') != r2.get('lines_groups'))
 
         if prev_data is None or records_differ(curr_data, prev_data):
+            curr_data.pop('ancestors', None)
             if prev_data is not None:
                 curr_data['prev_id'] = prev_data[ID_KEY]
+            # the ID must not depend on the ancestors list (it is derived from prev_id anyway)
             data_id = generate_stable_id(curr_data)
+            if prev_data is not None:
+                curr_data['ancestors'] = self.mk_ancestors(prev_data)
             curr_data[ID_KEY] = data_id
             data_key = mk_key(data_id)
             self.db.set(data_key, curr_data)
@@ -0,0 +1,172 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A persisted catalogue of subcorpus metadata. The catalogue covers
+a directory with the standard subcorpora layout:
+
+[root_dir]/[corpname]/[subcname].subc
+
+(i.e. a user subcorpora directory or the directory of published subcorpora)
+and it is stored as an SQLite database within the directory ([root_dir]/.subc_catalogue.sqlite).
+
+Each entry is validated by a signature of the respective subcorpus
+file (see subc_signature()) so the catalogue can be reconciled with
+the filesystem using just 'stat' calls. Only new or changed subcorpora
+are passed to a (possibly expensive) loader function.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CATALOGUE_FILE = '.subc_catalogue.sqlite'
+
+# loader(corpname, spath) returns metadata of a subcorpus file
+EntryLoader = Callable[[str, str], Dict[str, Any]]
+
+
+def subc_signature(spath: str) -> Tuple:
+    """
+    Return a value changing each time a subcorpus file, its publication status
+    or its description (the '.name' file) changes.
+    """
+    st = os.lstat(spath)  # st_nlink and st_ctime change when the subcorpus is (un)published
+    try:
+        name_mtime = os.path.getmtime(os.path.splitext(spath)[0] + '.name')
+    except OSError:
+        name_mtime = None
+    return st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_nlink, name_mtime
+
+
+class SubcCatalogue(object):
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS subcorpora (path text PRIMARY KEY, corpname text, subcname text, '
+        'signature text, data text)',
+        'CREATE INDEX IF NOT EXISTS subcorpora_corpname_idx ON subcorpora (corpname)'
+    )
+
+    def __init__(self, root_dir: str, loader: EntryLoader) -> None:
+        """
+        arguments:
+        root_dir -- a directory containing [corpname]/[subcname].subc files
+        loader -- a function returning metadata of a new or changed subcorpus file
+        """
+        self._root_dir = root_dir
+        self._loader = loader
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self._root_dir, CATALOGUE_FILE)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self._root_dir, exist_ok=True)
+        is_new = not os.path.exists(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        for sql in self.SCHEMA:
+            conn.execute(sql)
+        conn.commit()
+        if is_new:
+            try:  # the catalogue is written by both web app and calc. workers
+                os.chmod(self.db_path, 0o664)
+            except OSError:
+                pass
+        return conn
+
+    @staticmethod
+    def _mk_entry(corpname: str, spath: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(data, corpname=corpname, subcname=os.path.splitext(os.path.basename(spath))[0], path=spath)
+
+    def _load(self, conn: sqlite3.Connection, corpname: str, spath: str,
+              signature: Tuple) -> Optional[Dict[str, Any]]:
+        try:
+            data = self._loader(corpname, spath)
+        except Exception as ex:
+            logging.getLogger(__name__).warning(f'Failed to fetch information about subcorpus {spath}: {ex}')
+            return None
+        conn.execute('INSERT OR REPLACE INTO subcorpora (path, corpname, subcname, signature, data) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (spath, corpname, os.path.splitext(os.path.basename(spath))[0], json.dumps(signature),
+                      json.dumps(data)))
+        return self._mk_entry(corpname, spath, data)
+
+    def refresh(self, spath: str) -> Optional[Dict[str, Any]]:
+        """
+        (Re)load a catalogue entry of a subcorpus file. This is expected to be called
+        each time a subcorpus is created or published. In case the file does not
+        exist, its entry is removed.
+
+        returns:
+        an updated entry or None if the file does not exist or cannot be loaded
+        """
+        corpname = os.path.basename(os.path.dirname(spath))
+        with closing(self._connect()) as conn:
+            try:
+                signature = subc_signature(spath)
+            except OSError:
+                conn.execute('DELETE FROM subcorpora WHERE path = ?', (spath,))
+                ans = None
+            else:
+                ans = self._load(conn, corpname, spath, signature)
+            conn.commit()
+        return ans
+
+    def remove(self, spath: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM subcorpora WHERE path = ?', (spath,))
+            conn.commit()
+
+    def list_subcorpora(self, corpnames: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        List subcorpora of specified corpora. The catalogue is reconciled
+        with the filesystem - entries of removed files are deleted
+        and new/changed files are (re)loaded.
+
+        returns:
+        a list of entries (dicts with loaded metadata along with 'corpname', 'subcname'
+        and 'path' keys) sorted by corpus and subcorpus name
+        """
+        ans = []
+        with closing(self._connect()) as conn:
+            for corpname in corpnames:
+                stored = dict((row[0], (row[1], row[2])) for row in conn.execute(
+                    'SELECT path, signature, data FROM subcorpora WHERE corpname = ?', (corpname,)))
+                try:
+                    files = sorted(item.path for item in os.scandir(os.path.join(self._root_dir, corpname))
+                                   if item.name.endswith('.subc'))
+                except (FileNotFoundError, NotADirectoryError):
+                    files = []
+                for spath in files:
+                    try:
+                        signature = subc_signature(spath)
+                    except OSError:  # removed in the meantime
+                        continue
+                    stored_sig, stored_data = stored.pop(spath, (None, None))
+                    if stored_sig is not None and tuple(json.loads(stored_sig)) == signature:
+                        ans.append(self._mk_entry(corpname, spath, json.loads(stored_data)))
+                    else:
+                        entry = self._load(conn, corpname, spath, signature)
+                        if entry is not None:
+                            ans.append(entry)
+                for spath in stored:
+                    conn.execute('DELETE FROM subcorpora WHERE path = ?', (spath,))
+            conn.commit()
+        return ans
@@ -19,6 +19,7 @@
 
 from functools import partial
 import collections
+import corplib
 from .cache import TextTypesCache
 
 
@@ -68,6 +69,9 @@ class StructNormsCalc(object):
             return 0
 
     def compute_norm(self, attrname, value):
+        if self._subcnorm in ('freq', 'tokens'):
+            norms = corplib.get_struct_attr_norms(self._corp, self._structname, attrname)
+            return norms.structs(value) if self._subcnorm == 'freq' else norms.tokens(value)
         attr = self._struct.get_attr(attrname)
         valid = attr.str2id(value)
         r = self._corp.filter_query(self._struct.attr_val(attrname, valid))
@@ -95,12 +99,17 @@ class CachedStructNormsCalc(StructNormsCalc):
         super().__init__(corpus, structname, subcnorm)
         self._tt_cache = tt_cache
         mkdict = partial(collections.defaultdict, lambda: {})
+        if subcnorm in ('freq', 'tokens'):
+            self._data = mkdict()
+            return
         try:
             self._data = mkdict(self._tt_cache.get_attr_values(corpus.corpname, structname, subcnorm))
         except (IOError, TypeError):
             self._data = mkdict()
 
     def compute_norm(self, attrname, value):
+        if self._subcnorm in ('freq', 'tokens'):  # these are already stored in a corpus-wide index
+            return super(CachedStructNormsCalc, self).compute_norm(attrname, value)
         if attrname not in self._data or value not in self._data[attrname]:
             self._data[attrname][value] = super(
                 CachedStructNormsCalc, self).compute_norm(attrname, value)
@@ -39,6 +39,7 @@ CONF_PATH = os.getenv('KONTEXT_CONF', os.path.realpath('%s/../conf/config.xml' %
 
 import plugins
 import plugins.export
+import byteranges
 import settings
 import translation
 from controller import KonTextCookie
@@ -201,11 +202,13 @@ class KonTextWsgiApp(WsgiApp):
         translation.load_translations(settings.get('global', 'translations'))
 
         def signal_handler(signal, frame):
+            import corplib
             for p in plugins.runtime:
                 fn = getattr(p.instance, 'on_soft_reset', None)
                 if callable(fn):
                     fn()
             self._tt_cache.clear_all()
+            corplib.clear_corpus_handle_cache()
 
         signal.signal(signal.SIGUSR1, signal_handler)
         self._tt_cache = TextTypesCache(plugins.runtime.DB.instance)
@@ -242,7 +245,8 @@ class KonTextWsgiApp(WsgiApp):
         else:
             app = self.create_controller(environ['PATH_INFO'], request=request, ui_lang=ui_lang)
             status, headers, sid_is_valid, body = app.run()
-        response = Response(response=body, status=status, headers=headers)
+        response = Response(response=body, status=status, headers=headers,
+                            direct_passthrough=byteranges.is_file_wrapper(environ, body))
         if not sid_is_valid:
             curr_data = dict(request.session)
             request.session = sessions.new()
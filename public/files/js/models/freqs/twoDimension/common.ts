@@ -124,6 +124,14 @@ export type CTFreqResultItem = [string, string, number, number];
 export interface CTFreqResultData {
     data: Array<CTFreqResultItem>;
     full_size:number;
+
+    /**
+     * Number of all the cells matching the server-side filter
+     * (server may return just a window of them - see max_items)
+     */
+    total?:number;
+
+    max_items?:number;
 }
 
 export interface CTFreqResultResponse extends AjaxConcResponse {
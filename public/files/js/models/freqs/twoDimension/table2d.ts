@@ -164,6 +164,13 @@ export interface Freq2DTableModelState extends GeneralFreq2DModelState {
      */
     serverMinFreq:number;
 
+    /**
+     * True if server returned just a window (the most frequent cells)
+     * of the table. In such case any filter change must be resolved
+     * by server.
+     */
+    serverDataTruncated:boolean;
+
     isWaiting:boolean;
 
     onNewDataHandlers:Array<(data:CTFreqResultData)=>void>;
@@ -211,6 +218,7 @@ export class Freq2DTableModel extends GeneralFreq2DModel<Freq2DTableModelState>
                 sortDim1: 'attr',
                 sortDim2: 'attr',
                 serverMinFreq: parseInt(props.ctminfreq, 10),
+                serverDataTruncated: false,
                 isWaiting: false,
                 displayQuantity: FreqQuantities.ABS,
                 onNewDataHandlers: [], // TODO ??
@@ -362,7 +370,8 @@ export class Freq2DTableModel extends GeneralFreq2DModel<Freq2DTableModelState>
 
     private waitAndReload(resetServerMinFreq:boolean):void {
 
-        const mustLoadDueToLimit = () => parseInt(this.state.minFreq, 10) < this.state.serverMinFreq || this.state.serverMinFreq === null;
+        const mustLoadDueToLimit = () => parseInt(this.state.minFreq, 10) < this.state.serverMinFreq ||
+                this.state.serverMinFreq === null || this.state.serverDataTruncated;
 
         if (this.throttleTimeout) {
             window.clearTimeout(this.throttleTimeout);
@@ -648,6 +657,7 @@ export class Freq2DTableModel extends GeneralFreq2DModel<Freq2DTableModelState>
         const tableData:Data2DTable = {};
 
         state.fullSize = data.full_size;
+        state.serverDataTruncated = data.total !== undefined && data.total > data.data.length;
         let origOrder = 0;
         let prevAbs = 0;
         data.data.forEach(([label1, label2, absFreq, total]) => {
@@ -0,0 +1,94 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import tempfile
+import unittest
+
+import werkzeug.wsgi
+from werkzeug.wrappers import Response
+
+import byteranges
+
+
+class ParseByteRangesTest(unittest.TestCase):
+
+    def test_missing_or_malformed(self):
+        self.assertIsNone(byteranges.parse_byte_ranges(None, 100))
+        self.assertIsNone(byteranges.parse_byte_ranges('items=0-10', 100))
+        self.assertIsNone(byteranges.parse_byte_ranges('bytes=abc', 100))
+        self.assertIsNone(byteranges.parse_byte_ranges('bytes=10-5', 100))
+        self.assertIsNone(byteranges.parse_byte_ranges('bytes=-', 100))
+
+    def test_simple_ranges(self):
+        self.assertEqual([(0, 10)], byteranges.parse_byte_ranges('bytes=0-9', 100))
+        self.assertEqual([(90, 100)], byteranges.parse_byte_ranges('bytes=90-', 100))
+        self.assertEqual([(80, 100)], byteranges.parse_byte_ranges('bytes=-20', 100))
+        self.assertEqual([(50, 100)], byteranges.parse_byte_ranges('bytes=50-1000', 100))
+
+    def test_multiple_ranges(self):
+        self.assertEqual([(0, 2), (10, 100)], byteranges.parse_byte_ranges('bytes=0-1, 10-', 100))
+        self.assertEqual([(0, 2)], byteranges.parse_byte_ranges('bytes=0-1,200-300', 100))
+
+    def test_not_satisfiable(self):
+        with self.assertRaises(byteranges.RangeNotSatisfiable):
+            byteranges.parse_byte_ranges('bytes=100-', 100)
+
+
+class FileRangeTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as fw:
+            fw.write(bytes(range(256)))
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_iter_file_range(self):
+        data = b''.join(byteranges.iter_file_range(self.path, 10, 200, chunk_size=7))
+        self.assertEqual(bytes(range(10, 200)), data)
+
+    def test_multipart_size(self):
+        ranges = [(0, 5), (100, 256)]
+        body = b''.join(byteranges.iter_multipart_byteranges(self.path, ranges, 256, 'audio/mpeg', 'xyz'))
+        self.assertEqual(len(body), byteranges.multipart_byteranges_size(ranges, 256, 'audio/mpeg', 'xyz'))
+        self.assertIn(b'Content-Range: bytes 100-255/256', body)
+        self.assertTrue(body.endswith(b'--xyz--\r\n'))
+
+    def test_file_wrapper_reaches_server(self):
+        class ServerFileWrapper(object):
+            def __init__(self, filelike, block_size=8192):
+                self.filelike = filelike
+
+            def __iter__(self):
+                return iter(lambda: self.filelike.read(8192), b'')
+
+        environ = {'REQUEST_METHOD': 'GET', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                   'wsgi.url_scheme': 'http', 'wsgi.file_wrapper': ServerFileWrapper}
+        with open(self.path, 'rb') as fr:
+            body = werkzeug.wsgi.wrap_file(environ, fr)
+            self.assertTrue(byteranges.is_file_wrapper(environ, body))
+            self.assertFalse(byteranges.is_file_wrapper(environ, b'data'))
+            response = Response(response=body, direct_passthrough=byteranges.is_file_wrapper(environ, body))
+            app_iter = response(environ, lambda status, headers: None)
+            self.assertIs(body, app_iter)
+
+
+if __name__ == '__main__':
+    unittest.main()
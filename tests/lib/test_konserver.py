@@ -0,0 +1,161 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bgcalc.konserver import ConnectionPool, KonserverApp, Config, PoolTimeoutError, get_connection_pool
+
+
+class KonserverHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    close_after_response = False
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, data):
+        self.server.client_ports.add(self.client_address[1])
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.close_after_response:
+            self.close_connection = True
+
+    def do_GET(self):
+        self._respond(dict(taskID=self.path.rsplit('/', 1)[-1], status=2, result=[1, 2]))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.num_posts += 1
+        if self.server.drop_post_response:
+            self.close_connection = True
+            return
+        self._respond(dict(taskID='t1', status=0))
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KonserverHandler)
+        self.server.client_ports = set()
+        self.server.close_after_response = False
+        self.server.drop_post_response = False
+        self.server.num_posts = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse(self):
+        pool = ConnectionPool('127.0.0.1', self.port, timeout=5)
+        for _ in range(5):
+            status, data = pool.request('GET', '/result/a')
+            self.assertEqual(200, status)
+            self.assertEqual([1, 2], json.loads(data.decode('utf-8'))['result'])
+        self.assertEqual(1, len(self.server.client_ports))
+        self.assertEqual(1, pool.num_idle())
+        pool.close()
+
+    def test_closed_connection_is_replaced(self):
+        self.server.close_after_response = True
+        pool = ConnectionPool('127.0.0.1', self.port, timeout=5)
+        pool.request('GET', '/result/a')
+        # the health check cannot tell the connection is closed so the request must be retried
+        pool._is_healthy = lambda conn: True
+        status, _ = pool.request('GET', '/result/b')
+        self.assertEqual(200, status)
+        self.assertEqual(2, len(self.server.client_ports))
+        pool.close()
+
+    def test_sent_post_is_not_retried(self):
+        pool = ConnectionPool('127.0.0.1', self.port, timeout=5)
+        pool.request('GET', '/result/a')
+        # the server processes the request but the connection breaks before a response is sent
+        self.server.drop_post_response = True
+        with self.assertRaises(ConnectionError):
+            pool.request('POST', '/submit', body=b'{}', headers={'Content-Length': '2'})
+        self.assertEqual(1, self.server.num_posts)
+        pool.close()
+
+    def test_concurrent_requests(self):
+        pool = ConnectionPool('127.0.0.1', self.port, timeout=5, max_size=2)
+        results = []
+
+        def run():
+            for _ in range(10):
+                results.append(pool.request('GET', '/result/a')[0])
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([200] * 40, results)
+        self.assertLessEqual(len(self.server.client_ports), 2)
+        pool.close()
+
+    def test_long_polls_do_not_block_requests(self):
+        pool = ConnectionPool('127.0.0.1', self.port, timeout=0.5, max_size=1)
+        pool._long_poll_slots.acquire()  # a pending long polling request
+        self.assertEqual(200, pool.request('GET', '/result/a')[0])
+        with self.assertRaises(PoolTimeoutError):
+            pool.request('GET', '/result/a', extra_timeout=10)
+        pool.close()
+
+    def test_pool_timeout_is_reported(self):
+        conf = Config()
+        conf.SERVER = '127.0.0.1'
+        conf.PORT = self.port
+        conf.PATH = '/kontext'
+        conf.HTTP_CONNECTION_TIMEOUT = 0.5
+        conf.RESULT_WAIT_MAX_TIME = 5
+        conf.HTTP_POOL_SIZE = 1
+        app = KonserverApp(conf=conf)
+        pool = get_connection_pool(conf)
+        pool._slots.acquire()
+        try:
+            self.assertRaises(PoolTimeoutError, lambda: app.send_task('calculate_freqs', args=dict(x=1)))
+            self.assertRaises(PoolTimeoutError, lambda: app.AsyncResult('t1'))
+        finally:
+            pool._slots.release()
+            pool.close()
+
+    def test_client_api(self):
+        conf = Config()
+        conf.SERVER = '127.0.0.1'
+        conf.PORT = self.port
+        conf.PATH = '/kontext'
+        conf.HTTP_CONNECTION_TIMEOUT = 5
+        conf.RESULT_WAIT_MAX_TIME = 5
+        app = KonserverApp(conf=conf)
+        res = app.send_task('calculate_freqs', args=dict(x=1))
+        self.assertEqual('t1', res.id)
+        self.assertEqual([1, 2], res.get())
+        self.assertEqual(1, len(self.server.client_ports))
+
+
+if __name__ == '__main__':
+    unittest.main()
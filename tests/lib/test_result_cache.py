@@ -0,0 +1,106 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bgcalc.result_cache import ResultCache, ResultCacheLockError, mk_cache_key, RES_TYPE_FREQ, RES_TYPE_COLL
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_get_put_and_stats(self):
+        cache = ResultCache(self.root_dir)
+        key = mk_cache_key('susanne', None, 'aword,[]', 'word 0')
+        self.assertIsNone(cache.get(RES_TYPE_FREQ, key))
+        cache.put(RES_TYPE_FREQ, key, dict(freqs=[1, 2, 3]))
+        self.assertEqual(dict(freqs=[1, 2, 3]), cache.get(RES_TYPE_FREQ, key))
+        self.assertIsNone(cache.get(RES_TYPE_COLL, key))
+        stats = cache.stats()
+        self.assertEqual(1, stats[RES_TYPE_FREQ]['hits'])
+        self.assertEqual(1, stats[RES_TYPE_FREQ]['misses'])
+        self.assertEqual(1, stats[RES_TYPE_FREQ]['num_items'])
+        self.assertEqual(1, stats[RES_TYPE_COLL]['misses'])
+        cache.remove(RES_TYPE_FREQ, key)
+        self.assertIsNone(cache.get(RES_TYPE_FREQ, key))
+        self.assertEqual(0, cache.total_size())
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.root_dir, max_size=3000)
+        data = 'x' * 900
+        for i in range(3):
+            cache.put(RES_TYPE_FREQ, mk_cache_key(i), data)
+        cache.get(RES_TYPE_FREQ, mk_cache_key(0))  # item 1 is now the least recently used one
+        cache.put(RES_TYPE_COLL, mk_cache_key(3), data)
+        self.assertIsNotNone(cache.get(RES_TYPE_FREQ, mk_cache_key(0)))
+        self.assertIsNone(cache.get(RES_TYPE_FREQ, mk_cache_key(1)))
+        self.assertLessEqual(cache.total_size(), 3000)
+
+    def test_cleanup(self):
+        cache = ResultCache(self.root_dir)
+        cache.put(RES_TYPE_FREQ, mk_cache_key('a'), [1])
+        cache.put(RES_TYPE_COLL, mk_cache_key('b'), [2])
+        time.sleep(0.01)
+        ans = cache.cleanup(RES_TYPE_FREQ, 0)
+        self.assertEqual(1, ans['num_removed'])
+        self.assertIsNone(cache.get(RES_TYPE_FREQ, mk_cache_key('a')))
+        self.assertEqual([2], cache.get(RES_TYPE_COLL, mk_cache_key('b')))
+        self.assertFalse(os.path.exists(os.path.join(self.root_dir, RES_TYPE_FREQ, mk_cache_key('a')[:2],
+                                                     '{0}.pkl'.format(mk_cache_key('a')))))
+
+    def test_access_stats_batching(self):
+        cache = ResultCache(self.root_dir)
+        key = mk_cache_key('a')
+        cache.put(RES_TYPE_FREQ, key, 'data')
+        cache.get(RES_TYPE_FREQ, key)
+        cursor = cache._conn().cursor()
+        cursor.execute('SELECT hits FROM entries WHERE key = ?', (key,))
+        self.assertEqual(0, cursor.fetchone()[0])  # not written yet
+        self.assertEqual(1, cache.stats()[RES_TYPE_FREQ]['hits'])
+        cursor.execute('SELECT hits FROM entries WHERE key = ?', (key,))
+        self.assertEqual(1, cursor.fetchone()[0])
+
+    def test_lock(self):
+        cache1 = ResultCache(self.root_dir)
+        cache2 = ResultCache(self.root_dir)
+        with cache1.lock('foo'):
+            self.assertRaises(ResultCacheLockError, lambda: cache2.lock('foo', max_wait=0.1).__enter__())
+            with cache2.lock('bar', max_wait=0.1):
+                pass
+        with cache2.lock('foo', max_wait=0.1):
+            pass
+
+    def test_expired_lock(self):
+        cache = ResultCache(self.root_dir)
+        cache.lock('foo', ttl=0.1).__enter__()  # never released
+        time.sleep(0.2)
+        with cache.lock('foo', max_wait=0.1):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
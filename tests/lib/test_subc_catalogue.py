@@ -0,0 +1,81 @@
+# Copyright (c) 2021 Charles University, Faculty of Arts,
+#                    Institute of the Czech National Corpus
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from subc_catalogue import SubcCatalogue
+
+
+class SubcCatalogueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.loaded = []
+        os.makedirs(os.path.join(self.root_dir, 'susanne'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def _loader(self, corpname, spath):
+        self.loaded.append(spath)
+        return dict(size=os.path.getsize(spath))
+
+    def _mk_subc(self, name, data=b'x'):
+        path = os.path.join(self.root_dir, 'susanne', f'{name}.subc')
+        with open(path, 'wb') as fw:
+            fw.write(data)
+        return path
+
+    def test_list_loads_only_new_or_changed(self):
+        catalogue = SubcCatalogue(self.root_dir, self._loader)
+        p1 = self._mk_subc('a')
+        p2 = self._mk_subc('b', b'xyz')
+        ans = catalogue.list_subcorpora(['susanne', 'syn2010'])
+        self.assertEqual([('a', 1), ('b', 3)], [(x['subcname'], x['size']) for x in ans])
+        self.assertEqual([p1, p2], self.loaded)
+        self.loaded = []
+        catalogue.list_subcorpora(['susanne'])
+        self.assertEqual([], self.loaded)
+        self._mk_subc('b', b'xyzxyz')
+        ans = catalogue.list_subcorpora(['susanne'])
+        self.assertEqual([p2], self.loaded)
+        self.assertEqual(6, ans[1]['size'])
+
+    def test_refresh_and_reconcile_removed(self):
+        catalogue = SubcCatalogue(self.root_dir, self._loader)
+        path = self._mk_subc('a')
+        self.assertEqual(1, catalogue.refresh(path)['size'])
+        self.loaded = []
+        self.assertEqual(['a'], [x['subcname'] for x in catalogue.list_subcorpora(['susanne'])])
+        self.assertEqual([], self.loaded)
+        os.unlink(path)
+        self.assertIsNone(catalogue.refresh(path))
+        self.assertEqual([], catalogue.list_subcorpora(['susanne']))
+
+    def test_failed_loader(self):
+        def loader(corpname, spath):
+            raise RuntimeError('broken subcorpus')
+        self._mk_subc('a')
+        self.assertEqual([], SubcCatalogue(self.root_dir, loader).list_subcorpora(['susanne']))
+
+
+if __name__ == '__main__':
+    unittest.main()
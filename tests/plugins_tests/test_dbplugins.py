@@ -19,8 +19,8 @@ Where possible, the results of identical operations on the two plugins are check
 With list operations, the results are verified against a control list created alongside the database lists.
 Test parameters allow to turn on/off the verbose mode and the ttl methods testing.
 
-The sqlite3 plugin stores data in a single table called "data" with the following structure:
-CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)
+The sqlite3 plugin stores data in tables "data", "hash_data", "list_data" and "key_expires"
+(see DefaultDb.SCHEMA).
 """
 import sqlite3
 import time
@@ -40,8 +40,7 @@ REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = 6379
 REDIS_DB = 0
 SQLITE3_DB = ':memory:'
-DROP_DATA_TABLE_SQL = "DROP TABLE IF EXISTS data"
-CREATE_DATA_TABLE_SQL = "CREATE TABLE data (key text PRIMARY KEY, value text, expires integer)"
+DROP_TABLES_SQL = ["DROP TABLE IF EXISTS {0}".format(t) for t in ('data', 'hash_data', 'list_data', 'key_expires')]
 
 
 class DbTest(unittest.TestCase):
@@ -62,14 +61,13 @@ class DbTest(unittest.TestCase):
     def setUp(self):
         # delete data before each test
         self.rd.flushdb()
-        # drop and re-create the sqlite3 table called "data" with the correct structure
-
-        self.sd.execute(DROP_DATA_TABLE_SQL)
-        self.sd.execute(CREATE_DATA_TABLE_SQL)
+        # drop and re-create the sqlite3 tables with the correct structure
+        for sql in DROP_TABLES_SQL + list(DefaultDb.SCHEMA):
+            self.sd.execute(sql)
         self.sd.commit()
         s_db = getattr(self.s, '_conn')()  # we must force sqlite3 db to instantiate lazy _conn attr
-        s_db.execute(DROP_DATA_TABLE_SQL)
-        s_db.execute(CREATE_DATA_TABLE_SQL)
+        for sql in DROP_TABLES_SQL + list(DefaultDb.SCHEMA):
+            s_db.execute(sql)
         s_db.commit()
 
     def test_set_and_get(self):
@@ -508,6 +506,57 @@ class DbTest(unittest.TestCase):
         self.assertEqual(out_r, "100times")
         self.assertEqual(out_s, "100times")
 
+    def test_hash_set_map_nx(self):
+        """
+        Test the hash_set_map_nx method: only the first call should create the hash
+        """
+        for db in (self.r, self.s):
+            self.assertTrue(db.hash_set_map_nx('hash1', {'size': 0, 'finished': False}))
+            self.assertFalse(db.hash_set_map_nx('hash1', {'size': 10, 'finished': True}))
+            self.assertEqual(db.hash_get_all('hash1'), {'size': 0, 'finished': False})
+
+    def test_hash_update_map(self):
+        """
+        Test the hash_update_map method: an existing hash is updated, a missing one is not created
+        """
+        for db in (self.r, self.s):
+            self.assertFalse(db.hash_update_map('hash1', {'size': 10}))
+            self.assertFalse(db.exists('hash1'))
+            db.hash_set_map('hash1', {'size': 0, 'finished': False})
+            self.assertTrue(db.hash_update_map('hash1', {'finished': True}))
+            self.assertEqual(db.hash_get_all('hash1'), {'size': 0, 'finished': True})
+
+    def test_hash_set_max(self):
+        """
+        Test the hash_set_max method: only a bigger value replaces the stored one
+        """
+        for db in (self.r, self.s):
+            self.assertFalse(db.hash_set_max('hash1', 'size', 10))
+            db.hash_set_map('hash1', {'size': 5})
+            self.assertTrue(db.hash_set_max('hash1', 'size', 10))
+            self.assertFalse(db.hash_set_max('hash1', 'size', 7))
+            self.assertEqual(db.hash_get('hash1', 'size'), 10)
+
+    def test_hash_get_all_multi(self):
+        """
+        Test the hash_get_all_multi method: hashes are returned in the order of keys
+        """
+        for db in (self.r, self.s):
+            db.hash_set_map('hash1', {'size': 5, 'finished': True})
+            db.hash_set_map('hash3', {'size': 7})
+            self.assertEqual(db.hash_get_all_multi(['hash3', 'hash2', 'hash1']),
+                             [{'size': 7}, {}, {'size': 5, 'finished': True}])
+
+    def test_get_multi(self):
+        """
+        Test the get_multi method: values are returned in the order of keys
+        """
+        for db in (self.r, self.s):
+            db.set('foo', {'a': 1})
+            db.set('bar', [1, 2])
+            self.assertEqual(db.get_multi(['bar', 'baz', 'foo']), [[1, 2], None, {'a': 1}])
+            self.assertEqual(db.get_multi([]), [])
+
     def test_get_instance(self):
         """
         test the get_instance method (defined in the KeyValueStorage abstract class)
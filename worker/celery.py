@@ -31,7 +31,6 @@ complete and properly configured KonText package.
 
 import os
 import sys
-import pickle
 
 APP_PATH = os.path.realpath('%s/..' % os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, '%s/lib' % APP_PATH)
@@ -89,19 +88,7 @@ def conc_sync_calculate(self, user_id, corpus_name, subc_name, subchash, query,
 # ----------------------------- COLLOCATIONS ----------------------------------
 
 
-class CollsTask(app.Task):
-
-    cache_data = None
-    cache_path = None
-
-    def after_return(self, *args, **kw):
-        if self.cache_data:
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump(self.cache_data, f)
-                self.cache_data = None
-
-
-@app.task(base=CollsTask, name='calculate_colls')
+@app.task(name='calculate_colls')
 def calculate_colls(coll_args):
     return general.calculate_colls(coll_args)
 
@@ -114,19 +101,7 @@ def clean_colls_cache():
 # ----------------------------- FREQUENCY DISTRIBUTION ------------------------
 
 
-class FreqsTask(app.Task):
-
-    cache_data = None
-    cache_path = None
-
-    def after_return(self, *args, **kw):
-        if self.cache_data:
-            with open(self.cache_path, 'wb') as f:
-                pickle.dump(self.cache_data, f)
-                self.cache_data = None
-
-
-@app.task(base=FreqsTask, name='calculate_freqs')
+@app.task(name='calculate_freqs')
 def calculate_freqs(args):
     return general.calculate_freqs(args)
 
@@ -141,6 +116,14 @@ def clean_freqs_cache():
     return general.clean_freqs_cache()
 
 
+# ----------------------------- WORD LIST -------------------------------------
+
+
+@app.task(name='calculate_wordlist')
+def calculate_wordlist(args):
+    return general.calculate_wordlist(args)
+
+
 # ----------------------------- DATA PRECALCULATION ---------------------------
 
 
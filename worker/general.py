@@ -65,7 +65,15 @@ translation.activate('en_US')  # background jobs do not need localization
 
 import conclib.calc
 import conclib.calc.base
-from bgcalc import (freq_calc, subc_calc, coll_calc)
+import corplib
+import bgcalc
+from bgcalc import (freq_calc, subc_calc, coll_calc, wordlist_calc, result_cache)
+
+# a worker keeps recently used corpora (and their attributes/structures opened by Manatee) open
+# across tasks; the number of corpora and the total memory used by the worker can be limited
+corplib.configure_corpus_handle_cache(
+    max_size=settings.get_int('calc_backend', 'worker_corpus_pool_size', corplib.CORPUS_HANDLE_CACHE_SIZE),
+    max_rss=settings.get_int('calc_backend', 'worker_corpus_pool_max_rss', 0) * 1024 ** 2 or None)
 
 
 def load_script_module(name, path):
@@ -105,18 +113,14 @@ def is_compiled(corp, attr, method):
 
 def _load_corp(corp_id, subc_path):
     """
-    Instantiate a manatee.Corpus (or manatee.SubCorpus)
-    instance
+    Return a manatee.Corpus (or manatee.SubCorpus)
+    instance (reused from the worker's corpus pool if possible)
 
     arguments:
     corp_id -- a corpus identifier
     subc_path -- path to a subcorpus
     """
-    corp = manatee.Corpus(corp_id)
-    if subc_path:
-        corp = manatee.SubCorpus(corp, subc_path)
-    corp.corpname = corp_id
-    return corp
+    return corplib.open_corpus(corp_id, subc_path)
 
 
 def _compile_frq(corp, attr, logfile):
@@ -135,6 +139,7 @@ def _compile_frq(corp, attr, logfile):
         return {'message': 'freq already compiled'}
     with stderr_redirector(open(logfile, 'a')):
         corp.compile_frq(attr)
+    corplib.invalidate_corpus(corp.corpname)  # pooled handles must reopen freq files
     return {'message': 'OK', 'last_log_record': freq_calc.get_log_last_line(logfile)}
 
 
@@ -165,7 +170,8 @@ def conc_register(self, user_id, corpus_id, subc_name, subchash, query, samplesi
         app.send_task('conc_calculate',
                       args=(initial_args, user_id, corpus_id,
                             subc_name, subchash, query, samplesize),
-                      soft_time_limit=time_limit)
+                      soft_time_limit=time_limit,
+                      queue=bgcalc.corpus_task_queue(settings, corpus_id))
     return initial_args
 
 
@@ -209,13 +215,10 @@ def calculate_colls(coll_args):
     coll_args -- dict-serialized coll_calc.CollCalcArgs
     """
     coll_args = coll_calc.CollCalcArgs(**coll_args)
-    calculate_colls.cache_path = coll_args.cache_path
     ans = coll_calc.calculate_colls_bg(coll_args)
     trigger_cache_limit = settings.get_int('corpora', 'colls_cache_min_lines', 10)
-    if not ans['processing'] and len(ans['data']['Items']) >= trigger_cache_limit:
-        calculate_colls.cache_data = ans['data']
-    else:
-        calculate_colls.cache_data = None
+    if coll_args.cache_key and not ans['processing'] and len(ans['data']['Items']) >= trigger_cache_limit:
+        result_cache.get_result_cache().put(result_cache.RES_TYPE_COLL, coll_args.cache_key, ans['data'])
     return ans
 
 
@@ -227,26 +230,54 @@ def clean_colls_cache():
 
 
 def calculate_freqs(args):
+    """
+    arguments:
+    args -- dict-serialized freq_calc.FreqCalsArgs; all the criteria (fcrit) are calculated
+            using a single concordance instance and each whole distribution is cached individually
+            (using respective items of 'cache_keys')
+
+    returns:
+    a dict(freqs=..., conc_size=...) where 'freqs' contain just the requested window
+    (see 'item_offset', 'max_items') of each distribution
+    """
     args = freq_calc.FreqCalsArgs(**args)
-    calculate_freqs.cache_path = args.cache_path
     ans = freq_calc.calc_freqs_bg(args)
     trigger_cache_limit = settings.get_int('corpora', 'freqs_cache_min_lines', 10)
-    if args.force_cache or max(len(d.get('Items', ())) for d in ans['freqs']) >= trigger_cache_limit:
-        calculate_freqs.cache_data = ans
-    else:
-        calculate_freqs.cache_data = None
-    return ans
+    cache = result_cache.get_result_cache()
+    for cache_key, dist in zip(args.cache_keys or (), ans['freqs']):
+        if args.force_cache or (dist.total if dist is not None else 0) >= trigger_cache_limit:
+            cache.put(result_cache.RES_TYPE_FREQ, cache_key, dict(data=dist, conc_size=ans['conc_size']))
+    return dict(freqs=[freq_calc.freq_dist_page(dist, args.item_offset, args.max_items) for dist in ans['freqs']],
+                conc_size=ans['conc_size'])
 
 
 def calculate_freqs_ct(args):
+    """
+    arguments:
+    args -- dict-serialized freq_calc.CTFreqCalcArgs; the whole table is cached (using 'cache_key')
+    """
     args = freq_calc.CTFreqCalcArgs(**args)
-    return freq_calc.CTCalculation(args).run()
+    ans = freq_calc.CTCalculation(args).run()
+    if args.cache_key:
+        result_cache.get_result_cache().put(result_cache.RES_TYPE_CT, args.cache_key, ans)
+    return ans
 
 
 def clean_freqs_cache():
     return freq_calc.clean_freqs_cache()
 
 
+# ----------------------------- WORD LIST -------------------------------------
+
+
+def calculate_wordlist(args):
+    """
+    arguments:
+    args -- dict-serialized wordlist_calc.WordlistCalcArgs
+    """
+    return wordlist_calc.calc_wordlist_bg(wordlist_calc.WordlistCalcArgs(**args))
+
+
 # ----------------------------- DATA PRECALCULATION ---------------------------
 
 
@@ -276,6 +307,7 @@ def compile_arf(corp_id, subcorp_path, attr, logfile):
             num_wait -= 1
         if not os.path.isfile(frq_data_file):
             _compile_frq(corp, attr, logfile)
+        corplib.invalidate_corpus(corp_id)
         corp = _load_corp(corp_id, subcorp_path)  # must reopen freq files
     if is_compiled(corp, attr, 'arf'):
         with open(logfile, 'a') as f:
@@ -283,6 +315,7 @@ def compile_arf(corp_id, subcorp_path, attr, logfile):
         return {'message': 'arf already compiled'}
     with stderr_redirector(open(logfile, 'a')):
         corp.compile_arf(attr)
+    corplib.invalidate_corpus(corp_id)
     return {'message': 'OK', 'last_log_record': freq_calc.get_log_last_line(logfile)}
 
 
@@ -301,6 +334,7 @@ def compile_docf(corp_id, subcorp_path, attr, logfile):
         doc = corp.get_struct(doc_struct)
         with stderr_redirector(open(logfile, 'a')):
             corp.compile_docf(attr, doc.name)
+        corplib.invalidate_corpus(corp_id)
         return {'message': 'OK', 'last_log_record': freq_calc.get_log_last_line(logfile)}
     except manatee.AttrNotFound:
         raise WorkerTaskException('Failed to compile docf: attribute %s.%s not found in %s' % (
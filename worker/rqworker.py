@@ -20,7 +20,7 @@
 import os
 import sys
 import pickle
-from rq import Connection, Worker, get_current_job
+from rq import Connection, get_current_job
 import redis
 
 APP_PATH = os.path.realpath('%s/..' % os.path.dirname(os.path.abspath(__file__)))
@@ -35,6 +35,7 @@ if settings.get('global', 'manatee_path', None):
 
 import general
 import bgcalc
+from bgcalc.rq import NotifyingWorker
 import logging
 
 app = bgcalc.calc_backend_server(settings, 'rq')
@@ -87,6 +88,13 @@ def clean_freqs_cache():
     return general.clean_freqs_cache()
 
 
+# ----------------------------- WORD LIST -------------------------------------
+
+
+def calculate_wordlist(args):
+    return general.calculate_wordlist(args)
+
+
 # ----------------------------- DATA PRECALCULATION ---------------------------
 
 
@@ -139,5 +147,5 @@ if __name__ == "__main__":
         qs = sys.argv[1:] or ['default']
         app.init_scheduler()
 
-        w = Worker(qs)
+        w = NotifyingWorker(qs)
         w.work()